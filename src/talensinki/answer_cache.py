@@ -0,0 +1,115 @@
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+from talensinki.similarity import cosine_similarities
+from talensinki.storage import SqliteStore
+
+
+@dataclass
+class CachedAnswer:
+    question: str
+    answer: str
+    # Cosine similarity between the cached question and the new one
+    similarity: float
+
+
+class AnswerCache(SqliteStore):
+    """
+    On-disk cache of generated answers, looked up by the similarity of question embeddings.
+    Entries live in a `scope`: the settings and corpus version they were generated with.
+    A lookup only matches entries of the same scope, so changing any of those misses the cache.
+    Entries expire after `ttl_seconds`, and at most `max_entries` are kept, evicting the least recently used.
+    """
+
+    def __init__(self, filepath: Path, max_entries: int, ttl_seconds: float):
+        super().__init__(filepath)
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        with self._connection:
+            self._connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS answers (
+                    scope TEXT NOT NULL,
+                    question TEXT NOT NULL,
+                    question_embedding BLOB NOT NULL,
+                    answer TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )
+                """
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS answers_scope ON answers (scope)"
+            )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._count_rows("answers")
+
+    def lookup(
+        self,
+        scope: str,
+        question_embedding: list[float],
+        similarity_threshold: float,
+    ) -> CachedAnswer | None:
+        """Most similar cached question in `scope`, if its similarity reaches `similarity_threshold`."""
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "DELETE FROM answers WHERE created_at < ?", (now - self.ttl_seconds,)
+            )
+            rows = self._connection.execute(
+                "SELECT rowid, question, question_embedding, answer FROM answers WHERE scope = ?",
+                (scope,),
+            ).fetchall()
+            if not rows:
+                return None
+
+            cached_embeddings = np.stack(
+                [np.frombuffer(row[2], dtype=np.float32) for row in rows]
+            )
+            similarities = cosine_similarities(
+                cached_embeddings, np.asarray(question_embedding, dtype=np.float32)
+            )
+            best = int(np.argmax(similarities))
+            if similarities[best] < similarity_threshold:
+                return None
+
+            rowid, question, _, answer = rows[best]
+            self._connection.execute(
+                "UPDATE answers SET last_used = ? WHERE rowid = ?", (now, rowid)
+            )
+        return CachedAnswer(
+            question=question, answer=answer, similarity=float(similarities[best])
+        )
+
+    def store(
+        self,
+        scope: str,
+        question: str,
+        question_embedding: list[float],
+        answer: str,
+    ) -> None:
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT INTO answers (scope, question, question_embedding, answer, created_at, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    scope,
+                    question,
+                    np.asarray(question_embedding, dtype=np.float32).tobytes(),
+                    answer,
+                    now,
+                    now,
+                ),
+            )
+            excess = self._count_rows("answers") - self.max_entries
+            if excess > 0:
+                self._connection.execute(
+                    "DELETE FROM answers WHERE rowid IN (SELECT rowid FROM answers ORDER BY last_used LIMIT ?)",
+                    (excess,),
+                )
+        return None
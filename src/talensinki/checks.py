@@ -1,10 +1,18 @@
 import requests
 
 
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import Future, TimeoutError
 from dataclasses import dataclass
 from pathlib import Path
 
-from talensinki import config, database, templates
+from talensinki import config, templates
+
+# Seconds each check may take, and all checks together. A check that takes longer fails as timed out
+HEALTH_CHECK_TIMEOUT_SECONDS = 3.0
+HEALTH_CHECKS_TOTAL_TIMEOUT_SECONDS = 5.0
 
 
 @dataclass
@@ -12,16 +20,81 @@ class HealthCheckResult:
     passed: bool
     name: str
     details: str = ""
+    # Seconds the check took, or None if it did not finish before its deadline
+    latency_seconds: float | None = None
+
+    def format_latency(self) -> str:
+        if self.latency_seconds is None:
+            return "-"
+        return f"{self.latency_seconds * 1000:.0f} ms"
 
 
-def run_health_checks() -> list[HealthCheckResult]:
-    return [
-        check_pdf_folder_exists(),
-        check_config_file_exists(),
-        check_database_connection(),
-        check_ollama_connection(),
-        check_prompt_templates(),
+def run_health_checks(
+    timeout_seconds: float = HEALTH_CHECK_TIMEOUT_SECONDS,
+    total_timeout_seconds: float = HEALTH_CHECKS_TOTAL_TIMEOUT_SECONDS,
+) -> list[HealthCheckResult]:
+    """
+    Run all checks concurrently, and return their results in a fixed order.
+    Waits for each at most `timeout_seconds`, and for all of them at most `total_timeout_seconds`.
+    """
+    # Each check with the name it is displayed under, whether it finishes, raises or times out
+    health_checks: list[tuple[str, Callable[[], HealthCheckResult]]] = [
+        ("PDF folder exists", check_pdf_folder_exists),
+        ("Configuration file exists", check_config_file_exists),
+        ("Database connection", check_database_connection),
+        ("ollama is connected", check_ollama_connection),
+        ("templates are valid", check_prompt_templates),
     ]
+    start_time = time.perf_counter()
+    deadline = start_time + min(timeout_seconds, total_timeout_seconds)
+    futures = [
+        _run_in_background(name=name, health_check=health_check)
+        for name, health_check in health_checks
+    ]
+
+    results = []
+    for (name, _), future in zip(health_checks, futures):
+        try:
+            results.append(
+                future.result(timeout=max(0.0, deadline - time.perf_counter()))
+            )
+        except TimeoutError:
+            results.append(
+                HealthCheckResult(
+                    passed=False,
+                    name=name,
+                    details=f"timed out after {time.perf_counter() - start_time:.1f} s",
+                )
+            )
+    return results
+
+
+def _run_in_background(
+    name: str, health_check: Callable[[], HealthCheckResult]
+) -> Future[HealthCheckResult]:
+    """
+    Run a check in a daemon thread, timing it, and turning an exception into a failed result named `name`.
+    Daemon threads, unlike a ThreadPoolExecutor's, do not keep the process alive when a check hangs past its deadline.
+    """
+    future: Future[HealthCheckResult] = Future()
+
+    def run() -> None:
+        start_time = time.perf_counter()
+        try:
+            result = health_check()
+        except Exception as e:
+            result = HealthCheckResult(
+                passed=False,
+                name=name,
+                details=f"the check raised an exception: {e}",
+            )
+        result.name = name
+        result.latency_seconds = time.perf_counter() - start_time
+        future.set_result(result)
+        return None
+
+    threading.Thread(target=run, daemon=True).start()
+    return future
 
 
 # %% Checks
@@ -61,11 +134,13 @@ def check_config_file_exists() -> HealthCheckResult:
 
 
 def check_database_connection() -> HealthCheckResult:
-    """Check database connectivity."""
+    """Check database connectivity, with a heartbeat of the shared Chroma client."""
+    from talensinki import resources
+
     check_name = "Database connection"
 
     try:
-        database.init_and_get_vector_store(params=config.Params())
+        resources.get_chroma_client().heartbeat()
 
         return HealthCheckResult(passed=True, name=check_name)
     except Exception as e:
@@ -74,10 +149,13 @@ def check_database_connection() -> HealthCheckResult:
         )
 
 
-def check_ollama_connection(base_url="http://localhost:11434") -> HealthCheckResult:
+def check_ollama_connection(base_url=config.OLLAMA_LOCAL_URL) -> HealthCheckResult:
     check_name = "ollama is connected"
     try:
-        requests.get(f"{base_url}/api/version", timeout=5)
+        response = requests.get(
+            f"{base_url}/api/version", timeout=HEALTH_CHECK_TIMEOUT_SECONDS
+        )
+        response.raise_for_status()
     except Exception:
         return HealthCheckResult(
             passed=False,
@@ -112,7 +190,7 @@ def format_list_of_strings_into_bulletpoints(ls: list[str]) -> str:
     return "\n".join(["- " + s for s in ls])
 
 
-def check_prompt_templates():
+def check_prompt_templates() -> HealthCheckResult:
     """
     Checks that templates are valid and that they have the right variables for their type.
     """
@@ -0,0 +1,63 @@
+import re
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from talensinki.similarity import cosine_similarities
+
+# Sentence ends, and line breaks between the elements of a chunk (titles, list items, table rows...)
+_SENTENCE_BOUNDARY_PATTERN = re.compile(r"(?<=[.!?])\s+|\n+")
+
+
+def split_into_sentences(text: str) -> list[str]:
+    return [
+        sentence.strip()
+        for sentence in _SENTENCE_BOUNDARY_PATTERN.split(text)
+        if sentence.strip()
+    ]
+
+
+def compress_documents(
+    docs: list[Document],
+    query_embedding: list[float],
+    embeddings: Embeddings,
+    similarity_threshold: float,
+) -> list[Document]:
+    """
+    Keep only the sentences of `docs` whose embedding is at least `similarity_threshold` similar to the query, in order.
+    Docs left without any sentence are dropped. If that would drop every doc, `docs` are returned unchanged.
+    All sentences are embedded in one call. With a CachedEmbeddings, sentences seen before are not embedded again.
+    """
+    sentences_per_doc = [split_into_sentences(doc.page_content) for doc in docs]
+    all_sentences = [
+        sentence for sentences in sentences_per_doc for sentence in sentences
+    ]
+    if not all_sentences:
+        return docs
+
+    similarities = cosine_similarities(
+        np.asarray(embeddings.embed_documents(all_sentences), dtype=np.float32),
+        np.asarray(query_embedding, dtype=np.float32),
+    )
+
+    compressed_docs = []
+    start = 0
+    for doc, sentences in zip(docs, sentences_per_doc):
+        doc_similarities = similarities[start : start + len(sentences)]
+        start += len(sentences)
+        relevant_sentences = [
+            sentence
+            for sentence, similarity in zip(sentences, doc_similarities)
+            if similarity >= similarity_threshold
+        ]
+        if relevant_sentences:
+            compressed_docs.append(
+                Document(
+                    id=doc.id,
+                    page_content=" ".join(relevant_sentences),
+                    metadata=doc.metadata,
+                )
+            )
+
+    return compressed_docs if compressed_docs else docs
@@ -1,11 +1,15 @@
 from pathlib import Path
-from dataclasses import dataclass, fields, field
-import ollama
-from typing import Literal
+from dataclasses import asdict, dataclass, fields, field
+import json
+import threading
+import time
+from typing import TYPE_CHECKING, Literal, get_args
 
-from langchain.prompts import PromptTemplate
+from talensinki import storage, templates
 
-from talensinki import templates
+# ollama and langchain are imported when first needed, not on import, to keep CLI startup fast
+if TYPE_CHECKING:
+    from langchain.prompts import PromptTemplate
 
 
 # %% Get models from ollama
@@ -21,6 +25,8 @@ def get_available_ollama_models() -> list[OllamaModel]:
     """
     Get all available Ollama models
     """
+    import ollama
+
     ollama_models = []
     try:
         response = ollama.list()
@@ -51,11 +57,78 @@ def guess_model_type(model_name: str) -> Literal["embedding", "llm"]:
         return "llm"
 
 
-ollama_models = get_available_ollama_models()
-AVAILABLE_LLM_MODELS = [model.name for model in ollama_models if model.type == "llm"]
-AVAILABLE_EMBEDDING_MODELS = [
-    model.name for model in ollama_models if model.type == "embedding"
-]
+_ollama_models_lock = threading.Lock()
+_ollama_models_cache: tuple[float, list[OllamaModel]] | None = None
+
+
+def _load_ollama_models_from_disk() -> tuple[float, list[OllamaModel]] | None:
+    try:
+        cached = json.loads(OLLAMA_MODELS_CACHE_FILEPATH.read_text())
+        return cached["fetched_at"], [
+            OllamaModel(**model) for model in cached["models"]
+        ]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def _save_ollama_models_to_disk(fetched_at: float, models: list[OllamaModel]) -> None:
+    storage.write_text_atomically(
+        OLLAMA_MODELS_CACHE_FILEPATH,
+        json.dumps(
+            {"fetched_at": fetched_at, "models": [asdict(model) for model in models]}
+        ),
+    )
+    return None
+
+
+def get_cached_ollama_models(force_refresh: bool = False) -> list[OllamaModel]:
+    """
+    Ollama models, asked to ollama at most once every OLLAMA_MODELS_CACHE_TTL_SECONDS, unless `force_refresh`.
+    The list is kept in memory and on disk, so that new processes reuse it too.
+    If ollama cannot be reached, the last known list is used, however old.
+    """
+    global _ollama_models_cache
+    with _ollama_models_lock:
+        if _ollama_models_cache is None:
+            _ollama_models_cache = _load_ollama_models_from_disk()
+
+        if (
+            not force_refresh
+            and _ollama_models_cache is not None
+            and time.time() - _ollama_models_cache[0] < OLLAMA_MODELS_CACHE_TTL_SECONDS
+        ):
+            return _ollama_models_cache[1]
+
+        try:
+            models = get_available_ollama_models()
+        except ValueError:
+            if _ollama_models_cache is not None:
+                return _ollama_models_cache[1]
+            raise
+
+        _ollama_models_cache = (time.time(), models)
+        try:
+            _save_ollama_models_to_disk(*_ollama_models_cache)
+        except OSError:
+            pass
+        return models
+
+
+def get_available_llm_models(force_refresh: bool = False) -> list[str]:
+    return [
+        model.name
+        for model in get_cached_ollama_models(force_refresh=force_refresh)
+        if model.type == "llm"
+    ]
+
+
+def get_available_embedding_models(force_refresh: bool = False) -> list[str]:
+    return [
+        model.name
+        for model in get_cached_ollama_models(force_refresh=force_refresh)
+        if model.type == "embedding"
+    ]
+
 
 # %% Parameters
 
@@ -63,30 +136,217 @@ PDF_FOLDER = Path("./data/pdfs")
 OLLAMA_LOCAL_URL = "http://localhost:11434"
 VECTOR_DATABASE_FILEPATH = Path("./data/databases/chroma_database")
 VECTOR_DATABASE_COLLECTION_NAME = "PDF_collection"
+DOCUMENT_REGISTRY_FILEPATH = (
+    VECTOR_DATABASE_FILEPATH.parent / "document_registry.sqlite3"
+)
+# Entries fetched per query when paging through the vector database
+DATABASE_PAGE_SIZE = 5000
+# Hashes per $in filter when looking up many pdfs in the vector database
+DATABASE_MAX_HASHES_PER_QUERY = 500
+EMBEDDING_CACHE_FILEPATH = Path("./data/databases/embedding_cache.sqlite3")
+QUERY_EMBEDDING_CACHE_FILEPATH = Path("./data/databases/query_embedding_cache.sqlite3")
+SENTENCE_EMBEDDING_CACHE_FILEPATH = Path(
+    "./data/databases/sentence_embedding_cache.sqlite3"
+)
+ANSWER_CACHE_FILEPATH = Path("./data/databases/answer_cache.sqlite3")
+LEXICAL_INDEX_FILEPATH = Path("./data/databases/lexical_index.sqlite3")
+FILE_HASH_MANIFEST_FILEPATH = Path("./data/databases/file_hash_manifest.json")
+# Threads used to hash pdfs concurrently
+FILE_HASHING_WORKERS = 8
+# Bounds the PDFs queued in the chunking process pool, per worker
+PDF_CHUNKING_TASKS_PER_WORKER = 2
+OLLAMA_MODELS_CACHE_FILEPATH = Path("./data/databases/ollama_models.json")
+# Seconds the list of ollama models is reused before asking ollama again
+OLLAMA_MODELS_CACHE_TTL_SECONDS = 60
 
 
-def get_default_prompt() -> PromptTemplate:
+def get_default_prompt() -> "PromptTemplate":
     return templates.get_prompt_template_from_file(
         filepath=Path("./prompt_templates/system/default_prompt.txt")
     ).prompt
 
 
+RetrievalMode = Literal["vector", "hybrid", "adaptive"]
+
+
 @dataclass()
 class Params:
     ollama_embedding_model: str = "nomic-embed-text:latest"
     pdf_chunking_method: str = "by_sections"
     ollama_llm_model: str = "llama3:latest"
-    prompt: PromptTemplate = field(default_factory=get_default_prompt)
+    prompt: "PromptTemplate" = field(default_factory=get_default_prompt)
+    # New fields go below, so that the positional order of the fields above does not change
+    # Processes that chunk pdfs in parallel
+    pdf_chunking_workers: int = 1
+    # Number of chunked pdfs that may wait for the embedder before chunking pauses
+    pipeline_queue_size: int = 2
+    # Chunks sent to the embedding model and written to the database per request, regardless of which pdf they come from
+    embedding_batch_size: int = 64
+    # Optional cap on the total characters of a batch. None means batches are sized by chunk count only
+    embedding_batch_max_characters: int | None = None
+    # Least recently used chunk embeddings are evicted from the on-disk cache beyond this many entries
+    embedding_cache_max_entries: int = 200_000
+    # Question embeddings kept in memory, so that repeated questions are not embedded again
+    query_embedding_cache_size: int = 1024
+    # Also keep question embeddings on disk, across runs
+    persist_query_embeddings: bool = False
+    # Reuse the answer of a previous, near-identical question, if the prompt, models and pdfs did not change since
+    answer_cache_enabled: bool = False
+    # Minimum cosine similarity between question embeddings to reuse an answer
+    answer_cache_similarity_threshold: float = 0.95
+    answer_cache_ttl_seconds: float = 7 * 24 * 3600
+    answer_cache_max_entries: int = 1000
+    # "vector" retrieves chunks by embedding similarity only.
+    # "hybrid" also matches the question's words and identifiers in a BM25 index, and fuses both rankings.
+    # "adaptive" retrieves by embedding similarity, and picks how many chunks to keep from their distances to the question
+    retrieval_mode: RetrievalMode = "vector"
+    # Chunks taken from each ranking before fusing them, in hybrid mode
+    hybrid_candidates: int = 20
+    # In adaptive mode, between adaptive_min_k and adaptive_max_k chunks are kept:
+    # the ones within adaptive_max_distance of the question, up to the first jump of adaptive_min_gap in distance.
+    # Distances are Chroma's, in its default squared L2 space: 0 for identical embeddings, up to 4 for normalized ones
+    adaptive_min_k: int = 2
+    adaptive_max_k: int = 10
+    adaptive_max_distance: float = 1.0
+    adaptive_min_gap: float = 0.1
+    # Rerank the retrieved chunks with maximal marginal relevance, so that near-identical chunks (e.g. adjacent pages) do not crowd out the others.
+    # mmr_fetch_k candidates are retrieved. mmr_lambda trades relevance (1) for diversity (0)
+    mmr_enabled: bool = False
+    mmr_lambda: float = 0.5
+    mmr_fetch_k: int = 20
+    # Before generating, keep only the sentences of the retrieved chunks whose embedding is at least
+    # compression_similarity_threshold similar to the question's. Sentence embeddings are cached, so this gets cheap after warm-up.
+    # They have their own on-disk cache, of up to sentence_embedding_cache_max_entries, so that they do not evict chunk embeddings
+    compression_enabled: bool = False
+    compression_similarity_threshold: float = 0.5
+    sentence_embedding_cache_max_entries: int = 100_000
+    # Context window of the LLM, in tokens, shared by the prompt, the retrieved chunks and the answer
+    num_ctx: int = 4096
+    # Tokens of the context window kept free for the answer. Retrieved chunks that do not fit are trimmed or dropped
+    answer_token_reserve: int = 512
+    # Retrieved chunks at least this similar to a better ranked one (Jaccard similarity of word triples) are dropped
+    context_duplicate_threshold: float = 0.8
+    # Seconds ollama keeps the LLM and the embedding model loaded after each request (ollama's default is 5 minutes).
+    # -1 keeps them loaded until ollama stops
+    keep_alive: int = 30 * 60
 
     def __post_init__(self):
-        if self.ollama_llm_model not in AVAILABLE_LLM_MODELS:
+        # A model missing from the cached list may have been pulled since. Ask ollama again before failing
+        available_llm_models = get_available_llm_models()
+        if self.ollama_llm_model not in available_llm_models:
+            available_llm_models = get_available_llm_models(force_refresh=True)
+        if self.ollama_llm_model not in available_llm_models:
+            raise ValueError(
+                f"invalid LLM model chosen. It should be one of {available_llm_models}, and you chose {self.ollama_llm_model}."
+            )
+
+        available_embedding_models = get_available_embedding_models()
+        if self.ollama_embedding_model not in available_embedding_models:
+            available_embedding_models = get_available_embedding_models(
+                force_refresh=True
+            )
+        if self.ollama_embedding_model not in available_embedding_models:
+            raise ValueError(
+                f"invalid embedding model chosen. It should be one of {available_embedding_models}, and you chose {self.ollama_embedding_model}."
+            )
+
+        if self.pdf_chunking_workers < 1:
+            raise ValueError(
+                f"pdf_chunking_workers must be at least 1, and you chose {self.pdf_chunking_workers}."
+            )
+
+        if self.pipeline_queue_size < 1:
+            raise ValueError(
+                f"pipeline_queue_size must be at least 1, and you chose {self.pipeline_queue_size}."
+            )
+
+        if self.embedding_batch_size < 1:
+            raise ValueError(
+                f"embedding_batch_size must be at least 1, and you chose {self.embedding_batch_size}."
+            )
+
+        if (
+            self.embedding_batch_max_characters is not None
+            and self.embedding_batch_max_characters < 1
+        ):
+            raise ValueError(
+                f"embedding_batch_max_characters must be at least 1 or None, and you chose {self.embedding_batch_max_characters}."
+            )
+
+        if self.embedding_cache_max_entries < 1:
+            raise ValueError(
+                f"embedding_cache_max_entries must be at least 1, and you chose {self.embedding_cache_max_entries}."
+            )
+
+        if self.query_embedding_cache_size < 1:
+            raise ValueError(
+                f"query_embedding_cache_size must be at least 1, and you chose {self.query_embedding_cache_size}."
+            )
+
+        # A threshold of 0 or less would reuse the answer of unrelated questions
+        if not 0 < self.answer_cache_similarity_threshold <= 1:
+            raise ValueError(
+                f"answer_cache_similarity_threshold must be above 0 and at most 1, and you chose {self.answer_cache_similarity_threshold}."
+            )
+
+        if self.answer_cache_ttl_seconds <= 0:
+            raise ValueError(
+                f"answer_cache_ttl_seconds must be positive, and you chose {self.answer_cache_ttl_seconds}."
+            )
+
+        if self.answer_cache_max_entries < 1:
+            raise ValueError(
+                f"answer_cache_max_entries must be at least 1, and you chose {self.answer_cache_max_entries}."
+            )
+
+        if self.sentence_embedding_cache_max_entries < 1:
+            raise ValueError(
+                f"sentence_embedding_cache_max_entries must be at least 1, and you chose {self.sentence_embedding_cache_max_entries}."
+            )
+
+        if not 0 < self.answer_token_reserve < self.num_ctx:
+            raise ValueError(
+                f"answer_token_reserve must be positive and smaller than num_ctx ({self.num_ctx}), and you chose {self.answer_token_reserve}."
+            )
+
+        if self.retrieval_mode not in get_args(RetrievalMode):
+            raise ValueError(
+                f"retrieval_mode must be 'vector', 'hybrid' or 'adaptive', and you chose {self.retrieval_mode}."
+            )
+
+        if not 1 <= self.adaptive_min_k <= self.adaptive_max_k:
+            raise ValueError(
+                f"adaptive_min_k and adaptive_max_k must satisfy 1 <= adaptive_min_k <= adaptive_max_k, and you chose {self.adaptive_min_k} and {self.adaptive_max_k}."
+            )
+
+        if self.adaptive_max_distance <= 0:
+            raise ValueError(
+                f"adaptive_max_distance must be positive, and you chose {self.adaptive_max_distance}."
+            )
+
+        if self.adaptive_min_gap <= 0:
+            raise ValueError(
+                f"adaptive_min_gap must be positive, and you chose {self.adaptive_min_gap}."
+            )
+
+        if not 0 <= self.mmr_lambda <= 1:
+            raise ValueError(
+                f"mmr_lambda must be between 0 and 1, and you chose {self.mmr_lambda}."
+            )
+
+        if self.mmr_fetch_k < 1:
+            raise ValueError(
+                f"mmr_fetch_k must be at least 1, and you chose {self.mmr_fetch_k}."
+            )
+
+        if self.hybrid_candidates < 1:
             raise ValueError(
-                f"invalid LLM model chosen. It should be one of {AVAILABLE_LLM_MODELS}, and you chose {self.ollama_llm_model}."
+                f"hybrid_candidates must be at least 1, and you chose {self.hybrid_candidates}."
             )
 
-        if self.ollama_embedding_model not in AVAILABLE_EMBEDDING_MODELS:
+        if self.keep_alive < -1:
             raise ValueError(
-                f"invalid embedding model chosen. It should be one of {AVAILABLE_EMBEDDING_MODELS}, and you chose {self.ollama_embedding_model}."
+                f"keep_alive must be -1 (keep the models loaded) or at least 0 seconds, and you chose {self.keep_alive}."
             )
 
     def set_params(self, **kwargs) -> None:
@@ -0,0 +1,92 @@
+import math
+
+from langchain_core.documents import Document
+
+# Estimating tokens from characters avoids loading the model's tokenizer.
+# Llama-style tokenizers average about 4 characters per token on English text; 3.5 errs on the side of fewer characters
+CHARACTERS_PER_TOKEN = 3.5
+# A chunk cut shorter than this is not worth keeping
+MIN_TRUNCATED_CHUNK_TOKENS = 64
+CHUNK_SEPARATOR = "\n\n"
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARACTERS_PER_TOKEN)
+
+
+def _word_shingles(text: str, size: int = 3) -> set[tuple[str, ...]]:
+    words = text.lower().split()
+    if len(words) < size:
+        return {tuple(words)}
+    return {tuple(words[i : i + size]) for i in range(len(words) - size + 1)}
+
+
+def jaccard_similarity(a: set, b: set) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut `text` to about `max_tokens`, at a word boundary."""
+    max_characters = int(max_tokens * CHARACTERS_PER_TOKEN)
+    if len(text) <= max_characters:
+        return text
+    truncated = text[:max_characters]
+    last_space = truncated.rfind(" ")
+    if last_space > 0:
+        truncated = truncated[:last_space]
+    return truncated
+
+
+def pack_documents(
+    docs: list[Document], budget_tokens: int, duplicate_threshold: float
+) -> list[Document]:
+    """
+    Keep the best ranked `docs` that fit in `budget_tokens`, in order:
+    - A doc whose word shingles overlap a kept doc's by `duplicate_threshold` or more is dropped as a near duplicate.
+    - The first doc that does not fit is truncated to the remaining budget, and the lower ranked ones are dropped.
+    """
+    packed_docs: list[Document] = []
+    kept_shingles: list[set] = []
+    remaining_tokens = budget_tokens
+    for doc in docs:
+        shingles = _word_shingles(doc.page_content)
+        if any(
+            jaccard_similarity(shingles, kept) >= duplicate_threshold
+            for kept in kept_shingles
+        ):
+            continue
+
+        separator_tokens = estimate_tokens(CHUNK_SEPARATOR) if packed_docs else 0
+        doc_tokens = estimate_tokens(doc.page_content)
+
+        if separator_tokens + doc_tokens <= remaining_tokens:
+            packed_docs.append(doc)
+            kept_shingles.append(shingles)
+            remaining_tokens -= separator_tokens + doc_tokens
+            continue
+
+        if remaining_tokens - separator_tokens >= MIN_TRUNCATED_CHUNK_TOKENS:
+            packed_docs.append(
+                Document(
+                    id=doc.id,
+                    page_content=truncate_to_tokens(
+                        doc.page_content,
+                        max_tokens=remaining_tokens - separator_tokens,
+                    ),
+                    metadata=doc.metadata,
+                )
+            )
+        break
+
+    return packed_docs
+
+
+def get_context_budget_tokens(
+    prompt_without_context: str, num_ctx: int, answer_token_reserve: int
+) -> int:
+    """Tokens left for the retrieved chunks once the prompt itself and the answer are accounted for."""
+    return max(
+        0, num_ctx - estimate_tokens(prompt_without_context) - answer_token_reserve
+    )
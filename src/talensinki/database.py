@@ -1,6 +1,10 @@
 from pathlib import Path
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass, asdict
+from concurrent.futures import ThreadPoolExecutor
 import hashlib
-from uuid import uuid4
+import json
+import mmap
 from rich.progress import track
 
 from langchain_ollama import OllamaEmbeddings
@@ -11,8 +15,10 @@ from chromadb.api import ClientAPI
 from chromadb.config import Settings
 from chromadb import Collection
 
-from talensinki import config, pdf_chunking
+from talensinki import config, embedding_cache, pdf_chunking, pipeline, storage
 from talensinki.console import console
+from talensinki.lexical_index import LexicalIndex
+from talensinki.registry import DocumentRecord, DocumentRegistry
 
 
 def get_pdf_filepaths_in_folder(folder: Path) -> list[Path]:
@@ -21,14 +27,111 @@ def get_pdf_filepaths_in_folder(folder: Path) -> list[Path]:
 
 def calculate_file_hash(file_path: Path) -> str:
     """Calculate SHA256 hash of a file"""
-    hasher = hashlib.sha256()
-
     with open(file_path, "rb") as f:
-        # Read file in chunks to handle large files efficiently
-        for chunk in iter(lambda: f.read(8192), b""):
-            hasher.update(chunk)
+        try:
+            # Hash the whole memory-mapped file in one call. hashlib releases the GIL meanwhile,
+            # so several files can be hashed concurrently from threads.
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped_file:
+                return hashlib.sha256(mapped_file).hexdigest()
+        except (ValueError, OSError):
+            # Empty files and some filesystems cannot be memory-mapped. Read with large buffers instead
+            f.seek(0)
+            return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+def calculate_file_hashes(
+    file_paths: list[Path], max_workers: int = config.FILE_HASHING_WORKERS
+) -> dict[Path, str]:
+    """Calculate the SHA256 hash of many files concurrently on a thread pool"""
+    if len(file_paths) <= 1:
+        return {file_path: calculate_file_hash(file_path) for file_path in file_paths}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return dict(zip(file_paths, executor.map(calculate_file_hash, file_paths)))
+
+
+@dataclass
+class FileFingerprint:
+    # Cheap stat data that changes whenever the file contents are rewritten
+    size: int
+    mtime_ns: int
+    inode: int
+
+
+def get_file_fingerprint(file_path: Path) -> FileFingerprint:
+    stat = file_path.stat()
+    return FileFingerprint(
+        size=stat.st_size, mtime_ns=stat.st_mtime_ns, inode=stat.st_ino
+    )
+
+
+def load_file_hash_manifest(manifest_filepath: Path) -> dict[str, dict]:
+    """
+    The manifest maps absolute file paths to their fingerprint and hash, as computed in a previous run.
+    """
+    try:
+        with open(manifest_filepath, "r") as f:
+            manifest: dict[str, dict] = json.load(f)
+        return manifest
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_file_hash_manifest(manifest: dict[str, dict], manifest_filepath: Path) -> None:
+    storage.write_text_atomically(manifest_filepath, json.dumps(manifest))
+    return None
 
-    return hasher.hexdigest()
+
+def get_file_hashes(
+    file_paths: list[Path],
+    manifest_filepath: Path = config.FILE_HASH_MANIFEST_FILEPATH,
+    is_whole_folder: bool = False,
+) -> dict[Path, str]:
+    """
+    Hash of each file. Files whose size, mtime and inode did not change since the last run
+    reuse the hash stored in the manifest, and are not read from disk.
+    If `is_whole_folder`, `file_paths` are all the files there are, and the manifest forgets any other file,
+    e.g. deleted or moved pdfs, so that it does not grow forever.
+    """
+    manifest = load_file_hash_manifest(manifest_filepath=manifest_filepath)
+    is_manifest_changed = False
+    if is_whole_folder:
+        current_filepaths = {str(file_path.absolute()) for file_path in file_paths}
+        for filepath in [
+            filepath for filepath in manifest if filepath not in current_filepaths
+        ]:
+            del manifest[filepath]
+            is_manifest_changed = True
+
+    file_hashes = {}
+    changed_file_fingerprints = {}
+
+    for file_path in file_paths:
+        fingerprint = asdict(get_file_fingerprint(file_path=file_path))
+        manifest_entry = manifest.get(str(file_path.absolute()))
+
+        if manifest_entry is not None and manifest_entry["fingerprint"] == fingerprint:
+            file_hashes[file_path] = manifest_entry["hash"]
+        else:
+            changed_file_fingerprints[file_path] = fingerprint
+
+    if changed_file_fingerprints:
+        new_file_hashes = calculate_file_hashes(
+            file_paths=list(changed_file_fingerprints)
+        )
+        for file_path, fingerprint in changed_file_fingerprints.items():
+            manifest[str(file_path.absolute())] = {
+                "fingerprint": fingerprint,
+                "hash": new_file_hashes[file_path],
+            }
+        file_hashes.update(new_file_hashes)
+        is_manifest_changed = True
+
+    if is_manifest_changed:
+        save_file_hash_manifest(manifest=manifest, manifest_filepath=manifest_filepath)
+
+    # Keep the order of file_paths
+    return {file_path: file_hashes[file_path] for file_path in file_paths}
 
 
 def initialize_chroma_database_client() -> ClientAPI:
@@ -63,74 +166,538 @@ def get_or_create_database_collection(chroma_client: ClientAPI) -> Collection:
     return collection
 
 
+def get_embedding_cache(params: config.Params) -> embedding_cache.EmbeddingCache:
+    return embedding_cache.EmbeddingCache(
+        filepath=config.EMBEDDING_CACHE_FILEPATH,
+        max_entries=params.embedding_cache_max_entries,
+    )
+
+
+def get_sentence_embedding_cache(
+    params: config.Params,
+) -> embedding_cache.EmbeddingCache:
+    return embedding_cache.EmbeddingCache(
+        filepath=config.SENTENCE_EMBEDDING_CACHE_FILEPATH,
+        max_entries=params.sentence_embedding_cache_max_entries,
+    )
+
+
+def get_cached_embeddings(
+    params: config.Params, cache: embedding_cache.EmbeddingCache
+) -> embedding_cache.CachedEmbeddings:
+    """Ollama embeddings of the configured model. Texts already embedded with it are read from the on-disk `cache`."""
+    return embedding_cache.CachedEmbeddings(
+        embeddings=OllamaEmbeddings(
+            model=params.ollama_embedding_model,
+            base_url=config.OLLAMA_LOCAL_URL,
+            keep_alive=params.keep_alive,
+        ),
+        model=params.ollama_embedding_model,
+        cache=cache,
+    )
+
+
 def get_vector_store_from_client(
-    chroma_client: ClientAPI, params: config.Params
+    chroma_client: ClientAPI,
+    params: config.Params,
+    cache: embedding_cache.EmbeddingCache,
 ) -> Chroma:
+    # Chunks whose text was already embedded with this model are read from the on-disk `cache` instead of ollama
+    embeddings = get_cached_embeddings(params=params, cache=cache)
     return Chroma(
         client=chroma_client,
         collection_name=config.VECTOR_DATABASE_COLLECTION_NAME,
-        embedding_function=OllamaEmbeddings(
-            model=params.ollama_embedding_model,
-            base_url=config.OLLAMA_LOCAL_URL,
-        ),
+        embedding_function=embeddings,
     )
 
 
+def make_chunk_id(
+    source_pdf_hash: str, pdf_chunking_method: str, chunk_index: int
+) -> str:
+    """
+    Deterministic database id of a chunk: the same chunk of the same pdf always gets the same id.
+    """
+    return f"{source_pdf_hash}-{pdf_chunking_method}-{chunk_index}"
+
+
+def get_chunk_id(chunk: Document) -> str:
+    return make_chunk_id(
+        source_pdf_hash=chunk.metadata["source_pdf_hash"],
+        pdf_chunking_method=chunk.metadata["pdf_chunking_method"],
+        chunk_index=chunk.metadata["chunk_index"],
+    )
+
+
+def get_embeddings_by_ids(
+    vector_store: Chroma, ids: list[str]
+) -> dict[str, list[float]]:
+    """Stored embeddings of the entries with `ids`, read from the database rather than computed again."""
+    if not ids:
+        return {}
+    result = vector_store.get(ids=ids, include=["embeddings"])
+    return dict(zip(result["ids"], result["embeddings"]))
+
+
+def get_existing_chunk_ids(vector_store: Chroma, chunk_ids: list[str]) -> list[str]:
+    return list(vector_store.get(ids=chunk_ids, include=[])["ids"])
+
+
+class _PdfsBeingEmbedded:
+    """
+    Follows the pdfs flowing through the embedding batches,
+    to record each pdf in the registry as soon as all of its chunks are in the database.
+    """
+
+    def __init__(
+        self,
+        registry: DocumentRegistry,
+        pdf_paths_by_hash: dict[str, Path],
+        params: config.Params,
+    ):
+        self.registry = registry
+        self.pdf_paths_by_hash = pdf_paths_by_hash
+        self.params = params
+        # In stream order
+        self._chunk_ids_by_hash: dict[str, list[str]] = {}
+        self._hashes_with_chunks: set[str] = set()
+
+    def follow(
+        self, chunks_for_all_pdfs: Iterable[list[Document]]
+    ) -> Iterator[list[Document]]:
+        for chunks_for_single_pdf in chunks_for_all_pdfs:
+            if chunks_for_single_pdf:
+                pdf_hash = chunks_for_single_pdf[0].metadata["source_pdf_hash"]
+                self._chunk_ids_by_hash[pdf_hash] = [
+                    get_chunk_id(chunk) for chunk in chunks_for_single_pdf
+                ]
+                self._hashes_with_chunks.add(pdf_hash)
+            yield chunks_for_single_pdf
+
+    def _record(self, pdf_hash: str, chunk_ids: list[str]) -> None:
+        self.registry.record(
+            DocumentRecord(
+                pdf_hash=pdf_hash,
+                pdf_path=str(self.pdf_paths_by_hash.get(pdf_hash, "")),
+                chunk_ids=chunk_ids,
+                pdf_chunking_method=self.params.pdf_chunking_method,
+                embedding_model=self.params.ollama_embedding_model,
+            )
+        )
+        return None
+
+    def mark_written_up_to(self, last_written_chunk: Document | None) -> None:
+        """
+        Chunks are written in stream order, so every pdf before the one of `last_written_chunk` is complete.
+        Pass None once the stream is exhausted to record the remaining pdfs.
+        """
+        last_written_pdf_hash = None
+        last_written_chunk_id = None
+        if last_written_chunk is not None:
+            last_written_pdf_hash = last_written_chunk.metadata["source_pdf_hash"]
+            last_written_chunk_id = get_chunk_id(last_written_chunk)
+
+        for pdf_hash, chunk_ids in list(self._chunk_ids_by_hash.items()):
+            is_pdf_of_last_written_chunk = pdf_hash == last_written_pdf_hash
+            if is_pdf_of_last_written_chunk and chunk_ids[-1] != last_written_chunk_id:
+                return None
+
+            self._record(pdf_hash=pdf_hash, chunk_ids=chunk_ids)
+            del self._chunk_ids_by_hash[pdf_hash]
+
+            if is_pdf_of_last_written_chunk:
+                return None
+        return None
+
+    def mark_pdfs_without_chunks(self, failed_pdf_hashes: set[str]) -> None:
+        """
+        Once the stream is exhausted, record the pdfs that produced no chunk, e.g. scans without text,
+        so that the next sync does not chunk them again. A pdf that changes gets a new hash, and is chunked again.
+        The pdfs of `failed_pdf_hashes` are not recorded: the failure may be transient, so the next sync retries them.
+        """
+        for pdf_hash in self.pdf_paths_by_hash:
+            if (
+                pdf_hash not in self._hashes_with_chunks
+                and pdf_hash not in failed_pdf_hashes
+            ):
+                self._record(pdf_hash=pdf_hash, chunk_ids=[])
+        return None
+
+
 def embed_pdfs_to_database(
     vector_store: Chroma,
-    chunks_for_all_pdfs: list[list[Document]],
+    chunks_for_all_pdfs: Iterable[list[Document]],
     params: config.Params,
+    number_of_pdfs: int | None = None,
+    registry: DocumentRegistry | None = None,
+    pdf_paths_by_hash: dict[str, Path] | None = None,
+    lexical_index: LexicalIndex | None = None,
+    failed_pdf_hashes: set[str] | None = None,
 ) -> None:
-    for chunks_for_single_pdf in track(
+    """
+    `chunks_for_all_pdfs` can be a lazy stream, so that embedding starts as soon as the first pdf is chunked.
+    Chunks are re-sliced across pdfs into batches of params.embedding_batch_size,
+    and each batch is embedded and written to the database in one go.
+    If a `registry` is given, each pdf is recorded in it once all its chunks are written.
+    The pdfs of `pdf_paths_by_hash` that produced no chunk are recorded at the end, without chunks,
+    unless they are in `failed_pdf_hashes`, which the chunking stream fills in as pdfs fail.
+    If a `lexical_index` is given, each batch is also indexed there, under the same ids.
+    """
+    tracked_chunks_for_all_pdfs = track(
         chunks_for_all_pdfs,
+        total=number_of_pdfs,
         description=f"Embedding pdfs into the database using the {params.ollama_embedding_model} embedding model...",
+    )
+    pdfs_being_embedded = None
+    if registry is not None:
+        pdfs_being_embedded = _PdfsBeingEmbedded(
+            registry=registry,
+            pdf_paths_by_hash=pdf_paths_by_hash or {},
+            params=params,
+        )
+        tracked_chunks_for_all_pdfs = pdfs_being_embedded.follow(
+            tracked_chunks_for_all_pdfs
+        )
+
+    for batch in pipeline.batch_documents(
+        tracked_chunks_for_all_pdfs,
+        max_documents=params.embedding_batch_size,
+        max_characters=params.embedding_batch_max_characters,
     ):
-        # each chunk needs to have a different id in the database
-        uuids = [str(uuid4()) for _ in range(len(chunks_for_single_pdf))]
-        vector_store.add_documents(
-            documents=chunks_for_single_pdf,
-            ids=uuids,
+        chunk_ids = [get_chunk_id(chunk) for chunk in batch]
+        # Chunks already in the database, e.g. from an interrupted sync, are not embedded again.
+        # Only a registry notices that a pdf was interrupted, see check_sync_status_between_folder_and_database
+        existing_chunk_ids = set(
+            get_existing_chunk_ids(vector_store=vector_store, chunk_ids=chunk_ids)
+        )
+        new_chunks_and_ids = [
+            (chunk, chunk_id)
+            for chunk, chunk_id in zip(batch, chunk_ids)
+            if chunk_id not in existing_chunk_ids
+        ]
+        if new_chunks_and_ids:
+            new_chunks, new_chunk_ids = zip(*new_chunks_and_ids)
+            # Chroma upserts by id, so a chunk id is never stored twice
+            vector_store.add_documents(
+                documents=list(new_chunks),
+                ids=list(new_chunk_ids),
+            )
+        if lexical_index is not None:
+            lexical_index.upsert(
+                chunk_ids=chunk_ids, contents=[chunk.page_content for chunk in batch]
+            )
+
+        if pdfs_being_embedded is not None:
+            pdfs_being_embedded.mark_written_up_to(last_written_chunk=batch[-1])
+
+    if pdfs_being_embedded is not None:
+        pdfs_being_embedded.mark_written_up_to(last_written_chunk=None)
+        pdfs_being_embedded.mark_pdfs_without_chunks(
+            failed_pdf_hashes=failed_pdf_hashes or set()
         )
+
     console.print("Embedded all new pdfs.")
     return None
 
 
 def add_pdfs_to_database(
-    vector_store: Chroma, pdf_paths: list[Path], params: config.Params
+    vector_store: Chroma,
+    pdf_paths: list[Path],
+    params: config.Params,
+    pdf_hashes: dict[Path, str] | None = None,
+    registry: DocumentRegistry | None = None,
+    lexical_index: LexicalIndex | None = None,
 ) -> None:
-    chunks_for_all_pdfs = pdf_chunking.chunk_pdfs_with_metadata(
-        pdf_paths=pdf_paths, params=params
+    if pdf_hashes is None:
+        pdf_hashes = get_file_hashes(file_paths=pdf_paths)
+
+    # Chunking runs ahead in the background, at most params.pipeline_queue_size pdfs ahead of the embedder.
+    # Memory stays bounded however many pdfs there are.
+    # The chunking thread fills in failed_pdf_hashes before the stream ends, so it is complete when the embedder reads it
+    failed_pdf_hashes: set[str] = set()
+    chunks_for_all_pdfs = pipeline.prefetch_in_background(
+        pdf_chunking.iter_chunk_pdfs_with_metadata(
+            pdf_paths=pdf_paths,
+            params=params,
+            pdf_hashes=pdf_hashes,
+            failed_pdf_hashes=failed_pdf_hashes,
+        ),
+        max_buffered=params.pipeline_queue_size,
     )
     embed_pdfs_to_database(
         vector_store=vector_store,
         chunks_for_all_pdfs=chunks_for_all_pdfs,
         params=params,
+        number_of_pdfs=len(pdf_paths),
+        registry=registry,
+        pdf_paths_by_hash={pdf_hashes[pdf_path]: pdf_path for pdf_path in pdf_paths},
+        lexical_index=lexical_index,
+        failed_pdf_hashes=failed_pdf_hashes,
     )
     return None
 
 
-def delete_entries_from_database(vector_store: Chroma, ids: list[str]) -> None:
-    vector_store.delete(ids=ids)
+def delete_entries_from_database(
+    vector_store: Chroma,
+    ids: list[str],
+    registry: DocumentRegistry | None = None,
+    lexical_index: LexicalIndex | None = None,
+    pdf_hashes: tuple[str, ...] = (),
+) -> None:
+    """
+    Delete the entries with `ids`. The registry also forgets the pdfs of `pdf_hashes`,
+    which covers the pdfs recorded without any chunk, and so without any of `ids`.
+    """
+    if ids:
+        vector_store.delete(ids=ids)
+    if registry is not None:
+        registry.remove_documents_with_chunk_ids(chunk_ids=ids)
+        registry.remove(pdf_hashes=pdf_hashes)
+    if lexical_index is not None:
+        lexical_index.delete(chunk_ids=ids)
     return None
 
 
+def delete_pdfs_from_database(
+    vector_store: Chroma,
+    registry: DocumentRegistry,
+    pdf_hashes: tuple[str, ...],
+    lexical_index: LexicalIndex | None = None,
+) -> None:
+    """Delete the entries of some pdfs by id, as recorded in the registry, without scanning the database."""
+    chunk_ids = registry.get_chunk_ids(pdf_hashes=pdf_hashes)
+    if chunk_ids:
+        vector_store.delete(ids=chunk_ids)
+        if lexical_index is not None:
+            lexical_index.delete(chunk_ids=chunk_ids)
+    registry.remove(pdf_hashes=pdf_hashes)
+    return None
+
+
+def get_document_registry() -> DocumentRegistry:
+    return DocumentRegistry(filepath=config.DOCUMENT_REGISTRY_FILEPATH)
+
+
+def get_lexical_index() -> LexicalIndex:
+    return LexicalIndex(filepath=config.LEXICAL_INDEX_FILEPATH)
+
+
+def reconcile_lexical_index_with_vector_store(
+    vector_store: Chroma, lexical_index: LexicalIndex
+) -> None:
+    """
+    Same as reconcile_registry_with_vector_store, for the lexical index:
+    forget everything if the vector database was emptied, and index its entries once if the lexical index is new.
+    """
+    is_vector_store_empty = len(vector_store.get(limit=1, include=[])["ids"]) == 0
+    if is_vector_store_empty:
+        if len(lexical_index) > 0:
+            lexical_index.clear()
+        return None
+
+    if len(lexical_index) > 0:
+        return None
+
+    console.print("Building the lexical index from the database entries...")
+    for page in iter_database_entries(vector_store=vector_store, include=["documents"]):
+        lexical_index.upsert(chunk_ids=page["ids"], contents=page["documents"])
+    return None
+
+
+def reconcile_registry_with_vector_store(
+    vector_store: Chroma, registry: DocumentRegistry
+) -> None:
+    """
+    Make the registry trustworthy before using it to compute diffs:
+    - If the vector database was emptied or deleted, forget every record.
+    - If the registry is new but the vector database is not, fill it in from the database entries, once.
+    """
+    is_vector_store_empty = len(vector_store.get(limit=1, include=[])["ids"]) == 0
+    if is_vector_store_empty:
+        if len(registry) > 0:
+            registry.clear()
+        return None
+
+    if len(registry) > 0:
+        return None
+
+    console.print("Building the document registry from the database entries...")
+    chunk_ids_by_hash: dict[str, list[str]] = {}
+    first_metadata_by_hash: dict[str, dict] = {}
+    for page in iter_database_entries(vector_store=vector_store, include=["metadatas"]):
+        for chunk_id, metadata in zip(page["ids"], page["metadatas"]):
+            pdf_hash = metadata["source_pdf_hash"]
+            chunk_ids_by_hash.setdefault(pdf_hash, []).append(chunk_id)
+            first_metadata_by_hash.setdefault(pdf_hash, metadata)
+
+    for pdf_hash, chunk_ids in chunk_ids_by_hash.items():
+        metadata = first_metadata_by_hash[pdf_hash]
+        registry.record(
+            DocumentRecord(
+                pdf_hash=pdf_hash,
+                pdf_path=str(metadata.get("source", "")),
+                chunk_ids=chunk_ids,
+                pdf_chunking_method=str(metadata.get("pdf_chunking_method", "")),
+                # The vector database does not store which model embedded an entry
+                embedding_model=None,
+            )
+        )
+    return None
+
+
+def _combine_where_filters(*where_filters: dict | None) -> dict | None:
+    filters = [where for where in where_filters if where is not None]
+    if not filters:
+        return None
+    if len(filters) == 1:
+        return filters[0]
+    return {"$and": filters}
+
+
+def _iter_database_entries_by_offset(
+    vector_store: Chroma, where: dict | None, include: list[str], page_size: int
+) -> Iterator[dict]:
+    offset = 0
+    while True:
+        page = vector_store.get(
+            where=where, limit=page_size, offset=offset, include=include
+        )
+        if len(page["ids"]) > 0:
+            yield page
+        if len(page["ids"]) < page_size:
+            return
+        offset += page_size
+
+
+def iter_database_entries(
+    vector_store: Chroma,
+    where: dict | None = None,
+    include: list[str] | None = None,
+    page_size: int = config.DATABASE_PAGE_SIZE,
+) -> Iterator[dict]:
+    """
+    Page through the entries that match `where`, filtered by Chroma itself.
+    Only one page of results is held in memory at a time.
+
+    Pages are cut by ranges of chunk_index, not by offset: Chroma steps over the entries before an offset one by one,
+    which makes offset paging quadratic in the number of entries. Each range is sized to hold about `page_size` entries.
+    Entries without a chunk_index, embedded before it existed, come last, paged by offset.
+    """
+    include = include if include is not None else []
+    # Every pdf has the chunk indices 0, 1, 2... so the first empty range means there are no more entries.
+    # Entries of a chunker that no longer exists are left to the last query, as if they had no chunk_index
+    known_chunking_methods = list(pdf_chunking.AVAILABLE_PDF_CHUNKERS)
+    range_start = 0
+    range_width = 1
+    while True:
+        range_where = _combine_where_filters(
+            where,
+            {"pdf_chunking_method": {"$in": known_chunking_methods}},
+            {"chunk_index": {"$gte": range_start}},
+            {"chunk_index": {"$lt": range_start + range_width}},
+        )
+        number_of_entries_in_range = 0
+        for page in _iter_database_entries_by_offset(
+            vector_store=vector_store,
+            where=range_where,
+            include=include,
+            page_size=page_size,
+        ):
+            number_of_entries_in_range += len(page["ids"])
+            yield page
+        if number_of_entries_in_range == 0:
+            break
+        range_start += range_width
+        range_width = max(1, range_width * page_size // number_of_entries_in_range)
+
+    # $nin also matches the entries that have no pdf_chunking_method at all
+    yield from _iter_database_entries_by_offset(
+        vector_store=vector_store,
+        where=_combine_where_filters(
+            where, {"pdf_chunking_method": {"$nin": known_chunking_methods}}
+        ),
+        include=include,
+        page_size=page_size,
+    )
+
+
 def get_item_id_and_metadata_from_database(vector_store: Chroma) -> tuple[list, list]:
     # gets all items from database
-    docs_ids_and_metadatas = vector_store.get(include=["metadatas"])
-    docs_ids = docs_ids_and_metadatas["ids"]
-    docs_metadatas = docs_ids_and_metadatas["metadatas"]
+    docs_ids = []
+    docs_metadatas = []
+    for page in iter_database_entries(vector_store=vector_store, include=["metadatas"]):
+        docs_ids.extend(page["ids"])
+        docs_metadatas.extend(page["metadatas"])
     return docs_ids, docs_metadatas
 
 
-def get_pdf_hashes_in_database(vector_store: Chroma) -> tuple[str, ...]:
-    # gets all items from database
-    ids, metadatas = get_item_id_and_metadata_from_database(vector_store)
-    return tuple(metadata["source_pdf_hash"] for metadata in metadatas)
+def _get_pdf_hashes_of_entries(vector_store: Chroma, where: dict) -> set[str]:
+    return {
+        metadata["source_pdf_hash"]
+        for page in iter_database_entries(
+            vector_store=vector_store, where=where, include=["metadatas"]
+        )
+        for metadata in page["metadatas"]
+    }
+
+
+def get_pdf_hashes_in_database(
+    vector_store: Chroma, hashes: tuple[str, ...] | None = None
+) -> tuple[str, ...]:
+    """
+    Hashes of the pdfs in the database.
+    If `hashes` is given, only those are looked up, and the cost depends on them instead of on the database size.
+    A pdf counts as soon as any of its chunks is stored, even if its ingestion was interrupted before the last one.
+    """
+    if hashes is None:
+        # One entry per pdf, its first chunk, instead of every chunk. Entries from before chunk_index existed are all read
+        return tuple(
+            _get_pdf_hashes_of_entries(
+                vector_store=vector_store, where={"chunk_index": 0}
+            )
+            | _get_pdf_hashes_of_entries(
+                vector_store=vector_store,
+                where={
+                    "pdf_chunking_method": {
+                        "$nin": list(pdf_chunking.AVAILABLE_PDF_CHUNKERS)
+                    }
+                },
+            )
+        )
+
+    # The first chunk of a pdf is enough to know that the pdf is in the database
+    hashes_in_database: set[str] = set()
+    for hashes_group in storage.split_into_groups(
+        hashes, group_size=config.DATABASE_MAX_HASHES_PER_QUERY
+    ):
+        hashes_in_database |= _get_pdf_hashes_of_entries(
+            vector_store=vector_store,
+            where={
+                "$and": [
+                    {"source_pdf_hash": {"$in": hashes_group}},
+                    {"chunk_index": 0},
+                ]
+            },
+        )
+
+    # Chunks embedded before chunk_index existed are found by hash alone.
+    # This only queries the pdfs not found above, which are mostly new pdfs without any entry.
+    unseen_hashes = tuple(h for h in hashes if h not in hashes_in_database)
+    for hashes_group in storage.split_into_groups(
+        unseen_hashes, group_size=config.DATABASE_MAX_HASHES_PER_QUERY
+    ):
+        hashes_in_database |= _get_pdf_hashes_of_entries(
+            vector_store=vector_store,
+            where={"source_pdf_hash": {"$in": hashes_group}},
+        )
+
+    return tuple(hashes_in_database)
 
 
 def does_pdf_exist_in_database(vector_store: Chroma, pdf_file_hash: str) -> bool:
     """Check if documents with the given PDF hash already exist"""
-    existing_docs = vector_store.get(where={"source_pdf_hash": pdf_file_hash})
+    existing_docs = vector_store.get(
+        where={"source_pdf_hash": pdf_file_hash}, limit=1, include=[]
+    )
     return len(existing_docs["ids"]) > 0
 
 
@@ -149,51 +716,124 @@ def get_hashes_of_files_in_database_but_not_in_folder(
 def get_ids_of_entries_with_specific_hashes(
     vector_store: Chroma, hashes: tuple[str, ...]
 ) -> list[str]:
-    docs_ids, docs_metadatas = get_item_id_and_metadata_from_database(
-        vector_store=vector_store
-    )
     docs_ids_with_hash = []
-    for doc_id, doc_metadata in zip(docs_ids, docs_metadatas):
-        if doc_metadata["source_pdf_hash"] in hashes:
-            docs_ids_with_hash.append(doc_id)
+    for hashes_group in storage.split_into_groups(
+        hashes, group_size=config.DATABASE_MAX_HASHES_PER_QUERY
+    ):
+        for page in iter_database_entries(
+            vector_store=vector_store,
+            where={"source_pdf_hash": {"$in": hashes_group}},
+        ):
+            docs_ids_with_hash.extend(page["ids"])
     return docs_ids_with_hash
 
 
+def get_ids_of_entries_without_specific_hashes(
+    vector_store: Chroma, hashes: tuple[str, ...]
+) -> list[str]:
+    """
+    Ids of the entries of pdfs other than `hashes`.
+    The pdfs in the database are diffed against `hashes` here, rather than in a $nin filter as large as `hashes`,
+    so only the entries of the other pdfs are fetched.
+    """
+    other_hashes = tuple(
+        set(get_pdf_hashes_in_database(vector_store=vector_store)) - set(hashes)
+    )
+    return get_ids_of_entries_with_specific_hashes(
+        vector_store=vector_store, hashes=other_hashes
+    )
+
+
 def check_sync_status_between_folder_and_database(
-    vector_store: Chroma, pdf_folder: Path
-) -> tuple[list[Path], list[str]]:
+    vector_store: Chroma,
+    pdf_folder: Path,
+    manifest_filepath: Path = config.FILE_HASH_MANIFEST_FILEPATH,
+    registry: DocumentRegistry | None = None,
+    lexical_index: LexicalIndex | None = None,
+) -> tuple[list[Path], list[str], tuple[str, ...]]:
     """
     Returns:
     - New files not in database, i.e., file paths of pdfs in folder but not in database
     - Files removed from folder but not from database, i.e., ids of entries in database corresponding to files that are no longer pdf folder
+    - The hashes of those removed pdfs, including the ones recorded in the registry without any entry
+    If a `registry` is given, the diff is computed from it instead of querying the vector database.
+    Only then is a pdf whose ingestion was interrupted found again, and completed by the next sync:
+    the registry records a pdf once all its chunks are written, while the vector database has no way to tell.
+    If a `lexical_index` is given, it is first brought in line with the vector database.
     """
+    if lexical_index is not None:
+        reconcile_lexical_index_with_vector_store(
+            vector_store=vector_store, lexical_index=lexical_index
+        )
+
     pdf_filepaths = get_pdf_filepaths_in_folder(folder=pdf_folder)
     # compute folder file hash to save as a metadata and be able to check uniqueness later
     hash_to_path_dict = {
-        calculate_file_hash(file_path=pdf_path): pdf_path for pdf_path in pdf_filepaths
+        pdf_hash: pdf_path
+        for pdf_path, pdf_hash in get_file_hashes(
+            file_paths=pdf_filepaths,
+            manifest_filepath=manifest_filepath,
+            is_whole_folder=True,
+        ).items()
     }
 
-    hashes_in_database = get_pdf_hashes_in_database(vector_store=vector_store)
-
-    new_pdf_hashes_in_folder = get_hashes_of_files_in_folder_but_not_in_database(
-        hash_to_path_dict=hash_to_path_dict, hashes_in_database=hashes_in_database
-    )
+    hashes_in_folder = tuple(hash_to_path_dict.keys())
 
-    database_hashes_corresponding_to_removed_pdfs = (
-        get_hashes_of_files_in_database_but_not_in_folder(
+    if registry is not None:
+        reconcile_registry_with_vector_store(
+            vector_store=vector_store, registry=registry
+        )
+        hashes_in_database = registry.get_pdf_hashes()
+        new_pdf_hashes_in_folder = get_hashes_of_files_in_folder_but_not_in_database(
             hash_to_path_dict=hash_to_path_dict, hashes_in_database=hashes_in_database
         )
+        database_hashes_corresponding_to_removed_pdfs = (
+            get_hashes_of_files_in_database_but_not_in_folder(
+                hash_to_path_dict=hash_to_path_dict,
+                hashes_in_database=hashes_in_database,
+            )
+        )
+        return (
+            [
+                hash_to_path_dict[new_pdf_hash]
+                for new_pdf_hash in new_pdf_hashes_in_folder
+            ],
+            registry.get_chunk_ids(
+                pdf_hashes=database_hashes_corresponding_to_removed_pdfs
+            ),
+            database_hashes_corresponding_to_removed_pdfs,
+        )
+
+    # Only the pdfs in the folder are looked up in the database
+    hashes_in_database = get_pdf_hashes_in_database(
+        vector_store=vector_store, hashes=hashes_in_folder
+    )
+
+    new_pdf_hashes_in_folder = get_hashes_of_files_in_folder_but_not_in_database(
+        hash_to_path_dict=hash_to_path_dict, hashes_in_database=hashes_in_database
     )
 
     new_pdf_paths = [
         hash_to_path_dict[new_pdf_hash] for new_pdf_hash in new_pdf_hashes_in_folder
     ]
 
+    # The pdfs in the database are diffed against the folder here, rather than in a $nin filter as large as the folder,
+    # so only the entries of the removed pdfs are fetched
+    database_hashes_corresponding_to_removed_pdfs = (
+        get_hashes_of_files_in_database_but_not_in_folder(
+            hash_to_path_dict=hash_to_path_dict,
+            hashes_in_database=get_pdf_hashes_in_database(vector_store=vector_store),
+        )
+    )
     old_database_entry_ids = get_ids_of_entries_with_specific_hashes(
         vector_store=vector_store, hashes=database_hashes_corresponding_to_removed_pdfs
     )
 
-    return new_pdf_paths, old_database_entry_ids
+    return (
+        new_pdf_paths,
+        old_database_entry_ids,
+        database_hashes_corresponding_to_removed_pdfs,
+    )
 
 
 def init_and_get_vector_store(params: config.Params) -> Chroma:
@@ -205,4 +845,6 @@ def init_and_get_vector_store(params: config.Params) -> Chroma:
     _ = get_or_create_database_collection(chroma_client=db_client)
 
     # The vector store, not the collection, is what is used later
-    return get_vector_store_from_client(chroma_client=db_client, params=params)
+    return get_vector_store_from_client(
+        chroma_client=db_client, params=params, cache=get_embedding_cache(params=params)
+    )
@@ -0,0 +1,266 @@
+import asyncio
+import hashlib
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+
+from langchain_core.embeddings import Embeddings
+
+from talensinki.storage import SqliteStore
+
+
+def normalise_text(text: str) -> str:
+    # Texts that only differ in whitespace get the same embedding
+    return " ".join(text.split())
+
+
+def hash_text(text: str) -> str:
+    return hashlib.sha256(normalise_text(text).encode("utf-8")).hexdigest()
+
+
+def _vector_to_blob(vector: list[float]) -> bytes:
+    return array("f", vector).tobytes()
+
+
+def _blob_to_vector(blob: bytes) -> list[float]:
+    vector = array("f")
+    vector.frombytes(blob)
+    return vector.tolist()
+
+
+class EmbeddingCache(SqliteStore):
+    """
+    On-disk store of embedding vectors keyed by (embedding model, hash of the normalised text).
+    Holds at most `max_entries` vectors, evicting the least recently used ones.
+    """
+
+    def __init__(self, filepath: Path, max_entries: int):
+        super().__init__(filepath)
+        self.max_entries = max_entries
+        with self._connection:
+            self._connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    model TEXT NOT NULL,
+                    text_hash TEXT NOT NULL,
+                    vector BLOB NOT NULL,
+                    last_used REAL NOT NULL,
+                    PRIMARY KEY (model, text_hash)
+                )
+                """
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)"
+            )
+        # Counted once here, then kept up to date by put_many, so that writes do not scan the table.
+        # Rows written by other processes meanwhile are only counted the next time the cache is opened
+        self._count = self._count_rows("embeddings")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._count_rows("embeddings")
+
+    def get_many(self, model: str, text_hashes: list[str]) -> dict[str, list[float]]:
+        """Return the cached vectors among `text_hashes`, and mark them as recently used."""
+        now = time.time()
+        with self._lock, self._connection:
+            rows = self._execute_in_groups(
+                "SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                text_hashes,
+                parameters=(model,),
+            )
+            self._execute_in_groups(
+                "UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash IN ({placeholders})",
+                text_hashes,
+                parameters=(now, model),
+            )
+        return {text_hash: _blob_to_vector(blob) for text_hash, blob in rows}
+
+    def put_many(self, model: str, vectors: dict[str, list[float]]) -> None:
+        now = time.time()
+        text_hashes = list(vectors)
+        with self._lock, self._connection:
+            # Only vectors not stored yet add rows. Looking them up uses the primary key
+            counts_of_stored = self._execute_in_groups(
+                "SELECT COUNT(*) FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                text_hashes,
+                parameters=(model,),
+            )
+            self._count += len(text_hashes) - sum(
+                count for (count,) in counts_of_stored
+            )
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector, last_used) VALUES (?, ?, ?, ?)",
+                [
+                    (model, text_hash, _vector_to_blob(vector), now)
+                    for text_hash, vector in vectors.items()
+                ],
+            )
+            self._evict_least_recently_used()
+        return None
+
+    def _evict_least_recently_used(self) -> None:
+        excess = self._count - self.max_entries
+        if excess > 0:
+            cursor = self._connection.execute(
+                "DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+                (excess,),
+            )
+            self._count -= cursor.rowcount
+        return None
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps an embedding model so that document texts it has already embedded are served from an EmbeddingCache.
+    Only the texts missing from the cache reach the wrapped model.
+    """
+
+    def __init__(self, embeddings: Embeddings, model: str, cache: EmbeddingCache):
+        self.embeddings = embeddings
+        self.model = model
+        self.cache = cache
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        text_hashes = [hash_text(text) for text in texts]
+        vectors = self.cache.get_many(self.model, list(set(text_hashes)))
+
+        # dict keeps one text per hash, in order
+        missing_texts = {
+            text_hash: text
+            for text_hash, text in zip(text_hashes, texts)
+            if text_hash not in vectors
+        }
+        if missing_texts:
+            new_vectors = dict(
+                zip(
+                    missing_texts.keys(),
+                    self.embeddings.embed_documents(list(missing_texts.values())),
+                )
+            )
+            self.cache.put_many(self.model, new_vectors)
+            vectors.update(new_vectors)
+
+        return [vectors[text_hash] for text_hash in text_hashes]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embeddings.embed_query(text)
+
+    async def aembed_query(self, text: str) -> list[float]:
+        return await self.embeddings.aembed_query(text)
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups > 0 else 0.0
+
+    def describe(self) -> str:
+        return f"{self.hits} hits, {self.misses} misses ({self.hit_rate:.0%} hit rate)"
+
+
+class QueryEmbeddingCache:
+    """
+    In-memory LRU cache of query vectors, keyed by (embedding model, normalised query text).
+    If a `disk_cache` is given, vectors are also persisted there and survive restarts.
+    """
+
+    def __init__(self, max_entries: int, disk_cache: EmbeddingCache | None = None):
+        self.max_entries = max_entries
+        self.disk_cache = disk_cache
+        self.stats = CacheStats()
+        self._vectors: OrderedDict[tuple[str, str], list[float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._vectors)
+
+    def get(self, model: str, query: str) -> list[float] | None:
+        vector = self._get_from_memory(model=model, query=query)
+        if vector is None:
+            vector = self._get_from_disk(model=model, query=query)
+        self._count_lookup(found=vector is not None)
+        return vector
+
+    async def aget(self, model: str, query: str) -> list[float] | None:
+        """Same as get. The disk cache is read in a thread, so that sqlite does not block the event loop."""
+        vector = self._get_from_memory(model=model, query=query)
+        if vector is None and self.disk_cache is not None:
+            vector = await asyncio.to_thread(self._get_from_disk, model, query)
+        self._count_lookup(found=vector is not None)
+        return vector
+
+    def _get_from_memory(self, model: str, query: str) -> list[float] | None:
+        key = (model, normalise_text(query))
+        with self._lock:
+            if key not in self._vectors:
+                return None
+            self._vectors.move_to_end(key)
+            return self._vectors[key]
+
+    def _get_from_disk(self, model: str, query: str) -> list[float] | None:
+        if self.disk_cache is None:
+            return None
+        text_hash = hash_text(query)
+        found = self.disk_cache.get_many(model, [text_hash])
+        if text_hash not in found:
+            return None
+        self._put_in_memory(key=(model, normalise_text(query)), vector=found[text_hash])
+        return found[text_hash]
+
+    def _count_lookup(self, found: bool) -> None:
+        with self._lock:
+            if found:
+                self.stats.hits += 1
+            else:
+                self.stats.misses += 1
+        return None
+
+    def put(self, model: str, query: str, vector: list[float]) -> None:
+        self._put_in_memory(key=(model, normalise_text(query)), vector=vector)
+        if self.disk_cache is not None:
+            self.disk_cache.put_many(model, {hash_text(query): vector})
+        return None
+
+    async def aput(self, model: str, query: str, vector: list[float]) -> None:
+        """Same as put. The disk cache is written in a thread, so that sqlite does not block the event loop."""
+        self._put_in_memory(key=(model, normalise_text(query)), vector=vector)
+        if self.disk_cache is not None:
+            await asyncio.to_thread(
+                self.disk_cache.put_many, model, {hash_text(query): vector}
+            )
+        return None
+
+    def _put_in_memory(self, key: tuple[str, str], vector: list[float]) -> None:
+        with self._lock:
+            self._vectors[key] = vector
+            self._vectors.move_to_end(key)
+            while len(self._vectors) > self.max_entries:
+                self._vectors.popitem(last=False)
+        return None
+
+    def get_or_embed(
+        self, model: str, query: str, embeddings: Embeddings
+    ) -> list[float]:
+        vector = self.get(model=model, query=query)
+        if vector is None:
+            vector = embeddings.embed_query(query)
+            self.put(model=model, query=query, vector=vector)
+        return vector
+
+    async def aget_or_embed(
+        self, model: str, query: str, embeddings: Embeddings
+    ) -> list[float]:
+        vector = await self.aget(model=model, query=query)
+        if vector is None:
+            vector = await embeddings.aembed_query(query)
+            await self.aput(model=model, query=query, vector=vector)
+        return vector
@@ -0,0 +1,133 @@
+import re
+from pathlib import Path
+
+from talensinki.storage import SqliteStore
+
+# Words, keeping identifiers such as "A-113", "4.2.1" or "part_no" in one piece
+_TOKEN_PATTERN = re.compile(r"\w+(?:[-_./]\w+)*")
+
+# Words too common to tell chunks apart. Matching any of them would rank most chunks, and dilute the BM25 scores of the rest
+_STOPWORDS = frozenset(
+    """
+    a about after all an and any are as at be been before but by can could did do does for from
+    had has have how i if in into is it its may me might must my no not of on or our should so
+    than that the their them then there these they this those to was we were what when where
+    which who whom why will with would you your
+    """.split()
+)
+# Shorter alphabetic tokens, such as a stray letter, are dropped too. Numbers, like "4" in "clause 4", are kept
+_MIN_WORD_LENGTH = 2
+
+
+def tokenize_query(query: str) -> list[str]:
+    return _TOKEN_PATTERN.findall(query)
+
+
+def _is_worth_matching(token: str) -> bool:
+    return token not in _STOPWORDS and not (
+        token.isalpha() and len(token) < _MIN_WORD_LENGTH
+    )
+
+
+def build_match_expression(query: str) -> str:
+    """
+    FTS5 query matching any token of `query`, except stopwords and very short words.
+    Tokens are quoted, so user text cannot inject FTS5 syntax.
+    A quoted token is a phrase to FTS5, so an identifier like "A-113" only matches "A" directly followed by "113".
+    """
+    tokens = dict.fromkeys(token.lower() for token in tokenize_query(query))
+    return " OR ".join(
+        '"' + token.replace('"', '""') + '"'
+        for token in tokens
+        if _is_worth_matching(token)
+    )
+
+
+class LexicalIndex(SqliteStore):
+    """
+    On-disk BM25 index of the chunks in the vector database, backed by sqlite's FTS5 inverted index.
+    Chunks are keyed by the same ids as in the vector database.
+    """
+
+    def __init__(self, filepath: Path):
+        super().__init__(filepath)
+        with self._connection:
+            # Chunk ids live in a regular table sharing rowids with the full-text table,
+            # so that upserts and deletes by id use an index instead of scanning the full-text table
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS chunk_ids (rowid INTEGER PRIMARY KEY, chunk_id TEXT NOT NULL UNIQUE)"
+            )
+            self._connection.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS chunks USING fts5 (content)"
+            )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._count_rows("chunk_ids")
+
+    def upsert(self, chunk_ids: list[str], contents: list[str]) -> None:
+        with self._lock, self._connection:
+            self._delete(chunk_ids=chunk_ids)
+            for chunk_id, content in zip(chunk_ids, contents):
+                cursor = self._connection.execute(
+                    "INSERT INTO chunk_ids (chunk_id) VALUES (?)", (chunk_id,)
+                )
+                self._connection.execute(
+                    "INSERT INTO chunks (rowid, content) VALUES (?, ?)",
+                    (cursor.lastrowid, content),
+                )
+        return None
+
+    def delete(self, chunk_ids: list[str]) -> None:
+        with self._lock, self._connection:
+            self._delete(chunk_ids=chunk_ids)
+        return None
+
+    def _delete(self, chunk_ids: list[str]) -> None:
+        self._execute_in_groups(
+            "DELETE FROM chunks WHERE rowid IN (SELECT rowid FROM chunk_ids WHERE chunk_id IN ({placeholders}))",
+            chunk_ids,
+        )
+        self._execute_in_groups(
+            "DELETE FROM chunk_ids WHERE chunk_id IN ({placeholders})", chunk_ids
+        )
+        return None
+
+    def clear(self) -> None:
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM chunks")
+            self._connection.execute("DELETE FROM chunk_ids")
+        return None
+
+    def search(self, query: str, k: int) -> list[tuple[str, float]]:
+        """
+        Ids of the `k` chunks that best match `query`, with their BM25 score (lower is better, as in FTS5).
+        """
+        match_expression = build_match_expression(query)
+        if not match_expression:
+            return []
+        with self._lock:
+            return self._connection.execute(
+                """
+                SELECT chunk_ids.chunk_id, bm25(chunks) AS score
+                FROM chunks JOIN chunk_ids ON chunk_ids.rowid = chunks.rowid
+                WHERE chunks MATCH ?
+                ORDER BY score
+                LIMIT ?
+                """,
+                (match_expression, k),
+            ).fetchall()
+
+
+def reciprocal_rank_fusion(
+    rankings: list[list[str]], k: int = 60
+) -> list[tuple[str, float]]:
+    """
+    Fuse several rankings of ids into one: each id scores the sum of 1 / (k + rank) over the rankings it appears in.
+    Returns the ids sorted by decreasing fused score.
+    """
+    fused_scores: dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item_id in enumerate(ranking, start=1):
+            fused_scores[item_id] = fused_scores.get(item_id, 0.0) + 1.0 / (k + rank)
+    return sorted(fused_scores.items(), key=lambda item: item[1], reverse=True)
@@ -1,57 +1,335 @@
+import asyncio
+from collections.abc import Iterator
+from dataclasses import dataclass
+import functools
+import hashlib
 from pathlib import Path
-from typing import TypedDict
+import time
+from typing import TypedDict, cast
 
-from langchain_chroma import Chroma
+import numpy as np
 from langchain_core.documents import Document
+from langchain_core.messages import BaseMessage
 from langchain_ollama import ChatOllama
 from langgraph.graph import START, StateGraph
 
-from talensinki import config, database
+from talensinki import (
+    compression,
+    config,
+    context_packing,
+    database,
+    rerank,
+    resources,
+)
+from talensinki.answer_cache import CachedAnswer
+from talensinki.console import console
+from talensinki.lexical_index import reciprocal_rank_fusion
+
+
+# Chunks given to the LLM, unless the retrieval mode decides otherwise
+NUMBER_OF_DOCS_TO_RETRIEVE = 5
 
 
 class State(TypedDict):
     question: str
+    # Embedded once per question, before the graph runs, and shared by the answer cache and every node
+    question_embedding: list[float]
     context: list[Document]
     answer: str
 
 
+@dataclass
+class Answer:
+    text: str
+    from_cache: bool = False
+
+
+@dataclass
+class AnswerStats:
+    # Seconds since the question was asked
+    time_to_first_token: float | None = None
+    total_time: float | None = None
+    from_cache: bool = False
+
+    def describe(self) -> str:
+        if self.time_to_first_token is None or self.total_time is None:
+            return "no answer tokens were generated"
+        description = f"time to first token: {self.time_to_first_token:.2f} s, total time: {self.total_time:.2f} s"
+        if self.from_cache:
+            description += ", answer from cache"
+        return description
+
+
 def create_chat_object(params: config.Params) -> ChatOllama:
     return ChatOllama(
         model=params.ollama_llm_model,
         temperature=0.01,
         num_predict=-1,
-        num_ctx=4096,
+        num_ctx=params.num_ctx,
+        keep_alive=params.keep_alive,
         base_url="http://localhost:11434",
     )
 
 
+def embed_question(question: str, params: config.Params) -> list[float]:
+    """Embedding of the question, from the query embedding cache when it was asked before."""
+    return resources.get_query_embedding_cache(params=params).get_or_embed(
+        model=params.ollama_embedding_model,
+        query=question,
+        embeddings=resources.get_embeddings(params=params),
+    )
+
+
+async def aembed_question(question: str, params: config.Params) -> list[float]:
+    return await resources.get_query_embedding_cache(params=params).aget_or_embed(
+        model=params.ollama_embedding_model,
+        query=question,
+        embeddings=resources.get_embeddings(params=params),
+    )
+
+
+def get_number_of_docs_to_retrieve(params: config.Params) -> int:
+    # The rerank step needs more candidates than it keeps
+    if params.mmr_enabled:
+        return max(params.mmr_fetch_k, NUMBER_OF_DOCS_TO_RETRIEVE)
+    return NUMBER_OF_DOCS_TO_RETRIEVE
+
+
+def get_number_of_vector_candidates(params: config.Params) -> int:
+    # Hybrid and adaptive retrieval pick the docs to keep among more candidates
+    if params.retrieval_mode == "hybrid":
+        return params.hybrid_candidates
+    if params.retrieval_mode == "adaptive":
+        return params.adaptive_max_k
+    return get_number_of_docs_to_retrieve(params)
+
+
+# retrieve and aretrieve only differ in how they call the vector database and the lexical index.
+# What they do with the results is shared: select_docs_by_distance, fuse_hybrid_candidates and order_docs_by_ids
+
+
 def retrieve(state: State, params: config.Params) -> dict[str, list[Document]]:
-    vector_store = database.init_and_get_vector_store(params=params)
+    vector_store = resources.get_vector_store(params=params)
+    query_embedding = state["question_embedding"]
+    number_of_candidates = get_number_of_vector_candidates(params)
+
+    if params.retrieval_mode == "adaptive":
+        docs_and_distances = (
+            vector_store.similarity_search_by_vector_with_relevance_scores(
+                embedding=query_embedding, k=number_of_candidates
+            )
+        )
+        return {"context": select_docs_by_distance(docs_and_distances, params=params)}
+
+    vector_docs = vector_store.similarity_search_by_vector(
+        embedding=query_embedding, k=number_of_candidates
+    )
+    if params.retrieval_mode != "hybrid":
+        return {"context": vector_docs}
+
+    lexical_ids = retrieve_ids_by_lexical_search(state, params=params)
+    fused_ids, missing_ids = fuse_hybrid_candidates(
+        vector_docs, lexical_ids, params=params
+    )
+    fetched_docs = vector_store.get_by_ids(missing_ids) if missing_ids else []
+    return {"context": order_docs_by_ids(fused_ids, vector_docs + fetched_docs)}
+
+
+async def aretrieve(state: State, params: config.Params) -> dict[str, list[Document]]:
+    vector_store = resources.get_vector_store(params=params)
+    query_embedding = state["question_embedding"]
+    number_of_candidates = get_number_of_vector_candidates(params)
+
+    # Chroma has no native async search. Searches that langchain_chroma does not wrap run in a thread
+    if params.retrieval_mode == "adaptive":
+        docs_and_distances = await asyncio.to_thread(
+            vector_store.similarity_search_by_vector_with_relevance_scores,
+            embedding=query_embedding,
+            k=number_of_candidates,
+        )
+        return {"context": select_docs_by_distance(docs_and_distances, params=params)}
+
+    vector_search = vector_store.asimilarity_search_by_vector(
+        embedding=query_embedding, k=number_of_candidates
+    )
+    if params.retrieval_mode != "hybrid":
+        return {"context": await vector_search}
 
-    retrieved_docs = retrieve_docs_by_similarity_search(
-        state, vector_store, number_of_docs_to_retrieve=5
+    vector_docs, lexical_ids = await asyncio.gather(
+        vector_search,
+        asyncio.to_thread(retrieve_ids_by_lexical_search, state, params),
     )
+    fused_ids, missing_ids = fuse_hybrid_candidates(
+        vector_docs, lexical_ids, params=params
+    )
+    fetched_docs = await vector_store.aget_by_ids(missing_ids) if missing_ids else []
+    return {"context": order_docs_by_ids(fused_ids, vector_docs + fetched_docs)}
+
 
-    return {"context": retrieved_docs}
+def choose_number_of_docs(distances: list[float], params: config.Params) -> int:
+    """
+    How many of the chunks, sorted by increasing distance to the question, are worth keeping:
+    - the ones within params.adaptive_max_distance, but at least params.adaptive_min_k,
+    - cut at the first jump of params.adaptive_min_gap or more between consecutive distances, past the minimum.
+    """
+    number_of_docs = sum(
+        distance <= params.adaptive_max_distance for distance in distances
+    )
+    number_of_docs = max(number_of_docs, params.adaptive_min_k)
+    number_of_docs = min(number_of_docs, len(distances))
+    for i in range(params.adaptive_min_k, number_of_docs):
+        if distances[i] - distances[i - 1] >= params.adaptive_min_gap:
+            return i
+    return number_of_docs
 
 
-def retrieve_docs_by_similarity_search(
-    state: State,
-    vector_store: Chroma,
-    number_of_docs_to_retrieve: int,
+def select_docs_by_distance(
+    docs_and_distances: list[tuple[Document, float]], params: config.Params
 ) -> list[Document]:
-    return vector_store.similarity_search(
-        query=state["question"], k=number_of_docs_to_retrieve
+    distances = [distance for _, distance in docs_and_distances]
+    number_of_docs = choose_number_of_docs(distances, params=params)
+    console.print(
+        f"[dim]Retrieved {number_of_docs} of {len(distances)} candidate chunks (distances: {', '.join(f'{distance:.2f}' for distance in distances)})[/dim]"
+    )
+    return [doc for doc, _ in docs_and_distances[:number_of_docs]]
+
+
+def retrieve_ids_by_lexical_search(state: State, params: config.Params) -> list[str]:
+    lexical_results = resources.get_lexical_index().search(
+        query=state["question"], k=params.hybrid_candidates
     )
+    return [chunk_id for chunk_id, _ in lexical_results]
+
+
+def fuse_hybrid_candidates(
+    vector_docs: list[Document], lexical_ids: list[str], params: config.Params
+) -> tuple[list[str], list[str]]:
+    """
+    Best ids according to both rankings, with reciprocal rank fusion,
+    and the ones among them that are not in `vector_docs`, to fetch from the vector database.
+    Chunks that only one retriever found can still make it, e.g. an exact part number that embeddings miss.
+    """
+    vector_ids = [doc.id for doc in vector_docs if doc.id is not None]
+    fused = reciprocal_rank_fusion([vector_ids, lexical_ids])
+    fused_ids = [
+        chunk_id for chunk_id, _ in fused[: get_number_of_docs_to_retrieve(params)]
+    ]
+    missing_ids = [chunk_id for chunk_id in fused_ids if chunk_id not in vector_ids]
+    return fused_ids, missing_ids
 
 
-def combine_document_contents(state: State) -> str:
-    return "\n\n".join(doc.page_content for doc in state["context"])
+def order_docs_by_ids(ids: list[str], docs: list[Document]) -> list[Document]:
+    # Ids that are in the lexical index but no longer in the vector database are skipped
+    docs_by_id = {doc.id: doc for doc in docs}
+    return [docs_by_id[chunk_id] for chunk_id in ids if chunk_id in docs_by_id]
+
+
+def rerank_by_mmr(
+    docs: list[Document], query_embedding: list[float], params: config.Params
+) -> list[Document]:
+    """
+    Pick the docs to keep with maximal marginal relevance, from the embeddings stored in the vector database.
+    No embedding is computed: the query embedding is the one the question was embedded with, before retrieval.
+    """
+    # Adaptive retrieval already chose how many docs to keep, the rerank only orders them
+    if params.retrieval_mode == "adaptive":
+        number_of_docs_to_keep = len(docs)
+    else:
+        number_of_docs_to_keep = NUMBER_OF_DOCS_TO_RETRIEVE
+
+    doc_ids = [doc.id for doc in docs if doc.id is not None]
+    embeddings_by_id = database.get_embeddings_by_ids(
+        vector_store=resources.get_vector_store(params=params), ids=doc_ids
+    )
+    # Docs without an id or a stored embedding cannot be compared, so they are not reranked
+    if (
+        len(docs) <= 1
+        or len(doc_ids) < len(docs)
+        or any(doc_id not in embeddings_by_id for doc_id in doc_ids)
+    ):
+        return docs[:number_of_docs_to_keep]
+
+    selected_indices = rerank.maximal_marginal_relevance(
+        query_embedding=np.asarray(query_embedding),
+        candidate_embeddings=np.asarray(
+            [embeddings_by_id[doc_id] for doc_id in doc_ids]
+        ),
+        k=number_of_docs_to_keep,
+        lambda_mult=params.mmr_lambda,
+    )
+    return [docs[i] for i in selected_indices]
+
+
+def rerank_retrieved_docs(
+    state: State, params: config.Params
+) -> dict[str, list[Document]]:
+    return {
+        "context": rerank_by_mmr(
+            state["context"],
+            query_embedding=state["question_embedding"],
+            params=params,
+        )
+    }
+
+
+async def arerank_retrieved_docs(
+    state: State, params: config.Params
+) -> dict[str, list[Document]]:
+    reranked_docs = await asyncio.to_thread(
+        rerank_by_mmr, state["context"], state["question_embedding"], params
+    )
+    return {"context": reranked_docs}
+
+
+def compress_retrieved_docs(
+    state: State, params: config.Params
+) -> dict[str, list[Document]]:
+    return {
+        "context": compression.compress_documents(
+            state["context"],
+            query_embedding=state["question_embedding"],
+            embeddings=resources.get_sentence_embeddings(params=params),
+            similarity_threshold=params.compression_similarity_threshold,
+        )
+    }
+
+
+async def acompress_retrieved_docs(
+    state: State, params: config.Params
+) -> dict[str, list[Document]]:
+    compressed_docs = await asyncio.to_thread(
+        compression.compress_documents,
+        state["context"],
+        query_embedding=state["question_embedding"],
+        embeddings=resources.get_sentence_embeddings(params=params),
+        similarity_threshold=params.compression_similarity_threshold,
+    )
+    return {"context": compressed_docs}
+
+
+def combine_document_contents(state: State, params: config.Params) -> str:
+    """
+    Join the retrieved chunks, keeping only what fits in the LLM context window
+    next to the prompt and params.answer_token_reserve tokens for the answer.
+    """
+    budget_tokens = context_packing.get_context_budget_tokens(
+        prompt_without_context=params.prompt.format(
+            question=state["question"], context=""
+        ),
+        num_ctx=params.num_ctx,
+        answer_token_reserve=params.answer_token_reserve,
+    )
+    packed_docs = context_packing.pack_documents(
+        state["context"],
+        budget_tokens=budget_tokens,
+        duplicate_threshold=params.context_duplicate_threshold,
+    )
+    return context_packing.CHUNK_SEPARATOR.join(doc.page_content for doc in packed_docs)
 
 
 def generate(state: State, params: config.Params):
-    docs_content = combine_document_contents(state)
-    llm = create_chat_object(params=params)
+    docs_content = combine_document_contents(state, params=params)
+    llm = resources.get_chat_model(params=params)
     messages = params.prompt.invoke(
         {"question": state["question"], "context": docs_content}
     )
@@ -59,11 +337,32 @@ def generate(state: State, params: config.Params):
     return {"answer": response.content}
 
 
-def build_graph(params: config.Params):
+async def agenerate(state: State, params: config.Params):
+    docs_content = combine_document_contents(state, params=params)
+    llm = resources.get_chat_model(params=params)
+    messages = await params.prompt.ainvoke(
+        {"question": state["question"], "context": docs_content}
+    )
+    response = await llm.ainvoke(messages)
+    return {"answer": response.content}
+
+
+def get_graph_node_names(params: config.Params) -> list[str]:
+    # The steps run on each question, in order. Reranking and compression are optional
+    node_names = ["retrieve"]
+    if params.mmr_enabled:
+        node_names.append("rerank")
+    if params.compression_enabled:
+        node_names.append("compress")
+    node_names.append("generate")
+    return node_names
+
+
+def compile_graph(node_functions: dict, params: config.Params):
     graph_builder = StateGraph(State).add_sequence(
         [
-            ("retrieve", lambda state: retrieve(state, params=params)),
-            ("generate", lambda state: generate(state, params=params)),
+            (node_name, functools.partial(node_functions[node_name], params=params))
+            for node_name in get_graph_node_names(params)
         ]
     )
     graph_builder.add_edge(START, "retrieve")
@@ -71,15 +370,236 @@ def build_graph(params: config.Params):
     return graph
 
 
+def build_graph(params: config.Params):
+    return compile_graph(
+        {
+            "retrieve": retrieve,
+            "rerank": rerank_retrieved_docs,
+            "compress": compress_retrieved_docs,
+            "generate": generate,
+        },
+        params=params,
+    )
+
+
+def build_async_graph(params: config.Params):
+    """
+    Same graph as build_graph, with async nodes, to be run with `ainvoke`.
+    """
+    return compile_graph(
+        {
+            "retrieve": aretrieve,
+            "rerank": arerank_retrieved_docs,
+            "compress": acompress_retrieved_docs,
+            "generate": agenerate,
+        },
+        params=params,
+    )
+
+
 def save_graph_image(graph, filepath=Path("output/graph.png")) -> None:
     with open(filepath, "wb") as f:
         png_data = graph.get_graph().draw_mermaid_png()
         f.write(png_data)
 
 
-def ask_question(question: str, params: config.Params) -> str:
-    state = State(question=question, context=[], answer="")
-    graph = build_graph(params=params)
+# %% Answer cache
+
+# Params fields that do not change the answer to a question: how pdfs are ingested, cache sizes, and the answer cache itself
+ANSWER_INDEPENDENT_PARAMS = (
+    "pdf_chunking_workers",
+    "pipeline_queue_size",
+    "embedding_batch_size",
+    "embedding_batch_max_characters",
+    "embedding_cache_max_entries",
+    "query_embedding_cache_size",
+    "persist_query_embeddings",
+    "sentence_embedding_cache_max_entries",
+    "keep_alive",
+    "answer_cache_enabled",
+    "answer_cache_similarity_threshold",
+    "answer_cache_ttl_seconds",
+    "answer_cache_max_entries",
+)
+
+
+def get_answer_cache_scope(params: config.Params) -> str:
+    """
+    Cached answers are only reused for the same scope:
+    the same params (prompt template, models, retrieval settings...) and the same indexed corpus.
+    Params in ANSWER_INDEPENDENT_PARAMS are left out, so that e.g. syncing with more workers keeps the cached answers.
+    """
+    params_key = tuple(
+        (name, value)
+        for name, value in resources.params_cache_key(params)
+        if name not in ANSWER_INDEPENDENT_PARAMS
+    )
+    corpus_version = resources.get_document_registry().get_corpus_version()
+    return hashlib.sha256(
+        repr((params_key, corpus_version)).encode("utf-8")
+    ).hexdigest()
+
+
+def lookup_cached_answer(
+    question_embedding: list[float], params: config.Params
+) -> CachedAnswer | None:
+    if not params.answer_cache_enabled:
+        return None
+    return resources.get_answer_cache(params=params).lookup(
+        scope=get_answer_cache_scope(params=params),
+        question_embedding=question_embedding,
+        similarity_threshold=params.answer_cache_similarity_threshold,
+    )
+
+
+def store_answer_in_cache(
+    question: str,
+    question_embedding: list[float],
+    answer: str,
+    params: config.Params,
+) -> None:
+    # An empty answer, e.g. when the LLM streamed nothing, would be served again to every similar question
+    if not params.answer_cache_enabled or not answer:
+        return None
+    resources.get_answer_cache(params=params).store(
+        scope=get_answer_cache_scope(params=params),
+        question=question,
+        question_embedding=question_embedding,
+        answer=answer,
+    )
+    return None
+
+
+# %% Ask
+
+
+def answer_question(question: str, params: config.Params) -> Answer:
+    question_embedding = embed_question(question=question, params=params)
+    cached_answer = lookup_cached_answer(
+        question_embedding=question_embedding, params=params
+    )
+    if cached_answer is not None:
+        return Answer(text=cached_answer.answer, from_cache=True)
+
+    state = State(
+        question=question,
+        question_embedding=question_embedding,
+        context=[],
+        answer="",
+    )
+    graph = resources.get_graph(params=params)
     result = graph.invoke(state)
 
-    return result["answer"]
+    store_answer_in_cache(
+        question=question,
+        question_embedding=question_embedding,
+        answer=result["answer"],
+        params=params,
+    )
+    return Answer(text=result["answer"])
+
+
+def ask_question(question: str, params: config.Params) -> str:
+    return answer_question(question=question, params=params).text
+
+
+async def aask_question(question: str, params: config.Params) -> str:
+    # Embedded with the async ollama client. The answer cache is sqlite, so it is used in a thread, off the event loop
+    question_embedding = await aembed_question(question=question, params=params)
+    cached_answer = await asyncio.to_thread(
+        lookup_cached_answer, question_embedding, params
+    )
+    if cached_answer is not None:
+        return cached_answer.answer
+
+    state = State(
+        question=question,
+        question_embedding=question_embedding,
+        context=[],
+        answer="",
+    )
+    graph = resources.get_async_graph(params=params)
+    result = await graph.ainvoke(state)
+
+    answer: str = result["answer"]
+    await asyncio.to_thread(
+        store_answer_in_cache, question, question_embedding, answer, params
+    )
+    return answer
+
+
+async def aask_questions(
+    questions: list[str], params: config.Params, concurrency: int
+) -> list[str | BaseException]:
+    """
+    Answer all `questions`, with at most `concurrency` of them in flight at once.
+    Answers come back in the order of `questions`. A question that fails gets its exception instead of an answer.
+    """
+    if concurrency < 1:
+        raise ValueError(
+            f"concurrency must be at least 1, and you chose {concurrency}."
+        )
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def ask_with_semaphore(question: str) -> str:
+        async with semaphore:
+            return await aask_question(question=question, params=params)
+
+    return await asyncio.gather(
+        *(ask_with_semaphore(question) for question in questions),
+        return_exceptions=True,
+    )
+
+
+def stream_answer(
+    question: str, params: config.Params, stats: AnswerStats | None = None
+) -> Iterator[str]:
+    """
+    Yield the answer token by token, as the LLM in the generate node produces them.
+    If `stats` is given, the time to first token and the total time are written to it.
+    """
+    if stats is None:
+        stats = AnswerStats()
+    start_time = time.perf_counter()
+
+    question_embedding = embed_question(question=question, params=params)
+    cached_answer = lookup_cached_answer(
+        question_embedding=question_embedding, params=params
+    )
+    if cached_answer is not None:
+        stats.from_cache = True
+        stats.time_to_first_token = time.perf_counter() - start_time
+        yield cached_answer.answer
+        stats.total_time = time.perf_counter() - start_time
+        return
+
+    state = State(
+        question=question,
+        question_embedding=question_embedding,
+        context=[],
+        answer="",
+    )
+    graph = resources.get_graph(params=params)
+
+    tokens = []
+    for stream_item in graph.stream(state, stream_mode="messages"):
+        # In "messages" mode, each item is a message chunk and the metadata of the node that produced it
+        message_chunk, metadata = cast(tuple[BaseMessage, dict], stream_item)
+        if metadata.get("langgraph_node") != "generate":
+            continue
+        token = message_chunk.content
+        # ollama streams text only. Other content would be a list of blocks
+        if not isinstance(token, str) or not token:
+            continue
+        if stats.time_to_first_token is None:
+            stats.time_to_first_token = time.perf_counter() - start_time
+        tokens.append(token)
+        yield token
+    stats.total_time = time.perf_counter() - start_time
+
+    store_answer_in_cache(
+        question=question,
+        question_embedding=question_embedding,
+        answer="".join(tokens),
+        params=params,
+    )
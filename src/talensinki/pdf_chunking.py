@@ -1,14 +1,18 @@
 from pathlib import Path
+from collections import deque
+from collections.abc import Iterator
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import islice
+import multiprocessing
 from typing import Protocol, runtime_checkable
 
-from langchain_community.document_loaders import PyPDFLoader
-from langchain.schema import Document
-from langchain_unstructured import UnstructuredLoader
-from langchain_community.vectorstores.utils import filter_complex_metadata
+from langchain_core.documents import Document
 
 from rich.progress import track
+from rich.text import Text
 
-from talensinki import config, database
+from talensinki import config
 from talensinki.console import console
 
 
@@ -23,7 +27,13 @@ class PDFChunker(Protocol):
         ...
 
 
+# Each chunker imports its own loader, so that only the chunker in use is loaded.
+# The unstructured hi-res stack, in particular, takes seconds to import
+
+
 def chunk_pdf_by_pages(pdf_path: Path) -> list[Document]:
+    from langchain_community.document_loaders import PyPDFLoader
+
     loader = PyPDFLoader(str(pdf_path))
     pages = []
     for page in loader.lazy_load():
@@ -33,18 +43,23 @@ def chunk_pdf_by_pages(pdf_path: Path) -> list[Document]:
 
 
 def assign_source_pdf_metadata_info_to_document(
-    doc: Document, source_pdf_hash: str
+    doc: Document, source_pdf_hash: str, pdf_chunking_method: str, chunk_index: int
 ) -> Document:
     return Document(
         page_content=doc.page_content,
         metadata={
             "source_pdf_hash": source_pdf_hash,
+            "pdf_chunking_method": pdf_chunking_method,
+            "chunk_index": chunk_index,
             **doc.metadata,  # This preserves existing metadata
         },
     )
 
 
 def chunk_pdf_by_sections(pdf_path: Path) -> list[Document]:
+    from langchain_community.vectorstores.utils import filter_complex_metadata
+    from langchain_unstructured import UnstructuredLoader
+
     loader = UnstructuredLoader(
         file_path=pdf_path,
         strategy="hi_res",
@@ -65,27 +80,201 @@ def chunk_pdf_by_sections(pdf_path: Path) -> list[Document]:
     return filtered_docs
 
 
-def chunk_pdfs_with_metadata(
-    pdf_paths: list[Path], params: config.Params
-) -> list[list[Document]]:
-    chunks_with_metadata = []
+def chunk_single_pdf_with_metadata(
+    pdf_path: Path,
+    pdf_chunker: PDFChunker,
+    pdf_chunking_method: str,
+    pdf_file_hash: str,
+) -> list[Document]:
+    """
+    Chunk one PDF and tag every chunk with the hash of its source PDF, the chunker and its position in the PDF.
+    Takes the chunker instead of the Params so that it can be sent to a worker process.
+    """
+    console.print(
+        f"Chunking the PDF {pdf_path} using the {pdf_chunking_method} chunking function..."
+    )
+    pdf_chunks = pdf_chunker(pdf_path)
+    return [
+        assign_source_pdf_metadata_info_to_document(
+            doc=pdf_chunk,
+            source_pdf_hash=pdf_file_hash,
+            pdf_chunking_method=pdf_chunking_method,
+            chunk_index=chunk_index,
+        )
+        for chunk_index, pdf_chunk in enumerate(pdf_chunks)
+    ]
+
 
+def _chunk_single_pdf_in_worker(
+    pdf_path: Path,
+    pdf_chunker: PDFChunker,
+    pdf_chunking_method: str,
+    pdf_file_hash: str,
+) -> tuple[list[Document], str]:
+    """
+    Runs in a worker process. What the chunker prints is captured and returned with the chunks,
+    for the parent process to print, instead of interleaving with the output of the other workers.
+    """
+    with console.capture() as capture:
+        pdf_chunks = chunk_single_pdf_with_metadata(
+            pdf_path=pdf_path,
+            pdf_chunker=pdf_chunker,
+            pdf_chunking_method=pdf_chunking_method,
+            pdf_file_hash=pdf_file_hash,
+        )
+    return pdf_chunks, capture.get()
+
+
+def _report_chunking_failure(pdf_path: Path, error: Exception) -> None:
+    console.print(
+        f"[red]Could not chunk the PDF {pdf_path} (exception: {error}). Skipping it.[/red]"
+    )
+    return None
+
+
+def _iter_chunk_pdfs_serially(
+    pdf_paths: list[Path],
+    params: config.Params,
+    pdf_hashes: dict[Path, str],
+    failed_pdf_hashes: set[str],
+) -> Iterator[list[Document]]:
+    pdf_chunker = AVAILABLE_PDF_CHUNKERS[params.pdf_chunking_method]
     for pdf_path in pdf_paths:
-        console.print(
-            f"Chunking the PDF {pdf_path} using the {params.pdf_chunking_method} chunking function..."
+        try:
+            pdf_chunks = chunk_single_pdf_with_metadata(
+                pdf_path=pdf_path,
+                pdf_chunker=pdf_chunker,
+                pdf_chunking_method=params.pdf_chunking_method,
+                pdf_file_hash=pdf_hashes[pdf_path],
+            )
+        except Exception as e:
+            _report_chunking_failure(pdf_path=pdf_path, error=e)
+            failed_pdf_hashes.add(pdf_hashes[pdf_path])
+            pdf_chunks = []
+        yield pdf_chunks
+
+
+def _create_process_pool(workers: int) -> ProcessPoolExecutor:
+    # The pool is created from the prefetch thread, while rich and Chroma run threads of their own.
+    # Forking a multi-threaded process can deadlock the child, so workers are spawned. The chunkers are module-level, so they pickle
+    return ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+    )
+
+
+def _iter_chunk_pdfs_in_process_pool(
+    pdf_paths: list[Path],
+    params: config.Params,
+    pdf_hashes: dict[Path, str],
+    failed_pdf_hashes: set[str],
+) -> Iterator[list[Document]]:
+    """
+    Fan the chunker out over a process pool.
+    At most `pdf_chunking_workers * PDF_CHUNKING_TASKS_PER_WORKER` PDFs are in flight at any time,
+    and results are yielded in the same order as `pdf_paths`.
+    If a worker dies, e.g. killed for running out of memory, the PDFs in flight fail, and a new pool takes the next ones.
+    """
+    # The chunker is looked up here and sent to the workers, which only need to unpickle it
+    pdf_chunker = AVAILABLE_PDF_CHUNKERS[params.pdf_chunking_method]
+    max_in_flight = params.pdf_chunking_workers * config.PDF_CHUNKING_TASKS_PER_WORKER
+    remaining_pdf_paths = iter(pdf_paths)
+    in_flight: deque[tuple[Path, Future[tuple[list[Document], str]]]] = deque()
+    executor = _create_process_pool(workers=params.pdf_chunking_workers)
+
+    def submit(pdf_path: Path) -> None:
+        nonlocal executor
+        arguments = (
+            pdf_path,
+            pdf_chunker,
+            params.pdf_chunking_method,
+            pdf_hashes[pdf_path],
         )
-        pdf_file_hash = database.calculate_file_hash(file_path=pdf_path)
-        pdf_chunks = AVAILABLE_PDF_CHUNKERS[params.pdf_chunking_method](pdf_path)
-        chunks_with_metadata.append(
-            [
-                assign_source_pdf_metadata_info_to_document(
-                    doc=pdf_chunk, source_pdf_hash=pdf_file_hash
-                )
-                for pdf_chunk in pdf_chunks
-            ]
+        try:
+            future = executor.submit(_chunk_single_pdf_in_worker, *arguments)
+        except BrokenProcessPool:
+            # The futures of the broken pool fail on their own, and are reported in turn
+            executor.shutdown(wait=False, cancel_futures=True)
+            executor = _create_process_pool(workers=params.pdf_chunking_workers)
+            future = executor.submit(_chunk_single_pdf_in_worker, *arguments)
+        in_flight.append((pdf_path, future))
+        return None
+
+    try:
+        for pdf_path in islice(remaining_pdf_paths, max_in_flight):
+            submit(pdf_path)
+
+        while in_flight:
+            pdf_path, future = in_flight.popleft()
+            # Refill the pool before blocking, so workers keep busy while the caller consumes this result
+            for next_pdf_path in islice(remaining_pdf_paths, 1):
+                submit(next_pdf_path)
+
+            try:
+                pdf_chunks, worker_output = future.result()
+            except Exception as e:
+                _report_chunking_failure(pdf_path=pdf_path, error=e)
+                failed_pdf_hashes.add(pdf_hashes[pdf_path])
+                pdf_chunks = []
+            else:
+                console.print(Text.from_ansi(worker_output), end="")
+            yield pdf_chunks
+    except BaseException:
+        # Mostly GeneratorExit, when the consumer stopped early, e.g. because the embedder failed.
+        # The queued pdfs are dropped instead of waited for. The pdfs being chunked right now finish in the background
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    executor.shutdown()
+
+
+def iter_chunk_pdfs_with_metadata(
+    pdf_paths: list[Path],
+    params: config.Params,
+    pdf_hashes: dict[Path, str] | None = None,
+    failed_pdf_hashes: set[str] | None = None,
+) -> Iterator[list[Document]]:
+    """
+    Lazily yield the chunks of each PDF, in the order of `pdf_paths`.
+    PDFs that fail to chunk are reported and yield no chunks, without stopping the rest.
+    Their hashes are added to `failed_pdf_hashes` if given, which tells them apart from PDFs without any text.
+    Pass the `pdf_hashes` computed during the sync check to avoid looking them up again.
+    """
+    if pdf_hashes is None:
+        # Imported here: spawned workers import this module, and do not need chromadb
+        from talensinki import database
+
+        pdf_hashes = database.get_file_hashes(file_paths=pdf_paths)
+    if failed_pdf_hashes is None:
+        failed_pdf_hashes = set()
+
+    if params.pdf_chunking_workers > 1 and len(pdf_paths) > 1:
+        return _iter_chunk_pdfs_in_process_pool(
+            pdf_paths=pdf_paths,
+            params=params,
+            pdf_hashes=pdf_hashes,
+            failed_pdf_hashes=failed_pdf_hashes,
         )
+    return _iter_chunk_pdfs_serially(
+        pdf_paths=pdf_paths,
+        params=params,
+        pdf_hashes=pdf_hashes,
+        failed_pdf_hashes=failed_pdf_hashes,
+    )
 
-    return chunks_with_metadata
+
+def chunk_pdfs_with_metadata(
+    pdf_paths: list[Path],
+    params: config.Params,
+    pdf_hashes: dict[Path, str] | None = None,
+    failed_pdf_hashes: set[str] | None = None,
+) -> list[list[Document]]:
+    return list(
+        iter_chunk_pdfs_with_metadata(
+            pdf_paths=pdf_paths,
+            params=params,
+            pdf_hashes=pdf_hashes,
+            failed_pdf_hashes=failed_pdf_hashes,
+        )
+    )
 
 
 AVAILABLE_PDF_CHUNKERS: dict[str, PDFChunker] = {
@@ -0,0 +1,100 @@
+import queue
+import threading
+from collections.abc import Generator, Iterable, Iterator
+from dataclasses import dataclass
+from typing import TypeVar
+
+from langchain.schema import Document
+
+T = TypeVar("T")
+
+_END_OF_STREAM = object()
+
+
+@dataclass
+class _ProducerError:
+    error: BaseException
+
+
+def prefetch_in_background(items: Iterable[T], max_buffered: int) -> Iterator[T]:
+    """
+    Consume `items` in a background thread while the caller works on the previous ones.
+    At most `max_buffered` items wait in memory: when the buffer is full the producer blocks (backpressure).
+    Exceptions raised while producing are re-raised in the caller.
+    If the caller stops early, `items` is closed if it is a generator, so that it can release what it holds, e.g. a process pool.
+    """
+    buffer: queue.Queue = queue.Queue(maxsize=max_buffered)
+    stop = threading.Event()
+
+    def put(item: object) -> bool:
+        # Poll the stop flag, so the producer does not block forever if the consumer goes away
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce() -> None:
+        try:
+            for item in items:
+                if not put(item):
+                    # Closed here, in the thread that runs it: a generator cannot be closed while another thread runs it
+                    if isinstance(items, Generator):
+                        items.close()
+                    return None
+        except BaseException as e:
+            put(_ProducerError(error=e))
+            return None
+        put(_END_OF_STREAM)
+        return None
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+
+    try:
+        while True:
+            item = buffer.get()
+            if item is _END_OF_STREAM:
+                return
+            if isinstance(item, _ProducerError):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+
+
+def batch_documents(
+    documents_per_pdf: Iterable[list[Document]],
+    max_documents: int,
+    max_characters: int | None = None,
+) -> Iterator[list[Document]]:
+    """
+    Re-slice the chunks of consecutive pdfs into batches of `max_documents` chunks.
+    Batches ignore pdf boundaries, so the batch size does not depend on pdf size.
+    If `max_characters` is given, a batch is also closed before its total text length would exceed it.
+    A single chunk longer than `max_characters` goes in a batch of its own.
+    """
+    batch: list[Document] = []
+    batch_characters = 0
+
+    for documents in documents_per_pdf:
+        for document in documents:
+            document_characters = len(document.page_content)
+            if batch and (
+                len(batch) >= max_documents
+                or (
+                    max_characters is not None
+                    and batch_characters + document_characters > max_characters
+                )
+            ):
+                yield batch
+                batch = []
+                batch_characters = 0
+
+            batch.append(document)
+            batch_characters += document_characters
+
+    if batch:
+        yield batch
@@ -0,0 +1,181 @@
+import time
+import uuid
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from talensinki.storage import SqliteStore
+
+
+@dataclass
+class DocumentRecord:
+    # One ingested pdf, and the database entries it produced
+    pdf_hash: str
+    pdf_path: str
+    chunk_ids: list[str]
+    pdf_chunking_method: str
+    # None if unknown, for pdfs recorded from the vector database entries
+    embedding_model: str | None
+    ingested_at: float = field(default_factory=time.time)
+
+    @property
+    def chunk_count(self) -> int:
+        return len(self.chunk_ids)
+
+
+class DocumentRegistry(SqliteStore):
+    """
+    SQLite record of the pdfs in the vector database, next to it on disk.
+    It answers "which pdfs are indexed, and with which chunk ids" without scanning the vector database.
+    """
+
+    def __init__(self, filepath: Path):
+        super().__init__(filepath)
+        with self._connection:
+            self._connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS documents (
+                    pdf_hash TEXT PRIMARY KEY,
+                    pdf_path TEXT NOT NULL,
+                    chunk_count INTEGER NOT NULL,
+                    pdf_chunking_method TEXT NOT NULL,
+                    embedding_model TEXT,
+                    ingested_at REAL NOT NULL
+                )
+                """
+            )
+            self._connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS chunks (
+                    chunk_id TEXT PRIMARY KEY,
+                    pdf_hash TEXT NOT NULL
+                )
+                """
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS chunks_pdf_hash ON chunks (pdf_hash)"
+            )
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+            )
+            self._connection.execute(
+                "INSERT OR IGNORE INTO meta (key, value) VALUES ('corpus_version', ?)",
+                (uuid.uuid4().hex,),
+            )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._count_rows("documents")
+
+    def record(self, document: DocumentRecord) -> None:
+        """Add a pdf, or replace its previous record."""
+        with self._lock, self._connection:
+            self._delete(pdf_hashes=[document.pdf_hash])
+            self._connection.execute(
+                "INSERT INTO documents (pdf_hash, pdf_path, chunk_count, pdf_chunking_method, embedding_model, ingested_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    document.pdf_hash,
+                    document.pdf_path,
+                    document.chunk_count,
+                    document.pdf_chunking_method,
+                    document.embedding_model,
+                    document.ingested_at,
+                ),
+            )
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO chunks (chunk_id, pdf_hash) VALUES (?, ?)",
+                [(chunk_id, document.pdf_hash) for chunk_id in document.chunk_ids],
+            )
+            self._bump_corpus_version()
+        return None
+
+    def get_corpus_version(self) -> str:
+        """
+        Token that changes whenever pdfs are added or removed,
+        so that anything derived from the indexed corpus (e.g. cached answers) can be invalidated.
+        """
+        with self._lock:
+            (corpus_version,) = self._connection.execute(
+                "SELECT value FROM meta WHERE key = 'corpus_version'"
+            ).fetchone()
+        return str(corpus_version)
+
+    def get(self, pdf_hash: str) -> DocumentRecord | None:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT pdf_hash, pdf_path, pdf_chunking_method, embedding_model, ingested_at FROM documents WHERE pdf_hash = ?",
+                (pdf_hash,),
+            ).fetchone()
+            if row is None:
+                return None
+            chunk_ids = [
+                chunk_id
+                for (chunk_id,) in self._connection.execute(
+                    "SELECT chunk_id FROM chunks WHERE pdf_hash = ? ORDER BY rowid",
+                    (pdf_hash,),
+                )
+            ]
+        return DocumentRecord(
+            pdf_hash=row[0],
+            pdf_path=row[1],
+            chunk_ids=chunk_ids,
+            pdf_chunking_method=row[2],
+            embedding_model=row[3],
+            ingested_at=row[4],
+        )
+
+    def get_pdf_hashes(self) -> tuple[str, ...]:
+        with self._lock:
+            return tuple(
+                pdf_hash
+                for (pdf_hash,) in self._connection.execute(
+                    "SELECT pdf_hash FROM documents"
+                )
+            )
+
+    def get_chunk_ids(self, pdf_hashes: tuple[str, ...]) -> list[str]:
+        with self._lock:
+            rows = self._execute_in_groups(
+                "SELECT chunk_id FROM chunks WHERE pdf_hash IN ({placeholders}) ORDER BY rowid",
+                pdf_hashes,
+            )
+        return [chunk_id for (chunk_id,) in rows]
+
+    def remove(self, pdf_hashes: tuple[str, ...]) -> None:
+        with self._lock, self._connection:
+            self._delete(pdf_hashes=list(pdf_hashes))
+        return None
+
+    def remove_documents_with_chunk_ids(self, chunk_ids: list[str]) -> None:
+        """Forget the pdfs that any of `chunk_ids` belongs to."""
+        with self._lock, self._connection:
+            rows = self._execute_in_groups(
+                "SELECT DISTINCT pdf_hash FROM chunks WHERE chunk_id IN ({placeholders})",
+                chunk_ids,
+            )
+            self._delete(pdf_hashes=list({pdf_hash for (pdf_hash,) in rows}))
+        return None
+
+    def clear(self) -> None:
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM documents")
+            self._connection.execute("DELETE FROM chunks")
+            self._bump_corpus_version()
+        return None
+
+    def _bump_corpus_version(self) -> None:
+        self._connection.execute(
+            "UPDATE meta SET value = ? WHERE key = 'corpus_version'",
+            (uuid.uuid4().hex,),
+        )
+        return None
+
+    def _delete(self, pdf_hashes: list[str]) -> None:
+        if pdf_hashes:
+            self._bump_corpus_version()
+        self._execute_in_groups(
+            "DELETE FROM documents WHERE pdf_hash IN ({placeholders})", pdf_hashes
+        )
+        self._execute_in_groups(
+            "DELETE FROM chunks WHERE pdf_hash IN ({placeholders})", pdf_hashes
+        )
+        return None
@@ -0,0 +1,47 @@
+import numpy as np
+
+from talensinki.similarity import normalise_rows
+
+
+def maximal_marginal_relevance(
+    query_embedding: np.ndarray,
+    candidate_embeddings: np.ndarray,
+    k: int,
+    lambda_mult: float,
+) -> list[int]:
+    """
+    Indices of `k` candidates chosen one at a time, each maximising
+    lambda_mult * similarity to the query - (1 - lambda_mult) * highest similarity to the candidates already chosen.
+    lambda_mult=1 ranks by relevance only, lambda_mult=0 by diversity only.
+    The candidate similarities are computed once, as a matrix product, so each step is a vector update.
+    """
+    number_of_candidates = len(candidate_embeddings)
+    if number_of_candidates == 0 or k <= 0:
+        return []
+
+    candidates = normalise_rows(np.asarray(candidate_embeddings, dtype=np.float32))
+    query = normalise_rows(np.asarray(query_embedding, dtype=np.float32)[None, :])[0]
+    similarities_to_query = candidates @ query
+    similarities_between_candidates = candidates @ candidates.T
+
+    selected = [int(np.argmax(similarities_to_query))]
+    max_similarities_to_selected = similarities_between_candidates[selected[0]].copy()
+    is_available = np.ones(number_of_candidates, dtype=bool)
+    is_available[selected[0]] = False
+
+    while len(selected) < min(k, number_of_candidates):
+        scores = (
+            lambda_mult * similarities_to_query
+            - (1 - lambda_mult) * max_similarities_to_selected
+        )
+        scores[~is_available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        is_available[best] = False
+        np.maximum(
+            max_similarities_to_selected,
+            similarities_between_candidates[best],
+            out=max_similarities_to_selected,
+        )
+
+    return selected
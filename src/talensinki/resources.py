@@ -0,0 +1,225 @@
+"""
+Process-wide cache of the objects that are expensive to build: the Chroma client, vector stores, chat models and compiled graphs.
+The CLI, the Streamlit app and batch runs all get them from here, so they are built once per process and set of params.
+"""
+
+import copy
+import threading
+from dataclasses import fields
+from typing import TYPE_CHECKING
+
+from chromadb.api import ClientAPI
+from langchain.prompts import PromptTemplate
+from langchain_chroma import Chroma
+from langchain_core.embeddings import Embeddings
+
+from talensinki import answer_cache, config, database, embedding_cache
+from talensinki.lexical_index import LexicalIndex
+from talensinki.registry import DocumentRegistry
+
+# llm, and with it langgraph, is imported when a chat model or graph is first needed, so that syncing the database does not load it
+if TYPE_CHECKING:
+    from langchain_ollama import ChatOllama
+    from langgraph.graph.state import CompiledStateGraph
+
+_lock = threading.RLock()
+_chroma_client: ClientAPI | None = None
+_vector_stores: dict[tuple, Chroma] = {}
+_embedding_caches: dict[tuple, embedding_cache.EmbeddingCache] = {}
+_sentence_embedding_caches: dict[tuple, embedding_cache.EmbeddingCache] = {}
+_sentence_embeddings: dict[tuple, Embeddings] = {}
+_chat_models: dict[tuple, "ChatOllama"] = {}
+_graphs: dict[tuple, "CompiledStateGraph"] = {}
+_async_graphs: dict[tuple, "CompiledStateGraph"] = {}
+_query_embedding_caches: dict[tuple, embedding_cache.QueryEmbeddingCache] = {}
+_answer_caches: dict[tuple, answer_cache.AnswerCache] = {}
+_document_registry: DocumentRegistry | None = None
+_lexical_index: LexicalIndex | None = None
+
+# Params fields each resource depends on. Graphs depend on all of them
+VECTOR_STORE_PARAMS = (
+    "ollama_embedding_model",
+    "embedding_cache_max_entries",
+    "keep_alive",
+)
+EMBEDDING_CACHE_PARAMS = ("embedding_cache_max_entries",)
+SENTENCE_EMBEDDING_CACHE_PARAMS = ("sentence_embedding_cache_max_entries",)
+SENTENCE_EMBEDDINGS_PARAMS = (
+    "ollama_embedding_model",
+    "sentence_embedding_cache_max_entries",
+    "keep_alive",
+)
+CHAT_MODEL_PARAMS = ("ollama_llm_model", "num_ctx", "keep_alive")
+QUERY_EMBEDDING_CACHE_PARAMS = (
+    "query_embedding_cache_size",
+    "persist_query_embeddings",
+)
+ANSWER_CACHE_PARAMS = ("answer_cache_max_entries", "answer_cache_ttl_seconds")
+
+
+def params_cache_key(
+    params: config.Params, field_names: tuple[str, ...] | None = None
+) -> tuple:
+    """Hashable snapshot of the params fields, or only of `field_names` if given."""
+    key = []
+    for params_field in fields(params):
+        if field_names is not None and params_field.name not in field_names:
+            continue
+        value = getattr(params, params_field.name)
+        if isinstance(value, PromptTemplate):
+            value = value.template
+        key.append((params_field.name, value))
+    return tuple(key)
+
+
+def get_chroma_client() -> ClientAPI:
+    global _chroma_client
+    with _lock:
+        if _chroma_client is None:
+            _chroma_client = database.initialize_chroma_database_client()
+            # Make sure that the collection exists, once per process
+            database.get_or_create_database_collection(chroma_client=_chroma_client)
+        return _chroma_client
+
+
+def get_embedding_cache(params: config.Params) -> embedding_cache.EmbeddingCache:
+    # Keyed by model internally, so vector stores of different embedding models share it, and its sqlite connection
+    key = params_cache_key(params, field_names=EMBEDDING_CACHE_PARAMS)
+    with _lock:
+        if key not in _embedding_caches:
+            _embedding_caches[key] = database.get_embedding_cache(params=params)
+        return _embedding_caches[key]
+
+
+def get_vector_store(params: config.Params) -> Chroma:
+    key = params_cache_key(params, field_names=VECTOR_STORE_PARAMS)
+    with _lock:
+        if key not in _vector_stores:
+            _vector_stores[key] = database.get_vector_store_from_client(
+                chroma_client=get_chroma_client(),
+                params=params,
+                cache=get_embedding_cache(params=params),
+            )
+        return _vector_stores[key]
+
+
+def get_embeddings(params: config.Params) -> Embeddings:
+    embeddings = get_vector_store(params=params).embeddings
+    assert embeddings is not None
+    return embeddings
+
+
+def get_sentence_embeddings(params: config.Params) -> Embeddings:
+    """
+    Embeddings for the sentences of retrieved chunks, when compressing them.
+    Cached apart from chunk embeddings, so that the many sentence vectors do not evict the chunk ones.
+    """
+    cache_key = params_cache_key(params, field_names=SENTENCE_EMBEDDING_CACHE_PARAMS)
+    key = params_cache_key(params, field_names=SENTENCE_EMBEDDINGS_PARAMS)
+    with _lock:
+        if cache_key not in _sentence_embedding_caches:
+            _sentence_embedding_caches[cache_key] = (
+                database.get_sentence_embedding_cache(params=params)
+            )
+        if key not in _sentence_embeddings:
+            _sentence_embeddings[key] = database.get_cached_embeddings(
+                params=params, cache=_sentence_embedding_caches[cache_key]
+            )
+        return _sentence_embeddings[key]
+
+
+def get_query_embedding_cache(
+    params: config.Params,
+) -> embedding_cache.QueryEmbeddingCache:
+    # The cache is keyed by embedding model internally, so one per size and persistence setting is enough
+    key = params_cache_key(params, field_names=QUERY_EMBEDDING_CACHE_PARAMS)
+    with _lock:
+        if key not in _query_embedding_caches:
+            disk_cache = None
+            if params.persist_query_embeddings:
+                disk_cache = embedding_cache.EmbeddingCache(
+                    filepath=config.QUERY_EMBEDDING_CACHE_FILEPATH,
+                    max_entries=params.query_embedding_cache_size,
+                )
+            _query_embedding_caches[key] = embedding_cache.QueryEmbeddingCache(
+                max_entries=params.query_embedding_cache_size, disk_cache=disk_cache
+            )
+        return _query_embedding_caches[key]
+
+
+def get_answer_cache(params: config.Params) -> answer_cache.AnswerCache:
+    key = params_cache_key(params, field_names=ANSWER_CACHE_PARAMS)
+    with _lock:
+        if key not in _answer_caches:
+            _answer_caches[key] = answer_cache.AnswerCache(
+                filepath=config.ANSWER_CACHE_FILEPATH,
+                max_entries=params.answer_cache_max_entries,
+                ttl_seconds=params.answer_cache_ttl_seconds,
+            )
+        return _answer_caches[key]
+
+
+def get_document_registry() -> DocumentRegistry:
+    global _document_registry
+    with _lock:
+        if _document_registry is None:
+            _document_registry = database.get_document_registry()
+        return _document_registry
+
+
+def get_lexical_index() -> LexicalIndex:
+    global _lexical_index
+    with _lock:
+        if _lexical_index is None:
+            _lexical_index = database.get_lexical_index()
+        return _lexical_index
+
+
+def get_chat_model(params: config.Params) -> "ChatOllama":
+    from talensinki import llm
+
+    key = params_cache_key(params, field_names=CHAT_MODEL_PARAMS)
+    with _lock:
+        if key not in _chat_models:
+            _chat_models[key] = llm.create_chat_object(params=params)
+        return _chat_models[key]
+
+
+def get_graph(params: config.Params) -> "CompiledStateGraph":
+    from talensinki import llm
+
+    key = params_cache_key(params)
+    with _lock:
+        if key not in _graphs:
+            # The graph keeps a reference to the params. Give it a copy, so later changes to `params` go to a new graph
+            _graphs[key] = llm.build_graph(params=copy.copy(params))
+        return _graphs[key]
+
+
+def get_async_graph(params: config.Params) -> "CompiledStateGraph":
+    from talensinki import llm
+
+    key = params_cache_key(params)
+    with _lock:
+        if key not in _async_graphs:
+            _async_graphs[key] = llm.build_async_graph(params=copy.copy(params))
+        return _async_graphs[key]
+
+
+def clear() -> None:
+    """Drop every cached resource. They are rebuilt on next use."""
+    global _chroma_client, _document_registry, _lexical_index
+    with _lock:
+        _answer_caches.clear()
+        _document_registry = None
+        _lexical_index = None
+        _graphs.clear()
+        _async_graphs.clear()
+        _query_embedding_caches.clear()
+        _chat_models.clear()
+        _vector_stores.clear()
+        _embedding_caches.clear()
+        _sentence_embeddings.clear()
+        _sentence_embedding_caches.clear()
+        _chroma_client = None
+    return None
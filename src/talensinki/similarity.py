@@ -0,0 +1,17 @@
+import numpy as np
+
+
+def normalise_rows(matrix: np.ndarray) -> np.ndarray:
+    """Rows of `matrix` scaled to unit length. All-zero rows stay zero."""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    normalised_matrix: np.ndarray = matrix / norms
+    return normalised_matrix
+
+
+def cosine_similarities(matrix: np.ndarray, vector: np.ndarray) -> np.ndarray:
+    """Cosine similarity of each row of `matrix` to `vector`, 0 where either is all zeros."""
+    similarities: np.ndarray = (
+        normalise_rows(matrix) @ normalise_rows(vector[None, :])[0]
+    )
+    return similarities
@@ -0,0 +1,60 @@
+import os
+import sqlite3
+import threading
+from collections.abc import Iterator, Sequence
+from pathlib import Path
+
+# Keeps SQL statements below sqlite's limit on the number of bound variables
+MAX_VALUES_PER_QUERY = 500
+
+
+def split_into_groups(
+    values: Sequence[str], group_size: int = MAX_VALUES_PER_QUERY
+) -> Iterator[list[str]]:
+    for start in range(0, len(values), group_size):
+        yield list(values[start : start + group_size])
+
+
+def write_text_atomically(filepath: Path, text: str) -> None:
+    # Write to a temporary file first, so that an interrupted write never leaves a corrupt file
+    filepath.parent.mkdir(parents=True, exist_ok=True)
+    temporary_filepath = filepath.with_suffix(".tmp")
+    temporary_filepath.write_text(text)
+    os.replace(temporary_filepath, filepath)
+    return None
+
+
+class SqliteStore:
+    """
+    Base of the on-disk sqlite stores: one connection, shared by all threads, and the lock that serialises its use.
+    Public methods take the lock, and also open a transaction (`with self._lock, self._connection`) when they write.
+    Underscore methods run inside them, so they never take the lock themselves.
+    """
+
+    def __init__(self, filepath: Path):
+        self.filepath = filepath
+
+        filepath.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(filepath, check_same_thread=False)
+
+    def _count_rows(self, table: str) -> int:
+        (count,) = self._connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()
+        return int(count)
+
+    def _execute_in_groups(
+        self, statement: str, values: Sequence[str], parameters: tuple = ()
+    ) -> list[tuple]:
+        """
+        Run `statement` once per group of `values`, and return the rows of all groups.
+        `statement` has a `{placeholders}` field for the values of a group, bound after `parameters`.
+        """
+        rows: list[tuple] = []
+        for group in split_into_groups(values):
+            placeholders = ",".join("?" * len(group))
+            rows.extend(
+                self._connection.execute(
+                    statement.format(placeholders=placeholders), (*parameters, *group)
+                ).fetchall()
+            )
+        return rows
@@ -1,10 +1,56 @@
 import streamlit as st
 import pandas as pd
 import re
+from typing import get_args
 
-from talensinki import database, config, llm, checks, templates
+from talensinki import database, config, llm, checks, templates, resources
+from talensinki.warmup import start_warm_up_in_background
 from talensinki.checks import HealthCheckResult
 
+# Health checks open the database and ping ollama. They run at most once per TTL, or when asked for
+HEALTH_CHECKS_TTL_SECONDS = 60
+
+
+@st.cache_data(ttl=HEALTH_CHECKS_TTL_SECONDS, show_spinner="Running health checks...")
+def get_health_check_results() -> list[HealthCheckResult]:
+    return checks.run_health_checks()
+
+
+@st.cache_resource(max_entries=8)
+def get_prompt_templates(
+    template_type_name: str, templates_version: str
+) -> list[templates.PromptTemplateFromFile]:
+    # `templates_version` is only part of the cache key: editing, adding or removing a template changes it
+    return templates.get_all_prompt_templates_by_type()[template_type_name]
+
+
+@st.cache_data(ttl=config.OLLAMA_MODELS_CACHE_TTL_SECONDS)
+def get_available_models() -> tuple[list[str], list[str]]:
+    return config.get_available_llm_models(), config.get_available_embedding_models()
+
+
+def clear_cached_resources() -> None:
+    get_health_check_results.clear()
+    get_prompt_templates.clear()
+    get_available_models.clear()
+    config.get_cached_ollama_models(force_refresh=True)
+    resources.clear()
+    return None
+
+
+def set_params_if_changed(**kwargs) -> None:
+    """
+    Params.set_params validates the params again, which looks up the ollama models.
+    Most reruns change nothing, so only the params that changed are set.
+    """
+    params = st.session_state.params
+    changed_params = {
+        name: value for name, value in kwargs.items() if getattr(params, name) != value
+    }
+    if changed_params:
+        params.set_params(**changed_params)
+    return None
+
 
 def initialize_session_state() -> None:
     if "sync_checked" not in st.session_state:
@@ -13,6 +59,8 @@ def initialize_session_state() -> None:
         st.session_state.pdf_paths_to_add = []
     if "entry_ids_to_remove" not in st.session_state:
         st.session_state.entry_ids_to_remove = []
+    if "removed_pdf_hashes" not in st.session_state:
+        st.session_state.removed_pdf_hashes = ()
     if "messages" not in st.session_state:
         st.session_state.messages = []
     if "params" not in st.session_state:
@@ -74,6 +122,7 @@ def display_health_checks_gui(check_results: list[HealthCheckResult]) -> None:
                 "Status": f"{status_icon} {status_text}",
                 "Check Name": result.name,
                 "Details": details,
+                "Latency": result.format_latency(),
             }
         )
 
@@ -114,37 +163,45 @@ def display_health_checks_gui(check_results: list[HealthCheckResult]) -> None:
                 "Details",
                 width="large",
             ),
+            "Latency": st.column_config.TextColumn(
+                "Latency",
+                width="small",
+            ),
         },
     )
 
     # Refresh button
     st.markdown("---")
     if st.button("🔄 Run Health Checks Again", type="primary"):
+        get_health_check_results.clear()
         st.rerun()
 
 
 def database_sync_button() -> None:
     if st.button("Check Database Synchronization", type="primary"):
         with st.spinner("Checking synchronization status..."):
-            pdf_paths_to_add, entry_ids_to_remove = (
+            pdf_paths_to_add, entry_ids_to_remove, removed_pdf_hashes = (
                 database.check_sync_status_between_folder_and_database(
-                    vector_store=database.init_and_get_vector_store(
+                    vector_store=resources.get_vector_store(
                         params=st.session_state.params
                     ),
                     pdf_folder=config.PDF_FOLDER,
+                    registry=resources.get_document_registry(),
+                    lexical_index=resources.get_lexical_index(),
                 )
             )
 
         st.session_state.sync_checked = True
         st.session_state.pdf_paths_to_add = pdf_paths_to_add
         st.session_state.entry_ids_to_remove = entry_ids_to_remove
+        st.session_state.removed_pdf_hashes = removed_pdf_hashes
         st.rerun()
 
 
 def sync_database_UI() -> None:
     if (
         len(st.session_state.pdf_paths_to_add) == 0
-        and len(st.session_state.entry_ids_to_remove) == 0
+        and len(st.session_state.removed_pdf_hashes) == 0
         and st.session_state.sync_checked
     ):
         st.success("✅ Database and pdf folder are synced")
@@ -168,26 +225,32 @@ def sync_database_UI() -> None:
                 if st.button("🚀 Embed PDFs"):
                     with st.spinner("Embedding PDFs..."):
                         database.add_pdfs_to_database(
-                            vector_store=database.init_and_get_vector_store(
+                            vector_store=resources.get_vector_store(
                                 params=st.session_state.params
                             ),
                             pdf_paths=st.session_state.pdf_paths_to_add,
                             params=st.session_state.params,
+                            registry=resources.get_document_registry(),
+                            lexical_index=resources.get_lexical_index(),
                         )
                     st.session_state.pdf_paths_to_add = []
                     st.rerun()
 
         with delete_col:
-            if len(st.session_state.entry_ids_to_remove) > 0:
+            if len(st.session_state.removed_pdf_hashes) > 0:
                 if st.button("🗑️ Remove Entries"):
                     with st.spinner("Removing entries..."):
                         database.delete_entries_from_database(
-                            vector_store=database.init_and_get_vector_store(
+                            vector_store=resources.get_vector_store(
                                 params=st.session_state.params
                             ),
                             ids=st.session_state.entry_ids_to_remove,
+                            registry=resources.get_document_registry(),
+                            lexical_index=resources.get_lexical_index(),
+                            pdf_hashes=st.session_state.removed_pdf_hashes,
                         )
                     st.session_state.entry_ids_to_remove = []
+                    st.session_state.removed_pdf_hashes = ()
                     st.rerun()
 
 
@@ -215,15 +278,15 @@ def chat_area():
     st.title("Chat without memory")
     with st.expander("📜 Prompt"):
         PROMPT_TYPE = "system"
-        available_prompt_templates = templates.get_all_prompt_templates_by_type()[
-            PROMPT_TYPE
-        ]
+        available_prompt_templates = get_prompt_templates(
+            PROMPT_TYPE, templates_version=templates.get_templates_version()
+        )
         selected_prompt = st.selectbox(
             label="Choose prompt",
             options=available_prompt_templates,
             format_func=lambda x: x.filename,
         )
-        st.session_state.params.set_params(prompt=selected_prompt.prompt)
+        set_params_if_changed(prompt=selected_prompt.prompt)
 
         col_left, col_right = st.columns([0.2, 0.8])
         with col_left:
@@ -271,16 +334,17 @@ def chat_area():
             with st.chat_message("human"):
                 st.markdown(question)
 
-            # Generate AI response
-            with st.spinner(
-                f"generating response with model {st.session_state.params.ollama_llm_model}..."
-            ):
-                answer = llm.ask_question(
-                    question=question, params=st.session_state.params
-                )
-
+            # Generate AI response, showing the tokens as they arrive
             with st.chat_message("ai"):
-                st.markdown(answer)
+                stats = llm.AnswerStats()
+                answer = st.write_stream(
+                    llm.stream_answer(
+                        question=question, params=st.session_state.params, stats=stats
+                    )
+                )
+                st.caption(
+                    f"generated with model {st.session_state.params.ollama_llm_model} ({stats.describe()})"
+                )
 
         # Append AI message and display it
         st.session_state.messages.append({"role": "ai", "content": answer})
@@ -288,20 +352,67 @@ def chat_area():
 
 def build_sidebar() -> None:
     with st.sidebar:
+        available_llm_models, available_embedding_models = get_available_models()
         llm_model = st.selectbox(
             label="LLM model",
-            options=config.AVAILABLE_LLM_MODELS,
+            options=available_llm_models,
         )
 
         embedding_model = st.selectbox(
             label="Embedding model",
-            options=config.AVAILABLE_EMBEDDING_MODELS,
+            options=available_embedding_models,
+        )
+
+        answer_cache_enabled = st.toggle(
+            label="Reuse answers to similar questions",
+            help="Answers are reused only while the prompt, the models and the pdfs stay the same.",
+        )
+
+        retrieval_mode = st.radio(
+            label="Retrieval",
+            options=get_args(config.RetrievalMode),
+            format_func=lambda mode: {
+                "vector": "Semantic",
+                "hybrid": "Semantic + keywords",
+                "adaptive": "Semantic, adaptive number of chunks",
+            }[mode],
+            help="Keywords help with exact terms such as part numbers, error codes or clause ids. "
+            "The adaptive mode keeps more or fewer chunks depending on how close they are to the question.",
         )
 
-        st.session_state.params.set_params(
-            ollama_llm_model=llm_model, ollama_embedding_model=embedding_model
+        mmr_enabled = st.toggle(
+            label="Diversify retrieved chunks",
+            help="Skip chunks that repeat a better ranked one, such as adjacent pages saying the same thing.",
         )
 
+        compression_enabled = st.toggle(
+            label="Keep only relevant sentences",
+            help="Give the LLM only the sentences of the retrieved chunks that relate to the question. Shorter prompts answer faster.",
+        )
+
+        set_params_if_changed(
+            ollama_llm_model=llm_model,
+            ollama_embedding_model=embedding_model,
+            answer_cache_enabled=answer_cache_enabled,
+            retrieval_mode=retrieval_mode,
+            mmr_enabled=mmr_enabled,
+            compression_enabled=compression_enabled,
+        )
+
+        query_embedding_cache = resources.get_query_embedding_cache(
+            params=st.session_state.params
+        )
+        st.caption(
+            f"Question embedding cache: {len(query_embedding_cache)} entries, {query_embedding_cache.stats.describe()}"
+        )
+
+        if st.button(
+            "Reload models and database",
+            help="Pick up models pulled with ollama, and reopen the database.",
+        ):
+            clear_cached_resources()
+            st.rerun()
+
     return None
 
 
@@ -309,10 +420,12 @@ st.title("Talensinki GUI")
 
 initialize_session_state()
 build_sidebar()
+# Runs once per server process, in the background
+start_warm_up_in_background(params=st.session_state.params)
 
 tab_checks, tab_db, tab_chat = st.tabs(["Checks", "Database", "Chat"])
 with tab_checks:
-    display_health_checks_gui(check_results=checks.run_health_checks())
+    display_health_checks_gui(check_results=get_health_check_results())
 
 with tab_db:
     database_sync_button()
@@ -1,7 +1,12 @@
 from pathlib import Path
 from dataclasses import dataclass
+import hashlib
+import threading
+from typing import TYPE_CHECKING
 
-from langchain.prompts import PromptTemplate
+# langchain is imported when a template is first parsed, not on import, to keep CLI startup fast
+if TYPE_CHECKING:
+    from langchain.prompts import PromptTemplate
 
 
 class TemplateType:
@@ -18,7 +23,7 @@ class TemplateType:
 class PromptTemplateFromFile:
     # Each template corresponds to a .txt file in ./prompt_templates/<template type>/
     filename: str
-    prompt: PromptTemplate
+    prompt: "PromptTemplate"
 
 
 def get_template_types() -> list[TemplateType]:
@@ -34,12 +39,55 @@ def get_template_types() -> list[TemplateType]:
     ]
 
 
-def get_prompt_template_from_file(filepath: Path) -> PromptTemplateFromFile:
+# Parsed templates by file path, with the (mtime, size) of the file when it was parsed
+_parsed_templates: dict[Path, tuple[tuple[int, int], PromptTemplateFromFile]] = {}
+_parsed_templates_lock = threading.Lock()
+
+
+def _get_file_signature(filepath: Path) -> tuple[int, int]:
+    stat = filepath.stat()
+    return stat.st_mtime_ns, stat.st_size
+
+
+def parse_prompt_template_file(filepath: Path) -> PromptTemplateFromFile:
+    from langchain.prompts import PromptTemplate
+
     return PromptTemplateFromFile(
         filename=filepath.name, prompt=PromptTemplate.from_file(template_file=filepath)
     )
 
 
+def get_prompt_template_from_file(filepath: Path) -> PromptTemplateFromFile:
+    """
+    Parsed template of a file. The file is only parsed again when its mtime or size changed since it was last parsed.
+    """
+    signature = _get_file_signature(filepath)
+    key = filepath.resolve()
+    with _parsed_templates_lock:
+        cached = _parsed_templates.get(key)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+
+    template = parse_prompt_template_file(filepath)
+    with _parsed_templates_lock:
+        _parsed_templates[key] = (signature, template)
+    return template
+
+
+def get_templates_version() -> str:
+    """
+    Token that changes whenever a template file is added, removed or edited.
+    Anything derived from the templates (e.g. the Streamlit template list) can be cached under it.
+    Only the files are listed and stat-ed, none is read.
+    """
+    file_signatures = sorted(
+        (str(filepath), *_get_file_signature(filepath))
+        for template_type in get_template_types()
+        for filepath in get_template_filenames_of_given_type(template_type)
+    )
+    return hashlib.sha256(repr(file_signatures).encode("utf-8")).hexdigest()
+
+
 def get_template_filenames_of_given_type(template_type: TemplateType) -> list[Path]:
     return [filepath for filepath in template_type.dir.glob("*.txt")]
 
@@ -1,20 +1,37 @@
 # %%
 
+import asyncio
+from enum import Enum
+import json
+from pathlib import Path
+
 import typer
 from rich import print
 from rich.table import Table
 
 
 import time
+from typing import TYPE_CHECKING, cast
 
-from talensinki import config, checks, database, rich_display, llm
+from talensinki import config, rich_display
 from talensinki.console import console
-from talensinki.checks import HealthCheckResult
+
+# Commands import the modules they use when they run, so that e.g. `talensinki --help` or `info`
+# do not load chromadb, langgraph or unstructured. tests/test_import_time.py keeps track of it
+if TYPE_CHECKING:
+    from talensinki.checks import HealthCheckResult
 
 # initialize typer app
 app = typer.Typer(invoke_without_command=True)
 
 
+class RetrievalModeOption(str, Enum):
+    # The values of config.RetrievalMode, so that typer rejects any other when parsing the arguments
+    vector = "vector"
+    hybrid = "hybrid"
+    adaptive = "adaptive"
+
+
 # %% app
 
 
@@ -23,12 +40,13 @@ def info():
     console.print("pdf folder path:", config.PDF_FOLDER)
 
 
-def _display_health_checks(check_results: list[HealthCheckResult]) -> None:
+def _display_health_checks(check_results: list["HealthCheckResult"]) -> None:
     # Create a table for the results
     table = Table(show_header=True, header_style="bold magenta")
     table.add_column("Status", style="", width=8)
     table.add_column("Check", style="", min_width=20)
     table.add_column("Details", style="dim", no_wrap=False)
+    table.add_column("Latency", style="dim", justify="right")
 
     all_passed = True
 
@@ -46,7 +64,7 @@ def _display_health_checks(check_results: list[HealthCheckResult]) -> None:
             )
             all_passed = False
 
-        table.add_row(status, result.name, details)
+        table.add_row(status, result.name, details, result.format_latency())
 
     console.print(table)
 
@@ -62,6 +80,8 @@ def _display_health_checks(check_results: list[HealthCheckResult]) -> None:
 
 @app.command()
 def checkhealth() -> None:
+    from talensinki import checks
+
     rich_display.print_command_title("Health Check Results")
     check_results = checks.run_health_checks()
     _display_health_checks(check_results=check_results)
@@ -69,21 +89,32 @@ def checkhealth() -> None:
 
 
 @app.command()
-def sync_database() -> None:
+def sync_database(workers: int = 1) -> None:
+    """
+    Embed new pdfs and remove deleted ones. Use --workers to chunk several pdfs in parallel.
+    """
+    from talensinki import database, resources
+
     rich_display.print_command_title("Syncing database")
 
-    params = config.Params()
+    params = config.Params(pdf_chunking_workers=workers)
 
-    vector_store = database.init_and_get_vector_store(params=params)
+    vector_store = resources.get_vector_store(params=params)
+    registry = database.get_document_registry()
+    lexical_index = database.get_lexical_index()
 
-    pdf_paths_to_add, entry_ids_to_remove = (
+    pdf_paths_to_add, entry_ids_to_remove, removed_pdf_hashes = (
         database.check_sync_status_between_folder_and_database(
-            vector_store=vector_store, pdf_folder=config.PDF_FOLDER
+            vector_store=vector_store,
+            pdf_folder=config.PDF_FOLDER,
+            registry=registry,
+            lexical_index=lexical_index,
         )
     )
 
     number_of_new_pdfs_in_folder = len(pdf_paths_to_add)
     number_of_unsynced_db_entries = len(entry_ids_to_remove)
+    number_of_removed_pdfs = len(removed_pdf_hashes)
 
     if number_of_new_pdfs_in_folder > 0:
         console.print(
@@ -96,12 +127,15 @@ def sync_database() -> None:
                 vector_store=vector_store,
                 pdf_paths=pdf_paths_to_add,
                 params=params,
+                registry=registry,
+                lexical_index=lexical_index,
             )
     else:
         console.print("No new pdf files detected.")
-    if number_of_unsynced_db_entries > 0:
+    # A removed pdf recorded without chunks has no entry to delete, but its record still goes
+    if number_of_removed_pdfs > 0:
         console.print(
-            f"I detected {number_of_unsynced_db_entries} pdf chunks in the database that do not correspond to any pdf file."
+            f"I detected {number_of_removed_pdfs} pdfs no longer in the folder, with {number_of_unsynced_db_entries} pdf chunks in the database."
         )
 
         should_delete = typer.confirm(
@@ -110,7 +144,11 @@ def sync_database() -> None:
         if should_delete:
             console.print("I will delete them from the database now.")
             database.delete_entries_from_database(
-                vector_store=vector_store, ids=entry_ids_to_remove
+                vector_store=vector_store,
+                ids=entry_ids_to_remove,
+                registry=registry,
+                lexical_index=lexical_index,
+                pdf_hashes=removed_pdf_hashes,
             )
     else:
         console.print(
@@ -121,16 +159,133 @@ def sync_database() -> None:
 
 
 @app.command()
-def ask(question: str) -> None:
+def warmup() -> None:
+    """
+    Load the LLM and the embedding model in ollama, so that the next questions do not wait for them.
+    """
+    from talensinki.warmup import warm_up
+
+    rich_display.print_command_title("Warming up the models")
+
     params = config.Params()
-    answer = llm.ask_question(question=question, params=params)
-    console.print(answer)
+    load_times = warm_up(params=params)
+    for model, seconds in load_times.items():
+        console.print(f"Loaded {model} in {seconds:.1f} s")
+    if params.keep_alive == -1:
+        how_long = "until ollama stops"
+    else:
+        how_long = f"for {params.keep_alive} s after each request"
+    rich_display.print_success(f"Models are loaded, and stay loaded {how_long}.")
+    return None
+
+
+@app.command()
+def ask(
+    question: str,
+    stream: bool = True,
+    cache: bool = False,
+    retrieval_mode: RetrievalModeOption = RetrievalModeOption.vector,
+    mmr: bool = False,
+    compress: bool = False,
+) -> None:
+    """
+    Ask a question about your pdfs. The answer is printed as it is generated, unless --no-stream is given.
+    With --cache, the answer to a near-identical previous question is reused.
+    --retrieval-mode hybrid also retrieves chunks by keyword, which helps with exact terms such as part numbers.
+    --retrieval-mode adaptive retrieves more or fewer chunks depending on how close they are to the question.
+    With --mmr, near-identical chunks are dropped in favour of more diverse ones.
+    With --compress, only the sentences of the chunks that relate to the question are given to the LLM.
+    """
+    from talensinki import llm
+
+    params = config.Params(
+        answer_cache_enabled=cache,
+        retrieval_mode=cast(config.RetrievalMode, retrieval_mode.value),
+        mmr_enabled=mmr,
+        compression_enabled=compress,
+    )
+    if not stream:
+        answer = llm.answer_question(question=question, params=params)
+        console.print(answer.text)
+        if answer.from_cache:
+            console.print("[dim]answer from cache[/dim]")
+        return None
+
+    stats = llm.AnswerStats()
+    for token in llm.stream_answer(question=question, params=params, stats=stats):
+        console.out(token, end="", highlight=False)
+    console.print()
+    console.print(f"[dim]{stats.describe()}[/dim]")
+    return None
+
+
+@app.command()
+def ask_batch(
+    questions_file: Path,
+    concurrency: int = 4,
+    output: Path = Path("answers.jsonl"),
+    retrieval_mode: RetrievalModeOption = RetrievalModeOption.vector,
+) -> None:
+    """
+    Answer each line of QUESTIONS_FILE, with up to --concurrency questions in flight, and write the answers to --output as JSONL.
+    """
+    if concurrency < 1:
+        raise typer.BadParameter(
+            f"concurrency must be at least 1, and you chose {concurrency}.",
+            param_hint="--concurrency",
+        )
+
+    from talensinki import llm, resources
+
+    rich_display.print_command_title("Answering questions")
+
+    questions = [
+        line.strip() for line in questions_file.read_text().splitlines() if line.strip()
+    ]
+    params = config.Params(
+        retrieval_mode=cast(config.RetrievalMode, retrieval_mode.value)
+    )
+    console.print(
+        f"Answering {len(questions)} questions, {concurrency} at a time, with the model {params.ollama_llm_model}..."
+    )
+
+    start_time = time.perf_counter()
+    answers = asyncio.run(
+        llm.aask_questions(questions=questions, params=params, concurrency=concurrency)
+    )
+    total_time = time.perf_counter() - start_time
+
+    number_of_failures = 0
+    with open(output, "w") as f:
+        for question, answer in zip(questions, answers):
+            if isinstance(answer, BaseException):
+                number_of_failures += 1
+                line = {"question": question, "error": str(answer)}
+            else:
+                line = {"question": question, "answer": answer}
+            f.write(json.dumps(line) + "\n")
+
+    console.print(f"Wrote the answers to {output} in {total_time:.1f} s.")
+    console.print(
+        f"[dim]question embedding cache: {resources.get_query_embedding_cache(params=params).stats.describe()}[/dim]"
+    )
+    if number_of_failures > 0:
+        rich_display.print_failure(
+            f"{number_of_failures} of {len(questions)} questions could not be answered."
+        )
+        raise typer.Exit(1)
+    rich_display.print_success(f"Answered all {len(questions)} questions.")
     return None
 
 
 def run_by_default() -> None:
+    from talensinki.warmup import start_warm_up_in_background
+
     print("Talensinki app starting...")
 
+    # Load the models while the app starts, so that the first question does not wait for them
+    start_warm_up_in_background(params=config.Params())
+
     # Your RAG setup will go here
 
     # Keep the container running
@@ -0,0 +1,84 @@
+"""
+Load the configured models in ollama ahead of the first question, so that it does not pay for the model load time.
+Models then stay loaded for params.keep_alive seconds after each request, or until ollama stops if it is -1.
+"""
+
+import copy
+import threading
+import time
+
+import ollama
+
+from talensinki import config, resources
+from talensinki.console import console
+
+_background_warmup_started = False
+_background_warmup_lock = threading.Lock()
+
+
+def warm_up_llm(params: config.Params) -> float:
+    """Load the LLM in ollama, and return how long it took in seconds."""
+    start_time = time.perf_counter()
+    # An empty prompt loads the model without generating anything.
+    # num_ctx must match the chat object's, otherwise ollama loads the model again on the first question
+    ollama.Client(host=config.OLLAMA_LOCAL_URL).generate(
+        model=params.ollama_llm_model,
+        prompt="",
+        keep_alive=params.keep_alive,
+        options={"num_ctx": params.num_ctx},
+    )
+    return time.perf_counter() - start_time
+
+
+def warm_up_embedding_model(params: config.Params) -> float:
+    """Load the embedding model in ollama, and return how long it took in seconds."""
+    start_time = time.perf_counter()
+    ollama.Client(host=config.OLLAMA_LOCAL_URL).embed(
+        model=params.ollama_embedding_model,
+        input="warm-up",
+        keep_alive=params.keep_alive,
+    )
+    return time.perf_counter() - start_time
+
+
+def warm_up(params: config.Params) -> dict[str, float]:
+    """
+    Build the shared graph and vector store, and load both models in ollama.
+    Returns the load time of each model, in seconds.
+    """
+    resources.get_graph(params=params)
+    return {
+        params.ollama_embedding_model: warm_up_embedding_model(params=params),
+        params.ollama_llm_model: warm_up_llm(params=params),
+    }
+
+
+def start_warm_up_in_background(params: config.Params) -> None:
+    """
+    Warm up in a daemon thread, once per process, for long-running modes like the GUI.
+    A failure is only printed: the first question then loads the models itself.
+    """
+    global _background_warmup_started
+    with _background_warmup_lock:
+        if _background_warmup_started:
+            return None
+        _background_warmup_started = True
+
+    def warm_up_and_report(params: config.Params) -> None:
+        try:
+            load_times = warm_up(params=params)
+        except Exception as e:
+            console.print(f"Could not warm up the models (exception: {e})")
+            return None
+        console.print(
+            "Warmed up "
+            + ", ".join(
+                f"{model} in {seconds:.1f} s" for model, seconds in load_times.items()
+            )
+        )
+        return None
+
+    threading.Thread(
+        target=warm_up_and_report, args=(copy.copy(params),), daemon=True
+    ).start()
+    return None
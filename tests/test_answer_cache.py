@@ -0,0 +1,62 @@
+from pathlib import Path
+
+from talensinki.answer_cache import AnswerCache
+
+
+def create_mock_answer_cache(
+    tmp_path: Path, max_entries: int = 10, ttl_seconds: float = 60
+) -> AnswerCache:
+    return AnswerCache(
+        filepath=tmp_path / "answers.sqlite3",
+        max_entries=max_entries,
+        ttl_seconds=ttl_seconds,
+    )
+
+
+def test_lookup_matches_similar_questions_in_same_scope(tmp_path: Path):
+    cache = create_mock_answer_cache(tmp_path)
+    cache.store(
+        scope="scope", question="What is X?", question_embedding=[1.0, 0.0], answer="Y"
+    )
+
+    cached_answer = cache.lookup(
+        scope="scope", question_embedding=[0.99, 0.01], similarity_threshold=0.95
+    )
+    assert cached_answer is not None
+    assert cached_answer.answer == "Y"
+
+    assert (
+        cache.lookup(
+            scope="scope", question_embedding=[0.0, 1.0], similarity_threshold=0.95
+        )
+        is None
+    )
+    assert (
+        cache.lookup(
+            scope="other scope",
+            question_embedding=[1.0, 0.0],
+            similarity_threshold=0.95,
+        )
+        is None
+    )
+
+
+def test_expired_answers_are_not_reused(tmp_path: Path):
+    cache = create_mock_answer_cache(tmp_path, ttl_seconds=-1)
+    cache.store(scope="scope", question="q", question_embedding=[1.0], answer="a")
+
+    assert (
+        cache.lookup(scope="scope", question_embedding=[1.0], similarity_threshold=0.9)
+        is None
+    )
+    assert len(cache) == 0
+
+
+def test_cache_keeps_at_most_max_entries(tmp_path: Path):
+    cache = create_mock_answer_cache(tmp_path, max_entries=2)
+    for i in range(3):
+        cache.store(
+            scope="scope", question=f"q{i}", question_embedding=[1.0], answer="a"
+        )
+
+    assert len(cache) == 2
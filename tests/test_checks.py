@@ -0,0 +1,59 @@
+import time
+
+import pytest
+
+from talensinki import checks
+from talensinki.checks import HealthCheckResult
+
+
+@pytest.fixture
+def fake_health_checks(monkeypatch: pytest.MonkeyPatch) -> None:
+    def check_pdf_folder_exists() -> HealthCheckResult:
+        return HealthCheckResult(passed=True, name="PDF folder exists")
+
+    def check_config_file_exists() -> HealthCheckResult:
+        raise RuntimeError("no config")
+
+    def check_database_connection() -> HealthCheckResult:
+        time.sleep(5)
+        return HealthCheckResult(passed=True, name="Database connection")
+
+    def check_ollama_connection() -> HealthCheckResult:
+        time.sleep(0.2)
+        return HealthCheckResult(passed=True, name="ollama is connected")
+
+    def check_prompt_templates() -> HealthCheckResult:
+        return HealthCheckResult(passed=False, name="templates are valid")
+
+    for fake_check in [
+        check_pdf_folder_exists,
+        check_config_file_exists,
+        check_database_connection,
+        check_ollama_connection,
+        check_prompt_templates,
+    ]:
+        monkeypatch.setattr(checks, fake_check.__name__, fake_check)
+    return None
+
+
+def test_health_checks_run_concurrently_within_deadline(fake_health_checks):
+    start_time = time.perf_counter()
+    results = checks.run_health_checks(timeout_seconds=0.5, total_timeout_seconds=1)
+    total_time = time.perf_counter() - start_time
+
+    assert total_time < 1
+    assert [result.passed for result in results] == [True, False, False, True, False]
+
+
+def test_health_check_results_report_latency_and_failures(fake_health_checks):
+    results = checks.run_health_checks(timeout_seconds=0.5, total_timeout_seconds=1)
+
+    assert results[0].latency_seconds is not None
+    assert results[3].latency_seconds == pytest.approx(0.2, abs=0.15)
+    assert results[1].name == "Configuration file exists"
+    assert "no config" in results[1].details
+    # The database check is still running when the deadline passes
+    assert results[2].name == "Database connection"
+    assert "timed out" in results[2].details
+    assert results[2].latency_seconds is None
+    assert results[2].format_latency() == "-"
@@ -0,0 +1,74 @@
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from talensinki.compression import compress_documents, split_into_sentences
+
+
+class KeywordEmbeddings(Embeddings):
+    # One dimension per keyword, so that similarities are predictable
+    keywords = ("pump", "bolt", "paint")
+
+    def __init__(self):
+        self.embedded_texts: list[str] = []
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        self.embedded_texts.extend(texts)
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return [float(keyword in text.lower()) for keyword in self.keywords]
+
+
+def test_split_into_sentences():
+    text = "Title\nThe pump is red. Is it loud? Yes!\n\n- list item"
+
+    assert split_into_sentences(text) == [
+        "Title",
+        "The pump is red.",
+        "Is it loud?",
+        "Yes!",
+        "- list item",
+    ]
+
+
+def test_compress_documents_keeps_relevant_sentences_in_order():
+    embeddings = KeywordEmbeddings()
+    docs = [
+        Document(
+            id="a",
+            page_content="Service the pump yearly. Paint the walls. The pump needs oil.",
+            metadata={"page": 1},
+        ),
+        Document(id="b", page_content="Tighten the bolt. Paint it blue."),
+    ]
+
+    compressed_docs = compress_documents(
+        docs,
+        query_embedding=embeddings.embed_query("How do I service the pump?"),
+        embeddings=embeddings,
+        similarity_threshold=0.5,
+    )
+
+    assert compressed_docs == [
+        Document(
+            id="a",
+            page_content="Service the pump yearly. The pump needs oil.",
+            metadata={"page": 1},
+        )
+    ]
+    # All sentences are embedded in a single call
+    assert len(embeddings.embedded_texts) == 5
+
+
+def test_compress_documents_keeps_docs_when_nothing_is_relevant():
+    embeddings = KeywordEmbeddings()
+    docs = [Document(id="a", page_content="Tighten the bolt.")]
+
+    compressed_docs = compress_documents(
+        docs,
+        query_embedding=embeddings.embed_query("What colour is the paint?"),
+        embeddings=embeddings,
+        similarity_threshold=0.5,
+    )
+
+    assert compressed_docs == docs
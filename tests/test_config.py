@@ -0,0 +1,91 @@
+from pathlib import Path
+
+import pytest
+
+from talensinki import config
+from talensinki.config import OllamaModel
+
+
+@pytest.fixture
+def fake_ollama(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> list[int]:
+    """Replace the ollama call by a fake one, and return the list where its calls are counted."""
+    calls = []
+
+    def get_available_ollama_models() -> list[OllamaModel]:
+        calls.append(1)
+        return [
+            OllamaModel(name="llama3:latest", type="llm"),
+            OllamaModel(name="nomic-embed-text:latest", type="embedding"),
+        ]
+
+    monkeypatch.setattr(
+        config, "get_available_ollama_models", get_available_ollama_models
+    )
+    monkeypatch.setattr(
+        config, "OLLAMA_MODELS_CACHE_FILEPATH", tmp_path / "ollama_models.json"
+    )
+    monkeypatch.setattr(config, "_ollama_models_cache", None)
+    return calls
+
+
+def test_ollama_models_are_fetched_once_within_ttl(fake_ollama: list[int]):
+    assert config.get_available_llm_models() == ["llama3:latest"]
+    assert config.get_available_embedding_models() == ["nomic-embed-text:latest"]
+
+    assert len(fake_ollama) == 1
+
+
+def test_ollama_models_are_reused_from_disk(
+    fake_ollama: list[int], monkeypatch: pytest.MonkeyPatch
+):
+    config.get_available_llm_models()
+    # A new process starts with an empty memory cache
+    monkeypatch.setattr(config, "_ollama_models_cache", None)
+
+    assert config.get_available_llm_models() == ["llama3:latest"]
+    assert len(fake_ollama) == 1
+
+
+def test_ollama_models_are_fetched_again_after_ttl(
+    fake_ollama: list[int], monkeypatch: pytest.MonkeyPatch
+):
+    config.get_available_llm_models()
+    monkeypatch.setattr(config, "OLLAMA_MODELS_CACHE_TTL_SECONDS", 0)
+    config.get_available_llm_models()
+
+    assert len(fake_ollama) == 2
+
+
+def test_last_known_ollama_models_are_used_when_ollama_is_down(
+    fake_ollama: list[int], monkeypatch: pytest.MonkeyPatch
+):
+    config.get_available_llm_models()
+
+    def ollama_is_down() -> list[OllamaModel]:
+        raise ValueError("Error fetching models")
+
+    monkeypatch.setattr(config, "get_available_ollama_models", ollama_is_down)
+
+    assert config.get_available_llm_models(force_refresh=True) == ["llama3:latest"]
+
+
+@pytest.mark.parametrize(
+    "invalid_params",
+    [
+        {"embedding_batch_size": 0},
+        {"embedding_batch_max_characters": 0},
+        {"embedding_cache_max_entries": 0},
+        {"query_embedding_cache_size": 0},
+        {"answer_cache_similarity_threshold": 0},
+        {"answer_cache_similarity_threshold": 1.1},
+        {"answer_cache_ttl_seconds": 0},
+        {"answer_cache_max_entries": 0},
+        {"adaptive_max_distance": 0},
+        {"adaptive_min_gap": -0.1},
+        {"sentence_embedding_cache_max_entries": 0},
+        {"keep_alive": -2},
+    ],
+)
+def test_params_rejects_invalid_values(fake_ollama: list[int], invalid_params: dict):
+    with pytest.raises(ValueError, match=next(iter(invalid_params))):
+        config.Params(**invalid_params)
@@ -0,0 +1,75 @@
+from langchain_core.documents import Document
+
+from talensinki.context_packing import (
+    estimate_tokens,
+    get_context_budget_tokens,
+    pack_documents,
+    truncate_to_tokens,
+)
+
+
+def create_mock_document(text: str, id: str) -> Document:
+    return Document(id=id, page_content=text, metadata={"source": f"{id}.pdf"})
+
+
+def test_all_documents_fit_in_a_large_budget():
+    docs = [
+        create_mock_document("The pump must be serviced every year.", id="a"),
+        create_mock_document("Bolts are tightened to 40 Nm.", id="b"),
+    ]
+
+    assert pack_documents(docs, budget_tokens=1000, duplicate_threshold=0.8) == docs
+
+
+def test_near_duplicate_documents_are_dropped():
+    text = "The pump must be serviced every year by a certified technician."
+    docs = [
+        create_mock_document(text, id="a"),
+        create_mock_document(text + " ", id="b"),
+        create_mock_document("Bolts are tightened to 40 Nm.", id="c"),
+    ]
+
+    packed_docs = pack_documents(docs, budget_tokens=1000, duplicate_threshold=0.8)
+
+    assert [doc.id for doc in packed_docs] == ["a", "c"]
+
+
+def test_low_ranked_documents_are_truncated_then_dropped():
+    docs = [
+        create_mock_document("word " * 200, id="a"),
+        create_mock_document("other " * 200, id="b"),
+        create_mock_document("last " * 200, id="c"),
+    ]
+    budget_tokens = estimate_tokens(docs[0].page_content) + 100
+
+    packed_docs = pack_documents(
+        docs, budget_tokens=budget_tokens, duplicate_threshold=0.8
+    )
+
+    assert [doc.id for doc in packed_docs] == ["a", "b"]
+    assert packed_docs[0] == docs[0]
+    assert len(packed_docs[1].page_content) < len(docs[1].page_content)
+    assert packed_docs[1].metadata == docs[1].metadata
+    assert (
+        sum(estimate_tokens(doc.page_content) for doc in packed_docs) <= budget_tokens
+    )
+
+
+def test_truncate_to_tokens_cuts_at_a_word_boundary():
+    assert truncate_to_tokens("short text", max_tokens=100) == "short text"
+    assert truncate_to_tokens("aaaa bbbb cccc", max_tokens=3) == "aaaa bbbb"
+
+
+def test_context_budget_leaves_room_for_prompt_and_answer():
+    assert (
+        get_context_budget_tokens(
+            prompt_without_context="x" * 350, num_ctx=4096, answer_token_reserve=512
+        )
+        == 4096 - 100 - 512
+    )
+    assert (
+        get_context_budget_tokens(
+            prompt_without_context="x" * 35_000, num_ctx=4096, answer_token_reserve=512
+        )
+        == 0
+    )
@@ -1,9 +1,13 @@
+import hashlib
 from pathlib import Path
+from types import SimpleNamespace
+from typing import cast
 from langchain_community.embeddings import DeterministicFakeEmbedding
 from langchain_chroma import Chroma
 from langchain_core.documents import Document
 
-from talensinki import database
+from talensinki import config, database
+from talensinki.registry import DocumentRegistry
 
 
 def create_mock_pdf_folderpath(tmp_path: Path) -> Path:
@@ -69,6 +73,25 @@ def test_get_pdf_hashes_in_database(tmp_path: Path) -> None:
     assert set(db_hashes) == set(["123", "456", "789"])
 
 
+def test_get_pdf_hashes_in_database_for_specific_hashes(tmp_path: Path) -> None:
+    vector_store = create_mock_embeddings_database(tmp_path=tmp_path)
+    add_mock_documents_to_database(vector_store)
+
+    db_hashes = database.get_pdf_hashes_in_database(
+        vector_store, hashes=("123", "789", "not_in_db")
+    )
+    assert set(db_hashes) == set(["123", "789"])
+
+
+def test_iter_database_entries_pages_through_all_entries(tmp_path: Path) -> None:
+    vector_store = create_mock_embeddings_database(tmp_path=tmp_path)
+    add_mock_documents_to_database(vector_store)
+
+    pages = list(database.iter_database_entries(vector_store, page_size=2))
+
+    assert [len(page["ids"]) for page in pages] == [2, 1]
+
+
 def test_delete_entries_from_database(tmp_path: Path):
     vector_store = create_mock_embeddings_database(tmp_path=tmp_path)
     add_mock_documents_to_database(vector_store)
@@ -113,6 +136,17 @@ def test_get_ids_of_entries_with_specific_hashes(tmp_path: Path):
     assert ["1", "2"] == ids
 
 
+def test_get_ids_of_entries_without_specific_hashes(tmp_path: Path):
+    vector_store = create_mock_embeddings_database(tmp_path=tmp_path)
+    add_mock_documents_to_database(vector_store)
+
+    ids = database.get_ids_of_entries_without_specific_hashes(
+        vector_store, hashes=tuple(["123", "456"])
+    )
+
+    assert ["3"] == ids
+
+
 def test_check_sync_status_between_folder_and_database(tmp_path: Path):
     pdf_dir = create_mock_pdf_folderpath(tmp_path)
     create_mock_pdf_files(pdf_dir=pdf_dir)
@@ -121,9 +155,11 @@ def test_check_sync_status_between_folder_and_database(tmp_path: Path):
     vector_store = create_mock_embeddings_database(tmp_path=tmp_path)
     add_mock_documents_to_database(vector_store)
 
-    pdf_paths_to_add, entry_ids_to_remove = (
+    pdf_paths_to_add, entry_ids_to_remove, removed_pdf_hashes = (
         database.check_sync_status_between_folder_and_database(
-            vector_store=vector_store, pdf_folder=pdf_dir
+            vector_store=vector_store,
+            pdf_folder=pdf_dir,
+            manifest_filepath=tmp_path / "manifest.json",
         )
     )
 
@@ -132,3 +168,297 @@ def test_check_sync_status_between_folder_and_database(tmp_path: Path):
     )
 
     assert set(entry_ids_to_remove) == set(["1", "2", "3"])
+    assert set(removed_pdf_hashes) == set(["123", "456", "789"])
+
+
+def test_calculate_file_hashes(tmp_path: Path):
+    pdf_dir = create_mock_pdf_folderpath(tmp_path)
+    create_mock_pdf_files(pdf_dir=pdf_dir)
+    empty_pdf = pdf_dir / "empty.pdf"
+    empty_pdf.write_bytes(b"")
+    pdf_paths = database.get_pdf_filepaths_in_folder(folder=pdf_dir)
+
+    file_hashes = database.calculate_file_hashes(file_paths=pdf_paths)
+
+    assert list(file_hashes) == pdf_paths
+    for pdf_path in pdf_paths:
+        assert (
+            file_hashes[pdf_path] == hashlib.sha256(pdf_path.read_bytes()).hexdigest()
+        )
+
+
+def test_get_file_hashes_reuses_manifest_for_unchanged_files(
+    tmp_path: Path, monkeypatch
+):
+    pdf_dir = create_mock_pdf_folderpath(tmp_path)
+    create_mock_pdf_files(pdf_dir=pdf_dir)
+    pdf_paths = database.get_pdf_filepaths_in_folder(folder=pdf_dir)
+    manifest_filepath = tmp_path / "manifest.json"
+
+    first_hashes = database.get_file_hashes(
+        file_paths=pdf_paths, manifest_filepath=manifest_filepath
+    )
+
+    hashed_files = []
+    calculate_file_hash = database.calculate_file_hash
+
+    def spy_calculate_file_hash(file_path: Path) -> str:
+        hashed_files.append(file_path)
+        return calculate_file_hash(file_path=file_path)
+
+    monkeypatch.setattr(database, "calculate_file_hash", spy_calculate_file_hash)
+
+    assert (
+        database.get_file_hashes(
+            file_paths=pdf_paths, manifest_filepath=manifest_filepath
+        )
+        == first_hashes
+    )
+    assert hashed_files == []
+
+    (pdf_dir / "file_1.pdf").write_text(data="lilili, but longer")
+    new_hashes = database.get_file_hashes(
+        file_paths=pdf_paths, manifest_filepath=manifest_filepath
+    )
+    assert hashed_files == [pdf_dir / "file_1.pdf"]
+    assert new_hashes[pdf_dir / "file_1.pdf"] != first_hashes[pdf_dir / "file_1.pdf"]
+
+
+def test_get_file_hashes_forgets_removed_files(tmp_path: Path):
+    pdf_dir = create_mock_pdf_folderpath(tmp_path)
+    create_mock_pdf_files(pdf_dir=pdf_dir)
+    pdf_paths = database.get_pdf_filepaths_in_folder(folder=pdf_dir)
+    manifest_filepath = tmp_path / "manifest.json"
+    database.get_file_hashes(file_paths=pdf_paths, manifest_filepath=manifest_filepath)
+
+    removed_pdf_path = pdf_paths.pop()
+    removed_pdf_path.unlink()
+    # Hashing a subset of the folder keeps the other entries
+    database.get_file_hashes(
+        file_paths=pdf_paths[:1], manifest_filepath=manifest_filepath
+    )
+    assert str(removed_pdf_path.absolute()) in database.load_file_hash_manifest(
+        manifest_filepath=manifest_filepath
+    )
+
+    database.get_file_hashes(
+        file_paths=pdf_paths, manifest_filepath=manifest_filepath, is_whole_folder=True
+    )
+    assert set(
+        database.load_file_hash_manifest(manifest_filepath=manifest_filepath)
+    ) == {str(pdf_path.absolute()) for pdf_path in pdf_paths}
+
+
+def test_make_chunk_id_is_deterministic():
+    assert database.make_chunk_id(
+        source_pdf_hash="123", pdf_chunking_method="by_pages", chunk_index=0
+    ) == database.make_chunk_id(
+        source_pdf_hash="123", pdf_chunking_method="by_pages", chunk_index=0
+    )
+    assert database.make_chunk_id(
+        source_pdf_hash="123", pdf_chunking_method="by_pages", chunk_index=0
+    ) != database.make_chunk_id(
+        source_pdf_hash="123", pdf_chunking_method="by_sections", chunk_index=0
+    )
+
+
+def test_get_existing_chunk_ids(tmp_path: Path):
+    vector_store = create_mock_embeddings_database(tmp_path=tmp_path)
+    add_mock_documents_to_database(vector_store)
+
+    assert set(
+        database.get_existing_chunk_ids(vector_store, chunk_ids=["1", "3", "42"])
+    ) == set(["1", "3"])
+
+
+def create_mock_pdf_chunks(pdf_hash: str, number_of_chunks: int) -> list[Document]:
+    return [
+        Document(
+            page_content=f"chunk {i} of {pdf_hash}",
+            metadata={
+                "source_pdf_hash": pdf_hash,
+                "pdf_chunking_method": "by_pages",
+                "chunk_index": i,
+            },
+        )
+        for i in range(number_of_chunks)
+    ]
+
+
+def add_mock_pdf_chunks_to_database(
+    vector_store: Chroma, number_of_chunks_per_pdf: dict[str, int]
+) -> list[str]:
+    chunks = [
+        chunk
+        for pdf_hash, number_of_chunks in number_of_chunks_per_pdf.items()
+        for chunk in create_mock_pdf_chunks(pdf_hash, number_of_chunks)
+    ]
+    chunk_ids = [database.get_chunk_id(chunk) for chunk in chunks]
+    vector_store.add_documents(documents=chunks, ids=chunk_ids)
+    return chunk_ids
+
+
+def test_iter_database_entries_reads_each_entry_once_by_chunk_index_ranges(
+    tmp_path: Path,
+):
+    vector_store = create_mock_embeddings_database(tmp_path=tmp_path)
+    chunk_ids = add_mock_pdf_chunks_to_database(
+        vector_store, {"aaa": 7, "bbb": 1, "ccc": 3}
+    )
+    # Entries from before chunk_index existed are read too
+    add_mock_documents_to_database(vector_store)
+
+    pages = list(database.iter_database_entries(vector_store, page_size=2))
+
+    assert all(len(page["ids"]) <= 2 for page in pages)
+    ids = [chunk_id for page in pages for chunk_id in page["ids"]]
+    assert sorted(ids) == sorted(chunk_ids + ["1", "2", "3"])
+
+
+def test_get_ids_of_entries_without_specific_hashes_finds_removed_pdfs(
+    tmp_path: Path,
+):
+    vector_store = create_mock_embeddings_database(tmp_path=tmp_path)
+    add_mock_pdf_chunks_to_database(vector_store, {"aaa": 3, "bbb": 2})
+    add_mock_documents_to_database(vector_store)
+
+    ids = database.get_ids_of_entries_without_specific_hashes(
+        vector_store, hashes=("aaa", "123", "456")
+    )
+
+    assert sorted(ids) == ["3", "bbb-by_pages-0", "bbb-by_pages-1"]
+
+
+def create_mock_embedding_params() -> config.Params:
+    return cast(
+        config.Params,
+        SimpleNamespace(
+            ollama_embedding_model="fake",
+            pdf_chunking_method="by_pages",
+            embedding_batch_size=2,
+            embedding_batch_max_characters=None,
+        ),
+    )
+
+
+def test_embed_pdfs_to_database_records_pdfs_in_registry(tmp_path: Path):
+    vector_store = create_mock_embeddings_database(tmp_path=tmp_path)
+    registry = DocumentRegistry(filepath=tmp_path / "registry.sqlite3")
+    params = create_mock_embedding_params()
+
+    database.embed_pdfs_to_database(
+        vector_store=vector_store,
+        chunks_for_all_pdfs=[
+            create_mock_pdf_chunks(pdf_hash="123", number_of_chunks=3),
+            create_mock_pdf_chunks(pdf_hash="456", number_of_chunks=2),
+        ],
+        params=params,
+        registry=registry,
+        pdf_paths_by_hash={"123": Path("a.pdf"), "456": Path("b.pdf")},
+    )
+
+    assert set(registry.get_pdf_hashes()) == set(["123", "456"])
+    assert registry.get_chunk_ids(pdf_hashes=("123",)) == [
+        "123-by_pages-0",
+        "123-by_pages-1",
+        "123-by_pages-2",
+    ]
+    assert set(database.get_pdf_hashes_in_database(vector_store)) == set(["123", "456"])
+
+    database.delete_pdfs_from_database(
+        vector_store=vector_store, registry=registry, pdf_hashes=("123",)
+    )
+    assert registry.get_pdf_hashes() == ("456",)
+    assert database.get_pdf_hashes_in_database(vector_store) == ("456",)
+
+
+def test_embed_pdfs_to_database_records_pdfs_without_chunks(tmp_path: Path):
+    vector_store = create_mock_embeddings_database(tmp_path=tmp_path)
+    registry = DocumentRegistry(filepath=tmp_path / "registry.sqlite3")
+
+    # The pdf 456 has no text, and the pdf 789 failed to chunk
+    database.embed_pdfs_to_database(
+        vector_store=vector_store,
+        chunks_for_all_pdfs=[
+            create_mock_pdf_chunks(pdf_hash="123", number_of_chunks=3),
+            [],
+            [],
+        ],
+        params=create_mock_embedding_params(),
+        registry=registry,
+        pdf_paths_by_hash={
+            "123": Path("a.pdf"),
+            "456": Path("b.pdf"),
+            "789": Path("c.pdf"),
+        },
+        failed_pdf_hashes={"789"},
+    )
+
+    # The failed pdf is left out, so that the next sync tries it again
+    assert set(registry.get_pdf_hashes()) == set(["123", "456"])
+    empty_pdf_record = registry.get("456")
+    assert empty_pdf_record is not None
+    assert empty_pdf_record.chunk_ids == []
+    assert empty_pdf_record.pdf_path == "b.pdf"
+
+
+def test_sync_forgets_removed_pdfs_recorded_without_chunks(tmp_path: Path):
+    pdf_dir = create_mock_pdf_folderpath(tmp_path)
+    create_mock_pdf_files(pdf_dir=pdf_dir)
+    pdf_hashes = database.get_file_hashes(
+        file_paths=database.get_pdf_filepaths_in_folder(folder=pdf_dir),
+        manifest_filepath=tmp_path / "manifest.json",
+    )
+    vector_store = create_mock_embeddings_database(tmp_path=tmp_path)
+    registry = DocumentRegistry(filepath=tmp_path / "registry.sqlite3")
+    # file_1.pdf has chunks, file_2.pdf has no text
+    database.embed_pdfs_to_database(
+        vector_store=vector_store,
+        chunks_for_all_pdfs=[
+            create_mock_pdf_chunks(
+                pdf_hash=pdf_hashes[pdf_dir / "file_1.pdf"], number_of_chunks=2
+            ),
+            [],
+        ],
+        params=create_mock_embedding_params(),
+        registry=registry,
+        pdf_paths_by_hash={pdf_hash: path for path, pdf_hash in pdf_hashes.items()},
+    )
+    (pdf_dir / "file_2.pdf").unlink()
+
+    pdf_paths_to_add, entry_ids_to_remove, removed_pdf_hashes = (
+        database.check_sync_status_between_folder_and_database(
+            vector_store=vector_store,
+            pdf_folder=pdf_dir,
+            manifest_filepath=tmp_path / "manifest.json",
+            registry=registry,
+        )
+    )
+    database.delete_entries_from_database(
+        vector_store=vector_store,
+        ids=entry_ids_to_remove,
+        registry=registry,
+        pdf_hashes=removed_pdf_hashes,
+    )
+
+    assert pdf_paths_to_add == []
+    assert entry_ids_to_remove == []
+    assert removed_pdf_hashes == (pdf_hashes[pdf_dir / "file_2.pdf"],)
+    assert registry.get_pdf_hashes() == (pdf_hashes[pdf_dir / "file_1.pdf"],)
+
+
+def test_reconcile_registry_with_vector_store_rebuilds_records(tmp_path: Path):
+    vector_store = create_mock_embeddings_database(tmp_path=tmp_path)
+    chunk_ids = add_mock_pdf_chunks_to_database(vector_store, {"aaa": 3, "bbb": 1})
+    registry = DocumentRegistry(filepath=tmp_path / "registry.sqlite3")
+
+    database.reconcile_registry_with_vector_store(
+        vector_store=vector_store, registry=registry
+    )
+
+    assert set(registry.get_pdf_hashes()) == set(["aaa", "bbb"])
+    record = registry.get("aaa")
+    assert record is not None
+    assert record.chunk_ids == chunk_ids[:3]
+    assert record.pdf_chunking_method == "by_pages"
+    assert record.embedding_model is None
@@ -0,0 +1,161 @@
+import asyncio
+import threading
+from pathlib import Path
+
+from langchain_core.embeddings import Embeddings
+
+from talensinki import embedding_cache
+
+
+class CountingEmbeddings(Embeddings):
+    def __init__(self):
+        self.embedded_texts: list[str] = []
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        self.embedded_texts.extend(texts)
+        return [[float(len(text)), 1.0] for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_documents([text])[0]
+
+
+def create_cached_embeddings(
+    tmp_path: Path, model: str = "model", max_entries: int = 100
+) -> tuple[embedding_cache.CachedEmbeddings, CountingEmbeddings]:
+    underlying = CountingEmbeddings()
+    cache = embedding_cache.EmbeddingCache(
+        filepath=tmp_path / "cache.sqlite3", max_entries=max_entries
+    )
+    return (
+        embedding_cache.CachedEmbeddings(
+            embeddings=underlying, model=model, cache=cache
+        ),
+        underlying,
+    )
+
+
+def test_cached_embeddings_only_embed_new_texts(tmp_path: Path):
+    cached_embeddings, underlying = create_cached_embeddings(tmp_path)
+
+    first = cached_embeddings.embed_documents(["foo", "bar", "foo"])
+    second = cached_embeddings.embed_documents(["bar", "  foo\n", "bazz"])
+
+    assert underlying.embedded_texts == ["foo", "bar", "bazz"]
+    assert first == [[3.0, 1.0], [3.0, 1.0], [3.0, 1.0]]
+    assert second == [[3.0, 1.0], [3.0, 1.0], [4.0, 1.0]]
+
+
+def test_cache_is_keyed_by_model(tmp_path: Path):
+    cached_embeddings, _ = create_cached_embeddings(tmp_path, model="model_a")
+    cached_embeddings.embed_documents(["foo"])
+
+    other_model_embeddings, underlying = create_cached_embeddings(
+        tmp_path, model="model_b"
+    )
+    other_model_embeddings.embed_documents(["foo"])
+
+    assert underlying.embedded_texts == ["foo"]
+
+
+def test_cache_evicts_least_recently_used(tmp_path: Path):
+    cached_embeddings, underlying = create_cached_embeddings(tmp_path, max_entries=2)
+
+    cached_embeddings.embed_documents(["a"])
+    cached_embeddings.embed_documents(["bb"])
+    cached_embeddings.embed_documents(["a"])  # "bb" is now the least recently used
+    cached_embeddings.embed_documents(["ccc"])
+
+    assert len(cached_embeddings.cache) == 2
+    cached_embeddings.embed_documents(["a", "bb"])
+    assert underlying.embedded_texts == ["a", "bb", "ccc", "bb"]
+
+
+def test_cache_does_not_count_replaced_vectors_twice(tmp_path: Path):
+    cache = embedding_cache.EmbeddingCache(
+        filepath=tmp_path / "cache.sqlite3", max_entries=2
+    )
+    cache.put_many("model", {"a": [1.0]})
+    cache.put_many("model", {"a": [1.5]})
+    cache.put_many("model", {"b": [2.0]})
+
+    assert cache.get_many("model", ["a", "b"]) == {"a": [1.5], "b": [2.0]}
+
+    cache.put_many("model", {"c": [3.0]})
+    assert len(cache) == 2
+
+
+def test_query_embedding_cache_counts_hits_and_misses():
+    underlying = CountingEmbeddings()
+    cache = embedding_cache.QueryEmbeddingCache(max_entries=10)
+
+    cache.get_or_embed(model="model", query="What is X?", embeddings=underlying)
+    cache.get_or_embed(model="model", query="What is  X? ", embeddings=underlying)
+    cache.get_or_embed(model="other", query="What is X?", embeddings=underlying)
+
+    assert underlying.embedded_texts == ["What is X?", "What is X?"]
+    assert cache.stats.hits == 1
+    assert cache.stats.misses == 2
+
+
+def test_query_embedding_cache_evicts_least_recently_used():
+    cache = embedding_cache.QueryEmbeddingCache(max_entries=2)
+    cache.put(model="model", query="a", vector=[1.0])
+    cache.put(model="model", query="b", vector=[2.0])
+    cache.get(model="model", query="a")
+    cache.put(model="model", query="c", vector=[3.0])
+
+    assert cache.get(model="model", query="b") is None
+    assert cache.get(model="model", query="a") == [1.0]
+    assert len(cache) == 2
+
+
+def test_query_embedding_cache_persists_on_disk(tmp_path: Path):
+    def create_cache() -> embedding_cache.QueryEmbeddingCache:
+        return embedding_cache.QueryEmbeddingCache(
+            max_entries=10,
+            disk_cache=embedding_cache.EmbeddingCache(
+                filepath=tmp_path / "queries.sqlite3", max_entries=10
+            ),
+        )
+
+    create_cache().put(model="model", query="a", vector=[1.0, 2.0])
+
+    assert create_cache().get(model="model", query="a") == [1.0, 2.0]
+
+
+class ThreadRecordingEmbeddingCache(embedding_cache.EmbeddingCache):
+    """Records the threads its sqlite reads and writes run in."""
+
+    def __init__(self, filepath: Path, max_entries: int):
+        super().__init__(filepath=filepath, max_entries=max_entries)
+        self.thread_ids: list[int] = []
+
+    def get_many(self, model: str, text_hashes: list[str]) -> dict[str, list[float]]:
+        self.thread_ids.append(threading.get_ident())
+        return super().get_many(model, text_hashes)
+
+    def put_many(self, model: str, vectors: dict[str, list[float]]) -> None:
+        self.thread_ids.append(threading.get_ident())
+        return super().put_many(model, vectors)
+
+
+def test_query_embedding_cache_uses_disk_off_the_event_loop(tmp_path: Path):
+    disk_cache = ThreadRecordingEmbeddingCache(
+        filepath=tmp_path / "queries.sqlite3", max_entries=10
+    )
+    cache = embedding_cache.QueryEmbeddingCache(max_entries=10, disk_cache=disk_cache)
+    underlying = CountingEmbeddings()
+
+    async def ask_twice() -> tuple[list[float], list[float]]:
+        first = await cache.aget_or_embed("model", "What is X?", underlying)
+        second = await cache.aget_or_embed("model", "What is X?", underlying)
+        return first, second
+
+    first, second = asyncio.run(ask_twice())
+
+    assert first == second
+    assert underlying.embedded_texts == ["What is X?"]
+    # One read and one write on the miss. The hit is served from memory
+    assert len(disk_cache.thread_ids) == 2
+    assert threading.get_ident() not in disk_cache.thread_ids
+    assert (cache.stats.hits, cache.stats.misses) == (1, 1)
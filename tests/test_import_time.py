@@ -0,0 +1,105 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+SRC_DIR = Path(__file__).parents[1] / "src"
+
+# Modules each command imports when it runs, on top of talensinki.tui itself
+COMMAND_IMPORTS = {
+    "--help": [],
+    "info": [],
+    "checkhealth": ["talensinki.checks", "talensinki.resources"],
+    "warmup": ["talensinki.warmup"],
+    "sync-database": ["talensinki.database", "talensinki.resources"],
+    "ask": ["talensinki.llm"],
+}
+
+# Seconds spent importing on top of typer, which every command imports first.
+# Generous on purpose: they catch a heavy import creeping in, they are not a benchmark
+IMPORT_TIME_BUDGETS = {
+    "--help": 0.5,
+    "info": 0.5,
+    "checkhealth": 4.0,
+    "warmup": 5.0,
+    "sync-database": 5.0,
+    "ask": 5.0,
+}
+
+# Printed to stderr between the typer import and the measured ones
+IMPORT_TIME_MARKER = "measured imports start here"
+
+HEAVY_PACKAGES = (
+    "chromadb",
+    "langchain",
+    "langchain_chroma",
+    "langchain_community",
+    "langchain_unstructured",
+    "langgraph",
+    "ollama",
+    "unstructured",
+)
+
+# Packages a command must not import at all
+FORBIDDEN_PACKAGES = {
+    "--help": HEAVY_PACKAGES,
+    "info": HEAVY_PACKAGES,
+    "checkhealth": ("langgraph", "langchain_unstructured", "unstructured"),
+    "sync-database": ("langgraph", "langchain_unstructured", "unstructured"),
+}
+
+
+def measure_imports(modules: list[str]) -> tuple[float, set[str]]:
+    """
+    Import `modules` in a fresh interpreter with `python -X importtime`, after typer.
+    Returns the time spent importing on top of typer in seconds, and the top-level packages that got imported.
+    Measuring relative to typer, in the same interpreter, keeps the budgets independent of how fast the machine is.
+    """
+    code = "; ".join(
+        [
+            "import sys",
+            "import typer",
+            f"print({IMPORT_TIME_MARKER!r}, file=sys.stderr)",
+            *(f"import {module}" for module in modules),
+        ]
+    )
+    env = os.environ | {
+        "PYTHONPATH": os.pathsep.join(
+            filter(None, [str(SRC_DIR), os.environ.get("PYTHONPATH")])
+        )
+    }
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        env=env,
+        check=True,
+    )
+
+    total_microseconds = 0
+    imported_packages = set()
+    _, measured_output = result.stderr.split(IMPORT_TIME_MARKER)
+    for line in measured_output.splitlines():
+        # Lines look like "import time:       self [us] |    cumulative | imported package"
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_microseconds, _, module = line.removeprefix("import time:").split("|")
+        total_microseconds += int(self_microseconds)
+        imported_packages.add(module.strip().split(".")[0])
+    return total_microseconds / 1e6, imported_packages
+
+
+@pytest.mark.parametrize("command", COMMAND_IMPORTS.keys())
+def test_command_import_time_is_within_budget(command: str):
+    modules = ["talensinki.tui", *COMMAND_IMPORTS[command]]
+    # The first run compiles the bytecode, which is not what is being measured
+    measure_imports(modules)
+    import_time, imported_packages = min(measure_imports(modules) for _ in range(3))
+
+    forbidden_imports = imported_packages & set(FORBIDDEN_PACKAGES.get(command, ()))
+    assert not forbidden_imports, f"{command} imports {sorted(forbidden_imports)}"
+    assert import_time <= IMPORT_TIME_BUDGETS[command], (
+        f"{command} spends {import_time:.2f} s importing modules on top of typer, the budget is {IMPORT_TIME_BUDGETS[command]} s"
+    )
@@ -0,0 +1,63 @@
+from pathlib import Path
+
+from talensinki.lexical_index import (
+    LexicalIndex,
+    build_match_expression,
+    reciprocal_rank_fusion,
+)
+
+
+def create_mock_lexical_index(tmp_path: Path) -> LexicalIndex:
+    lexical_index = LexicalIndex(filepath=tmp_path / "lexical_index.sqlite3")
+    lexical_index.upsert(
+        chunk_ids=["a", "b", "c"],
+        contents=[
+            "Replace the bolt with part A-113 before use.",
+            "Clause 4.2.1 describes the maintenance schedule.",
+            "Nothing here about bolts.",
+        ],
+    )
+    return lexical_index
+
+
+def test_build_match_expression_quotes_tokens():
+    assert build_match_expression('Torque of "A-113"? a-113') == ('"torque" OR "a-113"')
+    assert build_match_expression("?!") == ""
+
+
+def test_build_match_expression_drops_stopwords_and_short_words():
+    assert build_match_expression("What is the torque of bolt x in clause 4?") == (
+        '"torque" OR "bolt" OR "clause" OR "4"'
+    )
+    assert build_match_expression("What is it?") == ""
+
+
+def test_search_matches_identifiers_and_words(tmp_path: Path):
+    lexical_index = create_mock_lexical_index(tmp_path)
+
+    assert [chunk_id for chunk_id, _ in lexical_index.search("part A-113", k=5)] == [
+        "a"
+    ]
+    assert [chunk_id for chunk_id, _ in lexical_index.search("clause 4.2.1", k=5)] == [
+        "b"
+    ]
+    assert lexical_index.search("", k=5) == []
+
+
+def test_upsert_replaces_and_delete_removes_chunks(tmp_path: Path):
+    lexical_index = create_mock_lexical_index(tmp_path)
+
+    lexical_index.upsert(chunk_ids=["a"], contents=["A new text."])
+    assert len(lexical_index) == 3
+    assert lexical_index.search("A-113", k=5) == []
+    assert [chunk_id for chunk_id, _ in lexical_index.search("new", k=5)] == ["a"]
+
+    lexical_index.delete(chunk_ids=["b", "not-indexed"])
+    assert len(lexical_index) == 2
+    assert lexical_index.search("clause", k=5) == []
+
+
+def test_reciprocal_rank_fusion_favours_ids_ranked_by_both():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "d"]])
+
+    assert [item_id for item_id, _ in fused] == ["c", "a", "b", "d"]
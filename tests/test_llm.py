@@ -0,0 +1,226 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.messages import AIMessage
+from langchain_core.prompts import PromptTemplate
+
+from talensinki import config, llm, resources
+
+
+def create_mock_adaptive_params(**kwargs) -> SimpleNamespace:
+    defaults = dict(
+        adaptive_min_k=2,
+        adaptive_max_k=10,
+        adaptive_max_distance=1.0,
+        adaptive_min_gap=0.1,
+    )
+    return SimpleNamespace(**(defaults | kwargs))
+
+
+def test_choose_number_of_docs_keeps_docs_within_max_distance():
+    params = create_mock_adaptive_params()
+
+    assert llm.choose_number_of_docs([0.5, 0.55, 0.6, 0.65, 1.05, 1.1], params) == 4
+
+
+def test_choose_number_of_docs_cuts_at_first_large_gap():
+    params = create_mock_adaptive_params()
+
+    assert llm.choose_number_of_docs([0.3, 0.32, 0.35, 0.6, 0.62], params) == 3
+
+
+def test_choose_number_of_docs_keeps_at_least_min_k():
+    params = create_mock_adaptive_params()
+
+    # Nothing is close, and the gap after the first chunk is ignored
+    assert llm.choose_number_of_docs([1.2, 1.5, 1.6], params) == 2
+    assert llm.choose_number_of_docs([0.4], params) == 1
+    assert llm.choose_number_of_docs([], params) == 0
+
+
+def test_select_docs_by_distance_keeps_best_docs_in_order():
+    params = create_mock_adaptive_params()
+    docs_and_distances = [
+        (Document(id=str(i), page_content=f"chunk {i}"), distance)
+        for i, distance in enumerate([0.2, 0.25, 0.9, 1.4])
+    ]
+
+    docs = llm.select_docs_by_distance(docs_and_distances, params=params)
+
+    assert [doc.id for doc in docs] == ["0", "1"]
+
+
+def test_fuse_hybrid_candidates_lists_the_ids_to_fetch():
+    params = SimpleNamespace(mmr_enabled=False)
+    vector_docs = [Document(id=chunk_id, page_content="") for chunk_id in "abc"]
+
+    fused_ids, missing_ids = llm.fuse_hybrid_candidates(
+        vector_docs, lexical_ids=["d", "a", "e"], params=params
+    )
+
+    assert fused_ids == ["a", "d", "b", "c", "e"]
+    assert missing_ids == ["d", "e"]
+
+
+@pytest.mark.parametrize(
+    "mmr_enabled, compression_enabled, node_names",
+    [
+        (False, False, ["retrieve", "generate"]),
+        (True, True, ["retrieve", "rerank", "compress", "generate"]),
+    ],
+)
+def test_sync_and_async_graphs_have_the_same_nodes(
+    mmr_enabled: bool, compression_enabled: bool, node_names: list[str]
+):
+    params = SimpleNamespace(
+        mmr_enabled=mmr_enabled, compression_enabled=compression_enabled
+    )
+
+    assert llm.get_graph_node_names(params) == node_names
+    for graph in [llm.build_graph(params), llm.build_async_graph(params)]:
+        assert list(graph.nodes) == ["__start__", *node_names]
+
+
+class FakeChatModel:
+    """Answers with the question it is asked, and records how many calls are in flight at once."""
+
+    def __init__(self) -> None:
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def ainvoke(self, messages) -> AIMessage:
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        # Let the other questions start, so that they overlap with this one
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        question = messages.to_string().removeprefix("Question: ")
+        return AIMessage(content=f"answer to {question}")
+
+
+@pytest.fixture
+def fake_chat_model(monkeypatch: pytest.MonkeyPatch) -> FakeChatModel:
+    chat_model = FakeChatModel()
+
+    async def aretrieve(state, params):
+        return {"context": []}
+
+    async def aembed_question(question, params):
+        return [1.0]
+
+    monkeypatch.setattr(llm, "aembed_question", aembed_question)
+    monkeypatch.setattr(llm, "aretrieve", aretrieve)
+    monkeypatch.setattr(resources, "get_chat_model", lambda params: chat_model)
+    monkeypatch.setattr(resources, "get_async_graph", llm.build_async_graph)
+    return chat_model
+
+
+def create_mock_ask_params() -> SimpleNamespace:
+    return SimpleNamespace(
+        prompt=PromptTemplate.from_template("Question: {question}{context}"),
+        num_ctx=2048,
+        answer_token_reserve=512,
+        context_duplicate_threshold=0.95,
+        answer_cache_enabled=False,
+        mmr_enabled=False,
+        compression_enabled=False,
+    )
+
+
+def test_aask_questions_keeps_order_and_bounds_questions_in_flight(
+    fake_chat_model: FakeChatModel,
+):
+    questions = [f"question {i}" for i in range(10)]
+
+    answers = asyncio.run(
+        llm.aask_questions(questions, params=create_mock_ask_params(), concurrency=3)
+    )
+
+    assert answers == [f"answer to question {i}" for i in range(10)]
+    assert fake_chat_model.max_in_flight == 3
+
+
+def test_aask_questions_rejects_concurrency_below_one():
+    with pytest.raises(ValueError, match="concurrency must be at least 1"):
+        asyncio.run(
+            llm.aask_questions(
+                ["question"], params=create_mock_ask_params(), concurrency=0
+            )
+        )
+
+
+def test_aask_question_embeds_the_question_once(
+    fake_chat_model: FakeChatModel, monkeypatch: pytest.MonkeyPatch
+):
+    embedded_questions = []
+
+    async def aembed_question(question, params):
+        embedded_questions.append(question)
+        return [1.0]
+
+    answer_cache = SimpleNamespace(
+        lookup=lambda **kwargs: None, store=lambda **kwargs: None
+    )
+    monkeypatch.setattr(llm, "aembed_question", aembed_question)
+    monkeypatch.setattr(resources, "get_answer_cache", lambda params: answer_cache)
+    monkeypatch.setattr(llm, "get_answer_cache_scope", lambda params: "scope")
+    params = create_mock_ask_params()
+    params.answer_cache_enabled = True
+    params.answer_cache_similarity_threshold = 0.95
+
+    answer = asyncio.run(llm.aask_question("question", params=params))
+
+    assert answer == "answer to question"
+    assert embedded_questions == ["question"]
+
+
+def create_params(monkeypatch: pytest.MonkeyPatch, **kwargs) -> config.Params:
+    monkeypatch.setattr(
+        config,
+        "get_available_llm_models",
+        lambda force_refresh=False: ["llama3:latest"],
+    )
+    monkeypatch.setattr(
+        config,
+        "get_available_embedding_models",
+        lambda force_refresh=False: ["nomic-embed-text:latest"],
+    )
+    return config.Params(**kwargs)
+
+
+def test_answer_cache_scope_only_depends_on_params_that_change_the_answer(
+    monkeypatch: pytest.MonkeyPatch,
+):
+    registry = SimpleNamespace(get_corpus_version=lambda: "corpus version")
+    monkeypatch.setattr(resources, "get_document_registry", lambda: registry)
+    scope = llm.get_answer_cache_scope(create_params(monkeypatch))
+
+    assert scope == llm.get_answer_cache_scope(
+        create_params(
+            monkeypatch,
+            pdf_chunking_workers=4,
+            embedding_batch_size=8,
+            query_embedding_cache_size=1,
+            answer_cache_enabled=True,
+        )
+    )
+    assert scope != llm.get_answer_cache_scope(
+        create_params(monkeypatch, mmr_enabled=True)
+    )
+
+
+def test_empty_answers_are_not_cached(monkeypatch: pytest.MonkeyPatch):
+    stored_answers = []
+    answer_cache = SimpleNamespace(store=lambda **kwargs: stored_answers.append(kwargs))
+    monkeypatch.setattr(resources, "get_answer_cache", lambda params: answer_cache)
+    monkeypatch.setattr(llm, "get_answer_cache_scope", lambda params: "scope")
+    params = SimpleNamespace(answer_cache_enabled=True)
+
+    for answer in ["", "a"]:
+        llm.store_answer_in_cache(
+            question="q", question_embedding=[1.0], answer=answer, params=params
+        )
+
+    assert [stored["answer"] for stored in stored_answers] == ["a"]
@@ -0,0 +1,127 @@
+import os
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import cast
+
+import pytest
+from langchain_core.documents import Document
+
+from talensinki import config, pdf_chunking
+from talensinki.console import console
+
+
+def chunk_pdf_by_name(pdf_path: Path) -> list[Document]:
+    # Module level, so that it can be pickled to the worker processes
+    if pdf_path.stem.startswith("broken"):
+        raise ValueError("not a pdf")
+    if pdf_path.stem.startswith("slow"):
+        time.sleep(3)
+    if pdf_path.stem.startswith("crash"):
+        # Like a worker killed for running out of memory
+        os._exit(1)
+    console.print(f"chunked {pdf_path.name}")
+    return [Document(page_content=f"{pdf_path.stem} {i}") for i in range(2)]
+
+
+def chunk_pdfs(
+    pdf_paths: list[Path], workers: int, failed_pdf_hashes: set[str] | None = None
+) -> list[list[Document]]:
+    params = cast(
+        config.Params,
+        SimpleNamespace(pdf_chunking_method="by_name", pdf_chunking_workers=workers),
+    )
+    return pdf_chunking.chunk_pdfs_with_metadata(
+        pdf_paths=pdf_paths,
+        params=params,
+        pdf_hashes={pdf_path: f"hash-{pdf_path.stem}" for pdf_path in pdf_paths},
+        failed_pdf_hashes=failed_pdf_hashes,
+    )
+
+
+@pytest.fixture(autouse=True)
+def register_chunker(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setitem(
+        pdf_chunking.AVAILABLE_PDF_CHUNKERS, "by_name", chunk_pdf_by_name
+    )
+    return None
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_chunk_pdfs_keeps_order_and_tags_chunks(workers: int) -> None:
+    pdf_paths = [Path(f"{i}.pdf") for i in range(8)]
+
+    chunks_per_pdf = chunk_pdfs(pdf_paths, workers=workers)
+
+    assert [[doc.page_content for doc in chunks] for chunks in chunks_per_pdf] == [
+        [f"{i} 0", f"{i} 1"] for i in range(8)
+    ]
+    assert chunks_per_pdf[5][1].metadata == {
+        "source_pdf_hash": "hash-5",
+        "pdf_chunking_method": "by_name",
+        "chunk_index": 1,
+    }
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_chunk_pdfs_reports_failing_pdf_without_dropping_it(
+    workers: int, capsys: pytest.CaptureFixture[str]
+) -> None:
+    pdf_paths = [Path("a.pdf"), Path("broken.pdf"), Path("c.pdf")]
+    failed_pdf_hashes: set[str] = set()
+
+    chunks_per_pdf = chunk_pdfs(
+        pdf_paths, workers=workers, failed_pdf_hashes=failed_pdf_hashes
+    )
+
+    # The failing pdf keeps its place in the stream, without chunks, and is told apart from an empty pdf
+    assert [len(chunks) for chunks in chunks_per_pdf] == [2, 0, 2]
+    assert failed_pdf_hashes == {"hash-broken"}
+    output = capsys.readouterr().out
+    assert "Could not chunk the PDF broken.pdf" in output
+    assert "not a pdf" in output
+    # What the workers print reaches the parent's output, in pdf order
+    assert output.index("chunked a.pdf") < output.index("chunked c.pdf")
+
+
+def test_chunk_pdfs_recovers_from_a_dead_worker(capsys: pytest.CaptureFixture[str]):
+    pdf_paths = [
+        Path("0.pdf"),
+        Path("crash.pdf"),
+        *(Path(f"{i}.pdf") for i in range(2, 10)),
+    ]
+    failed_pdf_hashes: set[str] = set()
+
+    chunks_per_pdf = chunk_pdfs(
+        pdf_paths, workers=2, failed_pdf_hashes=failed_pdf_hashes
+    )
+
+    assert len(chunks_per_pdf) == len(pdf_paths)
+    assert chunks_per_pdf[1] == []
+    assert "hash-crash" in failed_pdf_hashes
+    # The pdfs in flight with the dead worker fail too, and are retried by the next sync
+    for pdf_path, chunks in zip(pdf_paths, chunks_per_pdf):
+        assert (len(chunks) == 0) == (f"hash-{pdf_path.stem}" in failed_pdf_hashes)
+    # A new pool takes the pdfs submitted after the crash
+    assert len(chunks_per_pdf[-1]) == 2
+    assert "Could not chunk the PDF crash.pdf" in capsys.readouterr().out
+
+
+def test_chunk_pdfs_does_not_wait_for_queued_pdfs_when_consumer_stops():
+    pdf_paths = [Path("0.pdf"), *(Path(f"slow-{i}.pdf") for i in range(1, 10))]
+    params = cast(
+        config.Params,
+        SimpleNamespace(pdf_chunking_method="by_name", pdf_chunking_workers=2),
+    )
+    chunks_per_pdf = pdf_chunking.iter_chunk_pdfs_with_metadata(
+        pdf_paths=pdf_paths,
+        params=params,
+        pdf_hashes={pdf_path: f"hash-{pdf_path.stem}" for pdf_path in pdf_paths},
+    )
+    assert len(next(chunks_per_pdf)) == 2
+
+    start_time = time.perf_counter()
+    chunks_per_pdf.close()
+
+    # Waiting for the queued pdfs would take 3 s per pdf
+    assert time.perf_counter() - start_time < 1
@@ -0,0 +1,92 @@
+import time
+
+import pytest
+from langchain_core.documents import Document
+
+from talensinki import pipeline
+
+
+def test_prefetch_in_background_keeps_order():
+    assert list(pipeline.prefetch_in_background(range(10), max_buffered=2)) == list(
+        range(10)
+    )
+
+
+def test_prefetch_in_background_bounds_items_ahead_of_consumer():
+    produced = []
+
+    def produce():
+        for i in range(10):
+            produced.append(i)
+            yield i
+
+    stream = pipeline.prefetch_in_background(produce(), max_buffered=2)
+    assert next(stream) == 0
+    time.sleep(0.3)
+    # one item handed over, two buffered, and one blocked waiting for room
+    assert len(produced) <= 4
+    assert list(stream) == list(range(1, 10))
+
+
+def test_prefetch_in_background_reraises_producer_errors():
+    def produce():
+        yield 1
+        raise RuntimeError("chunking failed")
+
+    stream = pipeline.prefetch_in_background(produce(), max_buffered=2)
+    assert next(stream) == 1
+    with pytest.raises(RuntimeError, match="chunking failed"):
+        next(stream)
+
+
+def test_prefetch_in_background_closes_items_when_consumer_stops():
+    closed = []
+
+    def produce():
+        try:
+            for i in range(100):
+                yield i
+        finally:
+            closed.append(True)
+
+    stream = pipeline.prefetch_in_background(produce(), max_buffered=2)
+    assert next(stream) == 0
+    stream.close()
+
+    deadline = time.perf_counter() + 2
+    while not closed and time.perf_counter() < deadline:
+        time.sleep(0.01)
+    assert closed == [True]
+
+
+def create_mock_chunks(texts: list[str]) -> list[Document]:
+    return [Document(page_content=text) for text in texts]
+
+
+def test_batch_documents_crosses_pdf_boundaries():
+    documents_per_pdf = [
+        create_mock_chunks(["a", "b", "c"]),
+        create_mock_chunks(["d"]),
+        create_mock_chunks(["e", "f"]),
+    ]
+
+    batches = list(pipeline.batch_documents(documents_per_pdf, max_documents=4))
+
+    assert [[doc.page_content for doc in batch] for batch in batches] == [
+        ["a", "b", "c", "d"],
+        ["e", "f"],
+    ]
+
+
+def test_batch_documents_respects_max_characters():
+    documents_per_pdf = [create_mock_chunks(["aaa", "bb", "c", "dddddd"])]
+
+    batches = list(
+        pipeline.batch_documents(documents_per_pdf, max_documents=10, max_characters=5)
+    )
+
+    assert [[doc.page_content for doc in batch] for batch in batches] == [
+        ["aaa", "bb"],
+        ["c"],
+        ["dddddd"],
+    ]
@@ -0,0 +1,59 @@
+from pathlib import Path
+
+from talensinki.registry import DocumentRecord, DocumentRegistry
+
+
+def create_mock_document_record(pdf_hash: str, number_of_chunks: int) -> DocumentRecord:
+    return DocumentRecord(
+        pdf_hash=pdf_hash,
+        pdf_path=f"data/pdfs/{pdf_hash}.pdf",
+        chunk_ids=[f"{pdf_hash}-by_pages-{i}" for i in range(number_of_chunks)],
+        pdf_chunking_method="by_pages",
+        embedding_model="nomic-embed-text:latest",
+    )
+
+
+def test_record_and_get_document(tmp_path: Path):
+    registry = DocumentRegistry(filepath=tmp_path / "registry.sqlite3")
+    document = create_mock_document_record(pdf_hash="123", number_of_chunks=3)
+
+    registry.record(document)
+
+    assert registry.get("123") == document
+    assert registry.get("456") is None
+    assert registry.get_pdf_hashes() == ("123",)
+
+
+def test_record_replaces_previous_record(tmp_path: Path):
+    registry = DocumentRegistry(filepath=tmp_path / "registry.sqlite3")
+    registry.record(create_mock_document_record(pdf_hash="123", number_of_chunks=3))
+    registry.record(create_mock_document_record(pdf_hash="123", number_of_chunks=1))
+
+    assert len(registry) == 1
+    assert registry.get_chunk_ids(pdf_hashes=("123",)) == ["123-by_pages-0"]
+
+
+def test_remove_documents(tmp_path: Path):
+    registry = DocumentRegistry(filepath=tmp_path / "registry.sqlite3")
+    registry.record(create_mock_document_record(pdf_hash="123", number_of_chunks=2))
+    registry.record(create_mock_document_record(pdf_hash="456", number_of_chunks=2))
+    registry.record(create_mock_document_record(pdf_hash="789", number_of_chunks=2))
+
+    registry.remove(pdf_hashes=("123",))
+    registry.remove_documents_with_chunk_ids(chunk_ids=["456-by_pages-1"])
+
+    assert registry.get_pdf_hashes() == ("789",)
+    assert registry.get_chunk_ids(pdf_hashes=("123", "456", "789")) == [
+        "789-by_pages-0",
+        "789-by_pages-1",
+    ]
+
+
+def test_registry_persists_on_disk(tmp_path: Path):
+    DocumentRegistry(filepath=tmp_path / "registry.sqlite3").record(
+        create_mock_document_record(pdf_hash="123", number_of_chunks=2)
+    )
+
+    assert DocumentRegistry(
+        filepath=tmp_path / "registry.sqlite3"
+    ).get_pdf_hashes() == ("123",)
@@ -0,0 +1,41 @@
+import numpy as np
+
+from talensinki.rerank import maximal_marginal_relevance
+
+
+def test_mmr_with_lambda_one_ranks_by_relevance():
+    query = np.array([1.0, 0.0])
+    candidates = np.array([[0.0, 1.0], [1.0, 0.1], [1.0, 0.5]])
+
+    assert maximal_marginal_relevance(query, candidates, k=3, lambda_mult=1.0) == [
+        1,
+        2,
+        0,
+    ]
+
+
+def test_mmr_skips_near_duplicates_of_selected_candidates():
+    query = np.array([1.0, 0.3])
+    candidates = np.array(
+        [
+            [1.0, 0.22],
+            # Almost the same as the first candidate, e.g. the next page saying the same thing
+            [1.0, 0.2],
+            [0.6, 0.8],
+        ]
+    )
+
+    assert maximal_marginal_relevance(query, candidates, k=2, lambda_mult=0.5) == [
+        0,
+        2,
+    ]
+
+
+def test_mmr_returns_at_most_the_number_of_candidates():
+    query = np.array([1.0, 0.0])
+    candidates = np.array([[1.0, 0.0], [0.0, 1.0]])
+
+    assert len(maximal_marginal_relevance(query, candidates, k=5, lambda_mult=0.5)) == 2
+    assert (
+        maximal_marginal_relevance(query, np.empty((0, 2)), k=5, lambda_mult=0.5) == []
+    )
@@ -0,0 +1,19 @@
+import numpy as np
+import pytest
+
+from talensinki.similarity import cosine_similarities, normalise_rows
+
+
+def test_normalise_rows_keeps_zero_rows():
+    normalised = normalise_rows(np.array([[3.0, 4.0], [0.0, 0.0]]))
+
+    assert normalised.tolist() == [[0.6, 0.8], [0.0, 0.0]]
+
+
+def test_cosine_similarities_ignore_vector_lengths():
+    matrix = np.array([[2.0, 0.0], [1.0, 1.0], [0.0, -5.0], [0.0, 0.0]])
+
+    similarities = cosine_similarities(matrix, np.array([3.0, 0.0]))
+
+    assert similarities == pytest.approx([1.0, 2**-0.5, 0.0, 0.0])
+    assert cosine_similarities(matrix, np.zeros(2)).tolist() == [0.0] * 4
@@ -0,0 +1,45 @@
+from pathlib import Path
+
+from talensinki import storage
+
+
+def test_split_into_groups():
+    values = [str(i) for i in range(5)]
+
+    assert list(storage.split_into_groups(values, group_size=2)) == [
+        ["0", "1"],
+        ["2", "3"],
+        ["4"],
+    ]
+    assert list(storage.split_into_groups([], group_size=2)) == []
+
+
+def test_write_text_atomically_replaces_the_file(tmp_path: Path):
+    filepath = tmp_path / "folder" / "manifest.json"
+
+    storage.write_text_atomically(filepath, "first")
+    storage.write_text_atomically(filepath, "second")
+
+    assert filepath.read_text() == "second"
+    assert list(filepath.parent.iterdir()) == [filepath]
+
+
+def test_execute_in_groups_binds_more_values_than_one_query_allows(tmp_path: Path):
+    store = storage.SqliteStore(filepath=tmp_path / "store.sqlite3")
+    number_of_values = 2 * storage.MAX_VALUES_PER_QUERY + 1
+    values = [str(i) for i in range(number_of_values)]
+    with store._connection:
+        store._connection.execute("CREATE TABLE items (name TEXT, value TEXT)")
+        store._connection.executemany(
+            "INSERT INTO items (name, value) VALUES (?, ?)",
+            [("a", value) for value in values],
+        )
+
+    rows = store._execute_in_groups(
+        "SELECT value FROM items WHERE name = ? AND value IN ({placeholders})",
+        values,
+        parameters=("a",),
+    )
+
+    assert sorted(value for (value,) in rows) == sorted(values)
+    assert store._count_rows("items") == number_of_values
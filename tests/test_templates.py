@@ -80,3 +80,47 @@ def test_get_templates_from_file(tmp_path: Path):
     assert not checks._check_prompt_template_has_expected_variables(
         template_filepath=sys_temp, input_variables=["question", "context", "pyramid"]
     )
+
+
+def test_template_is_parsed_again_only_when_its_file_changes(
+    tmp_path: Path, monkeypatch
+):
+    template_filepath = tmp_path / "sys_temp.txt"
+    template_filepath.write_text(data=get_system_template_text())
+
+    parsed_filepaths = []
+    parse_prompt_template_file = templates.parse_prompt_template_file
+
+    def spy_parse_prompt_template_file(filepath: Path):
+        parsed_filepaths.append(filepath)
+        return parse_prompt_template_file(filepath)
+
+    monkeypatch.setattr(
+        templates, "parse_prompt_template_file", spy_parse_prompt_template_file
+    )
+
+    first = templates.get_prompt_template_from_file(template_filepath)
+    second = templates.get_prompt_template_from_file(template_filepath)
+    assert first is second
+    assert len(parsed_filepaths) == 1
+
+    # A different length changes the size, even if the mtime does not change on coarse filesystems
+    template_filepath.write_text(data=get_refine_template_text())
+    third = templates.get_prompt_template_from_file(template_filepath)
+    assert third.prompt == get_refine_prompt()
+    assert len(parsed_filepaths) == 2
+
+
+def test_templates_version_changes_when_a_template_changes(tmp_path: Path, monkeypatch):
+    template_type = templates.TemplateType(
+        name="system", input_variables=["context", "question"]
+    )
+    template_type.dir = tmp_path
+    monkeypatch.setattr(templates, "get_template_types", lambda: [template_type])
+    (tmp_path / "sys_temp.txt").write_text(data=get_system_template_text())
+
+    version = templates.get_templates_version()
+    assert templates.get_templates_version() == version
+
+    (tmp_path / "ref_temp.txt").write_text(data=get_refine_template_text())
+    assert templates.get_templates_version() != version